@@ -55,7 +55,7 @@ def reload_filters():
             else:
                 logger.warning(f"⚠️ Правило '{rule}' НЕ НАЙДЕНО в {filename_excludes_path}")
     
-    logger.info(f"\n👉 Перезагрузите программу, чтобы фильтры вступили в силу!")
+    logger.info(f"\n👉 Запущенный парсер подхватит изменения сам в течение нескольких секунд (перезапуск не нужен)")
     logger.info(f"👉 Выполните 'python test_email_run.py' для проверки работы фильтров")
 
 if __name__ == "__main__":
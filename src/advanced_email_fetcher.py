@@ -10,6 +10,7 @@ import os
 import re
 import ssl
 import imaplib
+import socket
 import email
 import email.message
 import email.utils
@@ -17,21 +18,50 @@ import json
 import time
 import hashlib
 import logging
-import fnmatch
-import io
+import sys
+import copy
+import queue
 import argparse
+import select
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from PIL import Image
 
+# Вспомогательные модули лежат рядом (как в google_sheets_bridge.py)
+sys.path.append(str(Path(__file__).parent))
+
+from imap_protocol import (
+    BodyPart, ImapParseError, parse_bodystructure, parse_fetch_response, parse_list,
+    find_item, format_imap_value, parse_vanished, encode_mailbox_name
+)
+from message_index import MessageIndex
+from conversation_index import ConversationIndex, parse_message_ids
+from email_store import EmailStore
+from email_manifest import EmailManifest
+from mailbox_sources import MailboxSource, load_mailbox_sources, DEFAULT_CONFIG_PATH as MAILBOXES_CONFIG
+from retry_queue import RetryQueue, MAX_ATTEMPTS as MAX_RETRY_ATTEMPTS
+from attachment_store import AttachmentStore
+from image_fingerprints import JunkImageIndex, sniff_image, image_dhash
+from mime_walker import walk_message
+from offline_ingest import ingest_offline
+from imap_metrics import ImapMetrics, fetch_label, METRICS_TEXTFILE
+from filter_engine import AhoCorasick, AddressMatcher, FilenameMatcher, build_search_exclusions
+from async_imap import AsyncImapSession, SessionBridge, ASYNC_PIPELINE_DEPTH, ASYNC_STARTTLS
+
 # Загружаем переменные окружения
 load_dotenv()
 
 # Настройки подключения
 IMAP_SERVER = os.getenv('IMAP_SERVER')
 IMAP_PORT = int(os.getenv('IMAP_PORT', 143))
+IMAP_STARTTLS = os.getenv('IMAP_STARTTLS', '1') != '0'  # 0 - без STARTTLS (локальный тестовый сервер)
 IMAP_USER = os.getenv('IMAP_USER')
 IMAP_PASSWORD = os.getenv('IMAP_PASSWORD')
 COMPANY_DOMAIN = os.getenv('COMPANY_DOMAIN', 'dna-technology.ru')
@@ -43,6 +73,45 @@ RETRY_DELAY = 5
 BATCH_SIZE = 50
 REQUEST_DELAY = 0.5
 
+# 🆕 Пакетная загрузка метаданных: писем в одном FETCH и нужные поля заголовков
+METADATA_BATCH_SIZE = 200
+METADATA_HEADER_FIELDS = ('FROM', 'TO', 'CC', 'SUBJECT', 'DATE', 'MESSAGE-ID', 'IN-REPLY-TO', 'REFERENCES')
+
+# 🆕 Пул IMAP-сессий: число параллельных соединений (сервер обычно терпит 3-5 на пользователя)
+IMAP_POOL_SIZE = int(os.getenv('IMAP_POOL_SIZE', 3))
+WORKER_CHUNK_SIZE = 10       # Писем в одной задаче воркера
+SESSION_MAX_AGE = 600        # Секунд до профилактического переподключения сессии
+SOCKET_TIMEOUT = 60          # Таймаут сокета по умолчанию для всех команд сессии
+FETCH_TIMEOUT = 30           # Дедлайн загрузки письма на первой попытке, секунд
+FETCH_TIMEOUT_STEP = 15      # Прибавка дедлайна на каждой следующей попытке
+FALLBACK_TIMEOUT = 30        # Дедлайн каждого шага try_fallback_fetch
+
+# 🆕 Выборочная загрузка частей: порог большого компонента письма (закодированный размер)
+LARGE_PART_SIZE = 20_000_000
+
+# 🆕 Две полосы загрузки: письма крупнее порога (RFC822.SIZE) идут в отдельную ограниченную полосу
+LARGE_EMAIL_SIZE = 20_000_000
+LARGE_LANE_WORKERS = int(os.getenv('IMAP_LARGE_LANE_WORKERS', 1))  # Сессий пула под большие письма одновременно
+LARGE_FETCH_TIMEOUT = 180    # Дедлайн загрузки большого письма на первой попытке, секунд
+
+# 🆕 Как часто проверять изменения файлов фильтров в config/ (секунд)
+FILTER_RELOAD_INTERVAL = 5
+
+# 🆕 Фильтрация на сервере: правила черного списка и тем переводятся в критерии SEARCH
+SERVER_SIDE_FILTERS = os.getenv('IMAP_SERVER_FILTERS', '1') == '1'
+SERVER_FILTER_MAX_LENGTH = 4000  # Символов критериев в одной команде SEARCH
+
+# 🆕 CONDSTORE/QRESYNC (RFC 7162): повторные прогоны периода запрашивают только измененные письма
+CONDSTORE_ENABLED = os.getenv('IMAP_CONDSTORE', '1') == '1'
+
+# 🆕 Режим демона: IDLE (RFC 2177 - переотправка не реже раза в 29 минут) или опрос NOOP
+IDLE_REFRESH_INTERVAL = 29 * 60
+DAEMON_POLL_INTERVAL = int(os.getenv('IMAP_POLL_INTERVAL', 60))  # Секунд между NOOP без IDLE
+DAEMON_STOP_CHECK = 1.0      # Как часто во время IDLE проверять запрос остановки
+DAEMON_BACKOFF_BASE = 5      # Первая пауза перед переподключением после сбоя
+DAEMON_BACKOFF_MAX = 300     # Потолок экспоненциальной паузы
+DAEMON_MAINTENANCE_INTERVAL = int(os.getenv('IMAP_MAINTENANCE_INTERVAL', 300))  # Секунд между повтором очереди и записью статистики
+
 # 🆕 ПОДДЕРЖИВАЕМЫЕ типы вложений (только разрешенные)
 SUPPORTED_ATTACHMENTS = {
     # Документы
@@ -127,7 +196,13 @@ def setup_logging(logs_dir: Path, start_date: datetime, end_date: datetime):
     return logger
 
 class EmailFilters:
-    """🚫 Класс для управления фильтрами исключений"""
+    """🚫 Класс для управления фильтрами исключений
+
+    Правила компилируются при загрузке (filter_engine) и перечитываются сами,
+    когда меняются файлы в config/ - перезапуск программы не нужен.
+    """
+
+    FILTER_FILES = ('filters.txt', 'blacklist.txt', 'attachment_filename_excludes.txt')
 
     def __init__(self, config_dir: Path, logger):
         self.config_dir = config_dir
@@ -135,102 +210,122 @@ class EmailFilters:
         self.subject_filters: Set[str] = set()
         self.blacklist: Set[str] = set()
         self.filename_excludes: List[str] = []
+        self._reload_lock = threading.Lock()
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._last_reload_check = 0.0
         self.load_filters()
 
+    def _file_mtimes(self) -> Dict[str, Optional[float]]:
+        mtimes = {}
+        for name in self.FILTER_FILES:
+            try:
+                mtimes[name] = (self.config_dir / name).stat().st_mtime
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+    def _read_rules(self, filename: str) -> List[str]:
+        """📄 Строки правил без пустых и комментариев"""
+        rules = []
+        with open(self.config_dir / filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    rules.append(line)
+        return rules
+
     def load_filters(self):
-        """📋 Загрузка фильтров из файлов"""
+        """📋 Загрузка фильтров из файлов и компиляция правил"""
+        mtimes = self._file_mtimes()
+        subject_filters: Set[str] = set()
+        blacklist: Set[str] = set()
+        filename_excludes: List[str] = []
+
         # Загружаем фильтры тем
-        filters_file = self.config_dir / 'filters.txt'
-        if filters_file.exists():
+        if mtimes['filters.txt'] is not None:
             try:
-                with open(filters_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            self.subject_filters.add(line.lower())
-                self.logger.info(f"✅ Загружено {len(self.subject_filters)} фильтров тем")
+                subject_filters = {line.lower() for line in self._read_rules('filters.txt')}
+                self.logger.info(f"✅ Загружено {len(subject_filters)} фильтров тем")
             except Exception as e:
                 self.logger.error(f"❌ Ошибка загрузки фильтров: {e}")
 
         # Загружаем черный список
-        blacklist_file = self.config_dir / 'blacklist.txt'
-        if blacklist_file.exists():
+        if mtimes['blacklist.txt'] is not None:
             try:
-                with open(blacklist_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            self.blacklist.add(line.lower())
-                self.logger.info(f"✅ Загружено {len(self.blacklist)} адресов в черном списке")
-                self.logger.info(f"   Примеры: {list(self.blacklist)[:3]}")
+                blacklist = {line.lower() for line in self._read_rules('blacklist.txt')}
+                self.logger.info(f"✅ Загружено {len(blacklist)} адресов в черном списке")
+                self.logger.info(f"   Примеры: {list(blacklist)[:3]}")
             except Exception as e:
                 self.logger.error(f"❌ Ошибка загрузки черного списка: {e}")
 
         # Загружаем исключения по именам файлов
-        filename_excludes_file = self.config_dir / 'attachment_filename_excludes.txt'
-        if filename_excludes_file.exists():
+        if mtimes['attachment_filename_excludes.txt'] is not None:
             try:
-                with open(filename_excludes_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            if line == '****':
-                                self.logger.warning(f"⚠️ Пропускаем проблемный паттерн: {line}")
-                                continue
-                            self.filename_excludes.append(line)
-                self.logger.info(f"✅ Загружено {len(self.filename_excludes)} исключений по именам файлов")
+                for line in self._read_rules('attachment_filename_excludes.txt'):
+                    if line == '****':
+                        self.logger.warning(f"⚠️ Пропускаем проблемный паттерн: {line}")
+                        continue
+                    filename_excludes.append(line)
+                self.logger.info(f"✅ Загружено {len(filename_excludes)} исключений по именам файлов")
             except Exception as e:
                 self.logger.error(f"❌ Ошибка загрузки исключений имён файлов: {e}")
 
+        # ⚡ Компилируем один раз; проверки писем работают только со скомпилированными правилами
+        subject_matcher = AhoCorasick(subject_filters)
+        address_matcher = AddressMatcher(blacklist)
+        filename_matcher = FilenameMatcher(filename_excludes)
+
+        # Подмена целиком: параллельные воркеры видят либо старый, либо новый набор правил
+        self.subject_filters, self.blacklist, self.filename_excludes = subject_filters, blacklist, filename_excludes
+        self._subject_matcher, self._address_matcher, self._filename_matcher = subject_matcher, address_matcher, filename_matcher
+        self.server_search_keys = build_search_exclusions(subject_filters, blacklist, SERVER_FILTER_MAX_LENGTH)
+        self._mtimes = mtimes
+
+    def reload_if_changed(self) -> bool:
+        """🔄 Перечитывание правил, если файлы в config/ изменились (не чаще FILTER_RELOAD_INTERVAL)"""
+        now = time.time()
+        if now - self._last_reload_check < FILTER_RELOAD_INTERVAL:
+            return False
+
+        with self._reload_lock:
+            if now - self._last_reload_check < FILTER_RELOAD_INTERVAL:
+                return False
+            self._last_reload_check = now
+            if self._file_mtimes() == self._mtimes:
+                return False
+            self.logger.info(f"🔄 Файлы фильтров изменились, перезагружаем правила...")
+            self.load_filters()
+            return True
+
+    def server_search_criteria(self) -> str:
+        """📡 Критерии SEARCH для исключения писем на сервере ('' - фильтровать нечего)"""
+        self.reload_if_changed()
+        return ' '.join(self.server_search_keys)
+
     def is_subject_filtered(self, subject: str) -> Optional[str]:
         """🚫 Проверка темы письма на исключение"""
         if not subject:
             return None
-        subject_lower = subject.lower()
-        for filter_word in self.subject_filters:
-            if filter_word in subject_lower:
-                return f"тема содержит '{filter_word}'"
+        self.reload_if_changed()
+        filter_word = self._subject_matcher.search(subject.lower())
+        if filter_word is not None:
+            return f"тема содержит '{filter_word}'"
         return None
 
     def is_sender_blacklisted(self, from_addr: str) -> Optional[str]:
         """🚫 ИСПРАВЛЕННАЯ проверка отправителя в черном списке"""
         if not from_addr:
             return None
-        
-        from_addr_lower = from_addr.lower().strip()
-        
-        # 🔧 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: добавляем отладочный лог
-        self.logger.debug(f"Проверяем адрес '{from_addr_lower}' против {len(self.blacklist)} правил")
-        
-        for blacklisted in self.blacklist:
-            blacklisted = blacklisted.strip().lower()
-            
-            if blacklisted.endswith('*'):
-                # Маски типа info@*, newsletter@*, marketing@*
-                prefix = blacklisted[:-1]  # убираем звездочку
-                if from_addr_lower.startswith(prefix):
-                    return f"адрес начинается с '{prefix}' (в черном списке)"
-                    
-            elif blacklisted.startswith('*@'):
-                # Маски типа *@domain.com
-                domain = blacklisted[2:]  # убираем *@
-                if from_addr_lower.endswith(f"@{domain}"):
-                    return f"домен в черном списке ({domain})"
-                    
-            else:
-                # Точные совпадения
-                if from_addr_lower == blacklisted:
-                    return f"адрес в черном списке"
-        
-        return None
+        self.reload_if_changed()
+        return self._address_matcher.match(from_addr.lower().strip())
 
     def is_filename_excluded(self, filename: str) -> Optional[str]:
         """🚫 ИСПРАВЛЕННАЯ проверка имени файла с диагностикой"""
-        if not filename or not self.filename_excludes:
+        if not filename:
+            return None
+        self.reload_if_changed()
+        if not self.filename_excludes:
             return None
-
-        # ✅ ДОБАВИТЬ: диагностика для отладки
-        self.logger.debug(f"🔍 Проверка файла '{filename}' против {len(self.filename_excludes)} паттернов")
 
         # 🔧 ИСПРАВЛЕНИЕ: проверка на одиночные символы и короткие имена
         if filename in ['_', '_', '__', '___', '____', '_____', '-', '--', '---', '----', '....', '----']:
@@ -241,22 +336,20 @@ class EmailFilters:
         base_filename = filename
         if base_filename.startswith("~") or base_filename.startswith("."):
             base_filename = base_filename[1:]
-        
-        # Оригинальный код с проверкой паттернов
-        for exclude_pattern in self.filename_excludes:
-            if '*' in exclude_pattern:
-                # Wildcard паттерн
-                if fnmatch.fnmatch(filename.lower(), exclude_pattern.lower()) or fnmatch.fnmatch(base_filename.lower(), exclude_pattern.lower()):
-                    self.logger.info(f"🚫 ФАЙЛ ИСКЛЮЧЕН ПО ПАТТЕРНУ: {filename} → {exclude_pattern}")
-                    return f"имя файла соответствует паттерну '{exclude_pattern}'"
-            else:
-                # Точное совпадение
-                if filename.lower() == exclude_pattern.lower():  # Игнорируем регистр для точного совпадения
-                    self.logger.info(f"🚫 ФАЙЛ ИСКЛЮЧЕН ПО ТОЧНОМУ ИМЕНИ: {filename}")
-                    return f"имя файла точно соответствует '{exclude_pattern}'"
 
-        # ✅ ДОБАВИТЬ: лог если фильтр не сработал
-        self.logger.debug(f"✅ Файл '{filename}' прошел все фильтры имен")
+        # Маски проверяются для имени и базового имени, точные совпадения - только для имени
+        filename_lower = filename.lower()
+        exclude_pattern = (self._filename_matcher.match_glob(filename_lower) or
+                           self._filename_matcher.match_glob(base_filename.lower()))
+        if exclude_pattern:
+            self.logger.info(f"🚫 ФАЙЛ ИСКЛЮЧЕН ПО ПАТТЕРНУ: {filename} → {exclude_pattern}")
+            return f"имя файла соответствует паттерну '{exclude_pattern}'"
+
+        exclude_pattern = self._filename_matcher.match_exact(filename_lower)
+        if exclude_pattern:
+            self.logger.info(f"🚫 ФАЙЛ ИСКЛЮЧЕН ПО ТОЧНОМУ ИМЕНИ: {filename}")
+            return f"имя файла точно соответствует '{exclude_pattern}'"
+
         return None
 
 
@@ -279,6 +372,148 @@ class EmailFilters:
 
         return None
 
+class ImapConnectionPool:
+    """🏊 Пул авторизованных IMAP-сессий для параллельной загрузки
+
+    Первая сессия - сам парсер, остальные - его копии (spawn_worker) со своими
+    счетчиками, которые при закрытии пула складываются в общую статистику.
+    """
+
+    def __init__(self, fetcher: 'AdvancedEmailFetcherV2', size: int):
+        self.fetcher = fetcher
+        self.size = max(1, size)
+        self.workers: List['AdvancedEmailFetcherV2'] = []
+        self._idle: queue.Queue = queue.Queue()
+
+    def open(self) -> bool:
+        """🔌 Подключение всех сессий пула"""
+        for i in range(self.size):
+            worker = self.fetcher if i == 0 else self.fetcher.spawn_worker()
+            # Уже открытая сессия парсера (например, после IDLE в режиме демона) используется как есть
+            if (worker is self.fetcher and worker.mail is not None) or worker.connect():
+                self.workers.append(worker)
+                self._idle.put(worker)
+            else:
+                self.fetcher.logger.warning(f"⚠️ Сессия {i + 1}/{self.size} не подключилась, работаем с меньшим пулом")
+        return bool(self.workers)
+
+    @contextmanager
+    def session(self):
+        """🔒 Эксклюзивная выдача свободной сессии"""
+        worker = self._idle.get()
+        try:
+            if time.time() - worker.last_connect_time > SESSION_MAX_AGE:
+                worker.logger.info(f"🔄 Профилактическое переподключение...")
+                worker.connect()
+            yield worker
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """🔐 Закрытие копий и перенос их статистики в основной парсер"""
+        for worker in self.workers:
+            if worker is not self.fetcher:
+                self.fetcher.merge_stats(worker.stats)
+                worker.close()
+        self.workers = []
+
+
+class AsyncImapPool(ImapConnectionPool):
+    """🏊 Пул для асинхронного движка: size соединений, size × глубина конвейера воркеров
+
+    Цикл событий работает в отдельном потоке. Воркеры - копии парсера с мостами
+    к общим сессиям (поровну на каждое соединение); сам парсер сессию не занимает.
+    """
+
+    def __init__(self, fetcher, size: int, pipeline_depth: int = ASYNC_PIPELINE_DEPTH):
+        super().__init__(fetcher, size)
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.sessions: List[AsyncImapSession] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._next_session = itertools.count()
+
+    def _run(self, coroutine, timeout: float = SOCKET_TIMEOUT):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def _open_session(self, index: int) -> Optional[AsyncImapSession]:
+        session = AsyncImapSession(f"async-{index + 1}", self.pipeline_depth)
+        try:
+            server, port, user, password, starttls = self.fetcher.account_settings()
+            await session.open(server, port, user, password, encode_mailbox_name(self.fetcher.mailbox),
+                               starttls=ASYNC_STARTTLS and starttls, timeout=SOCKET_TIMEOUT)
+            return session
+        except Exception as e:
+            self.fetcher.logger.error(f"❌ Асинхронная сессия {index + 1}/{self.size} не подключилась: {e}")
+            await session.close()
+            return None
+
+    async def _open_all(self) -> List[Optional[AsyncImapSession]]:
+        return await asyncio.gather(*(self._open_session(i) for i in range(self.size)))
+
+    def open(self) -> bool:
+        """🔌 Запуск цикла событий, подключение сессий и создание воркеров"""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='imap-async', daemon=True)
+        self._thread.start()
+
+        self.sessions = [s for s in self._run(self._open_all(), SOCKET_TIMEOUT * 2) if s is not None]
+        if not self.sessions:
+            self._stop_loop()
+            return False
+
+        self.fetcher.logger.info(f"⚡ Асинхронный движок: {len(self.sessions)} соединений, "
+                                 f"до {self.pipeline_depth} команд в полете на каждом")
+        for _ in range(len(self.sessions) * self.pipeline_depth):
+            worker = self.fetcher.spawn_worker()
+            worker.session_factory = self.bridge
+            worker.request_delay = 0
+            if worker.connect():
+                self.workers.append(worker)
+                self._idle.put(worker)
+        return bool(self.workers)
+
+    def bridge(self) -> Optional[SessionBridge]:
+        """🌉 Мост к очередной живой сессии (упавшая сессия переподключается)"""
+        with self._lock:
+            if not self.sessions:
+                return None
+            index = next(self._next_session) % len(self.sessions)
+            session = self.sessions[index]
+            if not session.alive:
+                self.fetcher.logger.info(f"🔄 Переподключение асинхронной сессии {session.name}...")
+                try:
+                    self._run(session.close())
+                    replacement = self._run(self._open_session(index))
+                except Exception as e:
+                    self.fetcher.logger.error(f"❌ Не удалось переподключить {session.name}: {e}")
+                    replacement = None
+                if replacement is None:
+                    return None
+                self.sessions[index] = session = replacement
+        return SessionBridge(session, self.loop, SOCKET_TIMEOUT)
+
+    def close(self):
+        """🔐 Сведение статистики воркеров, LOGOUT сессий и остановка цикла"""
+        super().close()
+        if self.loop is None:
+            return
+        for session in self.sessions:
+            try:
+                self._run(session.close())
+            except Exception:
+                pass
+        self.sessions = []
+        self._stop_loop()
+
+    def _stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop.close()
+        self.loop = None
+
+
 class AdvancedEmailFetcherV2:
     """🔥 Продвинутый парсер v2.12 - ИСПРАВЛЕНИЕ КРИТИЧЕСКИХ БАГОВ"""
 
@@ -300,15 +535,27 @@ class AdvancedEmailFetcherV2:
         # Инициализируем фильтры
         self.filters = EmailFilters(self.config_dir, self.logger)
 
-        # 🔧 ИСПРАВЛЕНИЕ: список специфических исключаемых файлов
-        self.specific_excluded_files = {
-            "WRD0004.jpg",   # Мусорный файл Microsoft
-            "~WRD0004.jpg",  # Мусорный файл Microsoft с префиксом
-            "_.jpg",         # Файл, состоящий из одного символа
-            "blocked.gif",   # Мусорный GIF файл
-            "image001.png",  # Мусорное изображение из подписи
-            "image002.png"   # Мусорное изображение из подписи
-        }
+        # 🗄️ Хранилище писем: JSON-файлы или сжатые сегменты по дням (EMAIL_STORE)
+        self.email_store = EmailStore(self.emails_dir, logger=self.logger)
+        # 📋 Манифест дней для ленивой выборки писем в ProcessedEmailLoader
+        self.email_manifest = EmailManifest(self.data_dir / 'email_manifest.db', self.logger)
+
+        # 🗂️ Индекс Message-ID для проверки дубликатов (при первом запуске собирается из data/emails/)
+        self.message_index = MessageIndex(self.data_dir / 'message_index.db', self.logger)
+        if self.message_index.is_new and self.has_saved_emails():
+            self.message_index.rebuild(self.emails_dir, self.email_store.iter_all())
+
+        # 🧵 Индекс переписок по Message-ID / In-Reply-To / References
+        self.conversation_index = ConversationIndex(self.data_dir / 'conversation_index.db', self.logger)
+        if self.conversation_index.is_new and self.has_saved_emails():
+            self.conversation_index.rebuild(self.emails_dir, self.email_store.iter_all())
+
+        # 📦 Хранилище вложений по SHA-256: один файл на уникальное содержимое
+        self.attachment_store = AttachmentStore(self.attachments_dir, self.logger)
+
+        # 🖼️ Отпечатки мусорных изображений: правила и выученные хэши в config/junk_images.json
+        self.junk_images = JunkImageIndex(self.config_dir / 'junk_images.json',
+                                          self.data_dir / 'image_sightings.db', self.logger)
 
         # Счетчики для статистики
         self.stats = {
@@ -318,13 +565,20 @@ class AdvancedEmailFetcherV2:
             'filtered_subject': 0,
             'filtered_blacklist': 0,
             'filtered_mass_mailing': 0,
+            'filtered_server_side': 0,
             'saved_attachments': 0,
             'saved_inline_images': 0,
             'excluded_attachments': 0,
             'excluded_filenames': 0,
             'excluded_by_size': 0,
             'excluded_by_image_dimensions': 0,
+            'excluded_by_fingerprint': 0,
             'unsupported_attachments': 0,
+            'deduplicated_attachments': 0,
+            'vanished': 0,
+            'selective_fetches': 0,
+            'skipped_parts': 0,
+            'skipped_part_bytes': 0,
             'skipped_large_emails': 0,
             'errors': 0,
             'retry_successful': 0,  # ✅ ДОБАВИТЬ
@@ -335,6 +589,107 @@ class AdvancedEmailFetcherV2:
         # ✅ ДОБАВИТЬ: Флаг управления детальным логированием
         self.enable_size_logging = False  # По умолчанию отключено для продакшена (False), для диагностики - True
 
+        # 🆕 Параллельная загрузка: размер пула и блокировка файлов очередей
+        self.pool_size = IMAP_POOL_SIZE
+        self._queue_lock = threading.RLock()
+
+        # 🆕 Движок загрузки: класс пула, источник сессий и пауза между запросами
+        self.pool_factory = ImapConnectionPool
+        self.session_factory = None
+        self.request_delay = REQUEST_DELAY
+
+        # 🆕 Полосы загрузки: воркер большой полосы получает длинные дедлайны; счетчики по полосам
+        self.large_lane = False
+        self.lane_stats: Dict[str, Dict[str, float]] = {
+            lane: {'messages': 0, 'saved': 0, 'bytes': 0, 'seconds': 0.0} for lane in ('fast', 'large')
+        }
+        self.chunk_errors = 0  # Письма, на которых упала обработка порции (MODSEQ периода тогда не сохраняется)
+
+        # 🆕 Инкрементальная синхронизация по UID: папка и режим адресации писем
+        self.mailbox = 'INBOX'
+        self.source: Optional[MailboxSource] = None  # None - учетная запись из IMAP_* переменных окружения
+        self.use_uid = False
+        self.sync_state_path = self.data_dir / 'sync_state.json'
+        self.uidvalidity_cache: Dict[str, int] = {}  # Общий для копий-воркеров пула
+        self.qresync_enabled = False                  # ENABLE QRESYNC принят в этой сессии
+
+        # ⏱️ Задержки IMAP-команд, байты, повторы и переподключения (общие для воркеров пула)
+        self.imap_metrics = ImapMetrics()
+
+        # 🔁 Очередь повторов (SQLite) вместо skipped_emails.json / dead_letter_emails.json
+        self.retry_queue = RetryQueue(self.data_dir / 'retry_queue.db', self.logger)
+        self.retry_queue.import_legacy(self.data_dir / 'skipped_emails.json',
+                                       self.data_dir / 'dead_letter_emails.json', self.mailbox)
+
+        # 🆕 Серверная фильтрация (выключается, если сервер не принял критерии)
+        self.server_filters_enabled = True
+
+        # 🆕 Режим демона: IDLE выключается, если сервер его не принял
+        self.idle_enabled = True
+
+    @property
+    def specific_excluded_files(self) -> frozenset:
+        """🚫 Имена мусорных файлов (WRD0004.jpg, image001.png, ...) из config/junk_images.json"""
+        self.junk_images.reload_if_changed()
+        return self.junk_images.filenames
+
+    def spawn_worker(self) -> 'AdvancedEmailFetcherV2':
+        """👷 Копия парсера для воркера пула: свое соединение и счетчики, общие фильтры и блокировки"""
+        worker = copy.copy(self)
+        worker.mail = None
+        worker.last_connect_time = 0
+        worker.qresync_enabled = False
+        worker.stats = dict.fromkeys(self.stats, 0)
+        return worker
+
+    def for_source(self, source: MailboxSource) -> 'AdvancedEmailFetcherV2':
+        """📬 Копия парсера для папки учетной записи: свои сессии и счетчики, общие хранилища и индексы
+
+        Полосы и метрики IMAP у папки свои (папки идут одновременно, а в
+        processing_stats папки - только ее цифры); fetch_from_sources складывает их в общие.
+        """
+        worker = self.spawn_worker()
+        worker.lane_stats = {lane: dict.fromkeys(lane_stats, 0) for lane, lane_stats in self.lane_stats.items()}
+        worker.imap_metrics = ImapMetrics()
+        worker.source = source
+        worker.mailbox = source.folder
+        worker.pool_size = source.max_connections
+        return worker
+
+    def account_settings(self) -> Tuple[Optional[str], int, Optional[str], Optional[str], bool]:
+        """🔐 Сервер, порт, логин, пароль и STARTTLS текущего источника"""
+        if self.source is None:
+            return IMAP_SERVER, IMAP_PORT, IMAP_USER, IMAP_PASSWORD, IMAP_STARTTLS
+        return self.source.server, self.source.port, self.source.user, self.source.password, self.source.starttls
+
+    def queue_mailbox(self) -> str:
+        """🔁 Папка в ключах очереди повторов (для источника из конфигурации - с учетной записью)"""
+        return self.mailbox if self.source is None else self.source.key
+
+    def merge_stats(self, stats: Dict[str, int]):
+        """➕ Сложение счетчиков воркера с общей статистикой"""
+        for key, value in stats.items():
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def merge_lane_stats(self, lane_stats: Dict[str, Dict[str, float]]):
+        """➕ Сложение счетчиков полос другого источника с общими"""
+        for lane, counters in lane_stats.items():
+            totals = self.lane_stats.setdefault(lane, dict.fromkeys(counters, 0))
+            for key, value in counters.items():
+                totals[key] = totals.get(key, 0) + value
+
+    def imap_fetch(self, msg_set, items: str):
+        """📡 FETCH по номерам или по UID в зависимости от режима"""
+        if self.use_uid:
+            return self.imap_metrics.call(fetch_label(items), self.mail.uid, 'FETCH', msg_set, items)
+        return self.imap_metrics.call(fetch_label(items), self.mail.fetch, msg_set, items)
+
+    def imap_search(self, criteria: str):
+        """🔍 SEARCH по номерам или по UID в зависимости от режима"""
+        if self.use_uid:
+            return self.imap_metrics.call('SEARCH', self.mail.uid, 'SEARCH', None, criteria)
+        return self.imap_metrics.call('SEARCH', self.mail.search, None, criteria)
+
     def safe_parse_size(self, size_str) -> int:
         """🛡️ Безопасное преобразование БЕЗ спама в логах"""
         try:
@@ -351,7 +706,7 @@ class AdvancedEmailFetcherV2:
     def check_email_size(self, msg_id: bytes) -> int:
         """📏 Проверка размера письма в байтах"""
         try:
-            status, data = self.mail.fetch(msg_id, '(RFC822.SIZE)')
+            status, data = self.imap_fetch(msg_id, '(RFC822.SIZE)')
             
             # ✅ УСЛОВНОЕ ЛОГИРОВАНИЕ
             if self.enable_size_logging:
@@ -386,189 +741,122 @@ class AdvancedEmailFetcherV2:
 
 
 
-    def save_skipped_email(self, msg_id: bytes, date_str: str, reason: str = "unknown"):
-        """💾 Сохранение пропущенного письма для повторной обработки"""
-        skipped_path = self.data_dir / 'skipped_emails.json'
-        
-        # Загружаем существующий список
-        skipped = {}
-        if skipped_path.exists():
-            try:
-                with open(skipped_path, 'r', encoding='utf-8') as f:
-                    skipped = json.load(f)
-            except Exception:
-                skipped = {}
-        
-        # Добавляем новое пропущенное письмо
+    def save_skipped_email(self, msg_id: bytes, date_str: str, reason: str = "unknown", uid: Optional[int] = None):
+        """💾 Сохранение пропущенного письма в очередь повторной обработки (ключ UIDVALIDITY + UID)"""
         key = msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id)
-        attempts = skipped.get(key, {}).get('attempts', 0)
-        
-        # Ограничиваем количество попыток
-        if attempts >= 3:
-            self.logger.warning(f"⚠️ Письмо {key} уже имеет {attempts} попыток, не добавляем в очередь")
+        if uid is None and self.use_uid and key.isdigit():
+            uid = int(key)
+        uidvalidity = self.current_uidvalidity() if uid is not None else None
+
+        try:
+            result = self.retry_queue.enqueue(self.queue_mailbox(), uidvalidity, uid, key, date_str, reason,
+                                              uid_mode=self.use_uid or uid is not None)
+        except Exception as e:
+            self.logger.error(f"❌ Не удалось записать письмо {key} в очередь повтора: {e}")
             return
-        
-        skipped[key] = {
-            'date': date_str,
-            'reason': reason,
-            'attempts': attempts + 1,
-            'last_attempt': self.get_local_time().isoformat()
-        }
-        
-        with open(skipped_path, 'w', encoding='utf-8') as f:
-            json.dump(skipped, f, ensure_ascii=False, indent=2)
-        
-        self.logger.info(f"💾 Письмо {key} сохранено для повторной обработки (попытка {attempts + 1}/3, причина: {reason})")
 
-    def load_skipped_emails(self) -> Dict[str, dict]:
-        """📋 Загрузка списка пропущенных писем"""
-        skipped_path = self.data_dir / 'skipped_emails.json'
-        if skipped_path.exists():
-            try:
-                with open(skipped_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
+        if result['state'] == 'dead':
+            self.logger.warning(f"📁 Письмо {key} исчерпало {result['attempts']} попыток, перенесено в мертвую очередь ({reason})")
+        elif result['state'] == 'pending':
+            self.logger.info(f"💾 Письмо {key} сохранено для повторной обработки (попытка {result['attempts']}/{MAX_RETRY_ATTEMPTS}, причина: {reason})")
 
-    def remove_skipped_email(self, msg_id: bytes):
-        """🗑️ Удаление письма из списка пропущенных"""
-        skipped_path = self.data_dir / 'skipped_emails.json'
-        if not skipped_path.exists():
-            return
-        
-        key = msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id)
-        skipped = self.load_skipped_emails()
-        
-        if key in skipped:
-            del skipped[key]
-            # ✅ ИСПРАВЛЕНО: обязательно сохраняем файл после удаления
-            with open(skipped_path, 'w', encoding='utf-8') as f:
-                json.dump(skipped, f, ensure_ascii=False, indent=2)
-            
-            self.logger.info(f"✅ Письмо удалено из очереди повтора: {key}")
+    def current_uidvalidity(self) -> Optional[int]:
+        """🔢 UIDVALIDITY текущей папки (запрашивается один раз, кэш общий для воркеров пула)"""
+        uidvalidity = self.uidvalidity_cache.get(self.get_mailbox_key())
+        if uidvalidity is None and self.mail is not None:
+            uid_state = self.get_mailbox_uid_state()
+            uidvalidity = uid_state['uidvalidity'] if uid_state else None
+        return uidvalidity
 
     def retry_skipped_emails(self):
-        """🔄 Повторная обработка пропущенных писем с Dead Letter Queue"""
-        skipped = self.load_skipped_emails()
-        
-        if not skipped:
+        """🔄 Повторная обработка писем из очереди (аренда готовых элементов, затем мертвая очередь)"""
+        items = self.retry_queue.lease(f"{os.getpid()}:{threading.get_ident()}", mailbox=self.queue_mailbox())
+
+        if not items:
             self.logger.info("📭 Нет пропущенных писем для повторной обработки")
             return
+
+        if self.mail is None and not self.connect():
+            self.logger.error("❌ Нет соединения для повторной обработки пропущенных писем")
+            for item in items:
+                self.retry_queue.fail(item['item_key'], 'no_connection')
+            return
         
         self.logger.info("=" * 70)
-        self.logger.info(f"🔄 ПОВТОРНАЯ ОБРАБОТКА ПРОПУЩЕННЫХ ПИСЕМ: {len(skipped)} в очереди")
+        self.logger.info(f"🔄 ПОВТОРНАЯ ОБРАБОТКА ПРОПУЩЕННЫХ ПИСЕМ: {len(items)} готово к повтору")
         self.logger.info("=" * 70)
         
         successful_retries = 0
         moved_to_dead_letter = 0
+        current_uidvalidity = self.current_uidvalidity()
         
-        # ✅ НОВАЯ ЛОГИКА: обрабатываем копию ключей
-        for key in list(skipped.keys()):
-            info = skipped[key]
-            attempts = info.get('attempts', 0)
-            date_str = info.get('date', '')
-            reason = info.get('reason', 'unknown')
-            
-            # ✅ КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: при превышении попыток переносим в мертвую очередь
-            if attempts >= 3:
-                self.logger.warning(f"🆘 Письмо {key} достигло лимита попыток ({attempts}), перенос в мертвую очередь")
-                msg_id = key.encode() if isinstance(key, str) else key
-                self.move_to_dead_letter(msg_id, f"исчерпаны попытки после {attempts} раз - {reason}")
-                skipped.pop(key, None)  # Удаляем из локальной копии
+        for item in items:
+            key = item['item_key']
+            date_str = item.get('date') or ''
+            reason = item.get('reason') or 'unknown'
+
+            # UID из другой эпохи папки указывает на чужое письмо - повторять нельзя
+            if item['uid'] is not None and item['uidvalidity'] and current_uidvalidity \
+                    and item['uidvalidity'] != current_uidvalidity:
+                self.retry_queue.bury(key, f"uidvalidity_changed - {reason}")
+                self.logger.warning(f"🆘 Письмо {key}: UIDVALIDITY изменился, перенос в мертвую очередь")
                 moved_to_dead_letter += 1
                 continue
             
-            self.logger.info(f"🔄 Повторная попытка {attempts}/3: {key} за {date_str}")
+            self.logger.info(f"🔄 Повторная попытка {item['attempts']}/{MAX_RETRY_ATTEMPTS}: {key} за {date_str}")
             self.logger.info(f"   Причина пропуска: {reason}")
             
+            # По UID письмо находится и после expunge; старые записи без UID - по номеру
+            by_uid = item['uid'] is not None
+            msg_id = str(item['uid'] if by_uid else item['msg_id']).encode()
+            previous_mode = self.use_uid
+            self.use_uid = by_uid
             try:
-                msg_id = key.encode() if isinstance(key, str) else key
                 email_data = self.process_single_email(msg_id, date_str, 1, 1, include_attachment_data=False)
-                
-                if email_data:
-                    # ✅ Успешная обработка
-                    self.remove_skipped_email(msg_id)
-                    skipped.pop(key, None)
-                    self.logger.info(f"✅ Письмо {key} успешно обработано при повторе!")
-                    successful_retries += 1
-                else:
-                    # ✅ Неуспешная обработка - увеличиваем счетчик попыток
-                    self.logger.warning(f"❌ Письмо {key} снова не удалось обработать")
-                    skipped[key]['attempts'] = attempts + 1
-                    skipped[key]['last_attempt'] = self.get_local_time().isoformat()
-                    
             except Exception as e:
                 self.logger.error(f"❌ Ошибка при повторе письма {key}: {e}")
-                # При ошибке также увеличиваем счетчик попыток
-                skipped[key]['attempts'] = attempts + 1
-                skipped[key]['last_attempt'] = self.get_local_time().isoformat()
-        
-        # ✅ Сохраняем обновленный список пропущенных писем
-        skipped_path = self.data_dir / 'skipped_emails.json'
-        with open(skipped_path, 'w', encoding='utf-8') as f:
-            json.dump(skipped, f, ensure_ascii=False, indent=2)
+                email_data = None
+            finally:
+                self.use_uid = previous_mode
+
+            if email_data:
+                self.retry_queue.complete(key)
+                self.logger.info(f"✅ Письмо {key} успешно обработано при повторе!")
+                successful_retries += 1
+            else:
+                self.logger.warning(f"❌ Письмо {key} снова не удалось обработать")
+                if self.retry_queue.fail(key) == 'dead':
+                    self.logger.warning(f"🆘 Письмо {key} достигло лимита попыток, перенос в мертвую очередь")
+                    moved_to_dead_letter += 1
         
         self.logger.info("=" * 70)
         self.logger.info(f"📊 ИТОГИ ПОВТОРНОЙ ОБРАБОТКИ:")
         self.logger.info(f"✅ Успешно обработано: {successful_retries}")
         self.logger.info(f"📁 Перенесено в мертвую очередь: {moved_to_dead_letter}")
-        self.logger.info(f"❌ Осталось в очереди: {len(skipped)}")
+        self.logger.info(f"❌ Осталось в очереди: {self.retry_queue.count()}")
         self.logger.info("=" * 70)
 
-    def move_to_dead_letter(self, msg_id: bytes, reason: str):
-        """📁 Перенос письма в мертвую очередь"""
-        dead_letter_path = self.data_dir / 'dead_letter_emails.json'
-        
-        # Загружаем существующую мертвую очередь
-        dead_letters = {}
-        if dead_letter_path.exists():
-            try:
-                with open(dead_letter_path, 'r', encoding='utf-8') as f:
-                    dead_letters = json.load(f)
-            except Exception:
-                dead_letters = {}
-        
-        # Добавляем письмо в мертвую очередь
-        key = msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id)
-        dead_letters[key] = {
-            'reason': reason,
-            'moved_at': self.get_local_time().isoformat(),
-            'attempts_exhausted': True
-        }
-        
-        # Сохраняем обновленную мертвую очередь
-        with open(dead_letter_path, 'w', encoding='utf-8') as f:
-            json.dump(dead_letters, f, ensure_ascii=False, indent=2)
-        
-        # Удаляем из основной очереди пропущенных
-        self.remove_skipped_email(msg_id)
-        
+    def move_to_dead_letter(self, key: str, reason: str):
+        """📁 Перенос письма в мертвую очередь (key - ключ элемента очереди)"""
+        self.retry_queue.bury(key, reason)
         self.logger.warning(f"📁 Письмо {key} перенесено в мертвую очередь: {reason}")
 
     def list_dead_letters(self):
         """📋 Просмотр писем в мертвой очереди"""
-        dead_letter_path = self.data_dir / 'dead_letter_emails.json'
-        if dead_letter_path.exists():
-            try:
-                with open(dead_letter_path, 'r', encoding='utf-8') as f:
-                    dead_letters = json.load(f)
-                    self.logger.info(f"📁 Писем в мертвой очереди: {len(dead_letters)}")
-                    for key, info in dead_letters.items():
-                        moved_at = info.get('moved_at', 'неизвестно')
-                        self.logger.info(f"  {key}: {info['reason']} (перенесено: {moved_at})")
-                    return dead_letters
-            except Exception as e:
-                self.logger.error(f"❌ Ошибка чтения мертвой очереди: {e}")
-        else:
+        dead_letters = {item['item_key']: item for item in self.retry_queue.dead_letters()}
+        if not dead_letters:
             self.logger.info("📁 Мертвая очередь пуста")
-        return {}
+            return {}
+
+        self.logger.info(f"📁 Писем в мертвой очереди: {len(dead_letters)}")
+        for key, info in dead_letters.items():
+            moved_at = info.get('moved_at') or 'неизвестно'
+            self.logger.info(f"  {key}: {info['reason']} (перенесено: {moved_at})")
+        return dead_letters
 
     def clear_dead_letters(self):
         """🗑️ Очистка мертвой очереди"""
-        dead_letter_path = self.data_dir / 'dead_letter_emails.json'
-        if dead_letter_path.exists():
-            dead_letter_path.unlink()
+        if self.retry_queue.clear_dead():
             self.logger.info("🗑️ Мертвая очередь очищена")
         else:
             self.logger.info("📁 Мертвая очередь уже пуста")
@@ -601,6 +889,16 @@ class AdvancedEmailFetcherV2:
 
     def connect(self) -> bool:
         """🔌 Подключение к серверу"""
+        if self.mail is not None or self.last_connect_time:
+            self.imap_metrics.count('reconnects')
+
+        if self.session_factory is not None:
+            # Сессия выдается движком (например, асинхронным пулом), а не imaplib
+            self.mail = self.session_factory()
+            self.last_connect_time = time.time()
+            self.apply_lane_timeout()
+            return self.mail is not None
+
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
@@ -610,63 +908,171 @@ class AdvancedEmailFetcherV2:
                     except:
                         pass
 
-                self.logger.info(f"🔌 Подключение к {IMAP_SERVER} (попытка {attempt + 1}/{max_attempts})...")
-                self.mail = imaplib.IMAP4(IMAP_SERVER, IMAP_PORT)
-                self.mail.starttls(ssl.create_default_context())
-                self.mail.login(IMAP_USER, IMAP_PASSWORD)
-                self.mail.select('INBOX')
+                server, port, user, password, starttls = self.account_settings()
+                self.logger.info(f"🔌 Подключение к {server} [{self.mailbox}] (попытка {attempt + 1}/{max_attempts})...")
+                with self.imap_metrics.timed('CONNECT'):
+                    self.mail = imaplib.IMAP4(server, port, timeout=SOCKET_TIMEOUT)
+                if starttls:
+                    self.imap_metrics.call('STARTTLS', self.mail.starttls, ssl.create_default_context())
+                self.imap_metrics.call('LOGIN', self.mail.login, user, password)
+                self.negotiate_change_tracking()
+                self.imap_metrics.call('SELECT', self.mail.select, encode_mailbox_name(self.mailbox))
                 self.last_connect_time = time.time()
                 self.logger.info(f"✅ Подключение успешно")
                 return True
 
             except Exception as e:
+                self.imap_metrics.count('connect_failures')
                 self.logger.error(f"❌ Ошибка подключения (попытка {attempt + 1}): {e}")
                 if attempt < max_attempts - 1:
                     time.sleep(RETRY_DELAY)
 
         return False
 
+    def apply_lane_timeout(self):
+        """⏱️ Таймаут команд моста асинхронного движка по полосе воркера
+
+        imaplib ограничивает таймаутом сокета каждое чтение, а мост - команду
+        целиком, поэтому в большой полосе он получает LARGE_FETCH_TIMEOUT.
+        """
+        if isinstance(self.mail, SessionBridge):
+            self.mail.timeout = LARGE_FETCH_TIMEOUT if self.large_lane else SOCKET_TIMEOUT
+
+    @contextmanager
+    def operation_deadline(self, seconds: float, operation: str = 'IMAP'):
+        """⏱️ Дедлайн операции IMAP, работающий в любом потоке (замена SIGALRM)
+
+        Таймаут сокета ограничивает каждое чтение, а сторожевой таймер закрывает
+        сокет, если операция целиком не уложилась в срок: зависшее чтение
+        прерывается и превращается в TimeoutError. После срабатывания сессию
+        нужно переподключить. Мост асинхронного движка получает дедлайн на свои
+        команды и по его истечении разрывает общую сессию.
+        """
+        bridge_deadline = getattr(self.mail, 'deadline', None)
+        if bridge_deadline is not None:
+            with bridge_deadline(seconds, operation):
+                yield
+            return
+
+        sock = getattr(self.mail, 'sock', None)
+        expired = threading.Event()
+        message = f"{operation} операция превысила {seconds} секунд"
+
+        def abort_session():
+            expired.set()
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        watchdog = None
+        if sock is not None:
+            sock.settimeout(seconds)
+            watchdog = threading.Timer(seconds, abort_session)
+            watchdog.daemon = True
+            watchdog.start()
+
+        try:
+            yield
+        except TimeoutError:
+            raise
+        except Exception as e:
+            if expired.is_set():
+                raise TimeoutError(message) from e
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+                if not expired.is_set():
+                    try:
+                        sock.settimeout(SOCKET_TIMEOUT)
+                    except OSError:
+                        pass
+
+        if expired.is_set():
+            raise TimeoutError(message)
+
+    def server_capabilities(self) -> Set[str]:
+        """📋 Возможности сервера, объявленные в текущей сессии"""
+        return {str(cap).upper() for cap in (getattr(self.mail, 'capabilities', ()) or ())}
+
+    def negotiate_change_tracking(self):
+        """🔁 Включение QRESYNC до SELECT (RFC 7162)
+
+        Многие серверы называют CONDSTORE/QRESYNC только после входа, поэтому
+        список возможностей перезапрашивается. Без расширений сессия работает как раньше.
+        """
+        self.qresync_enabled = False
+        if not CONDSTORE_ENABLED or not hasattr(self.mail, 'capability'):
+            return
+        try:
+            status, data = self.imap_metrics.call('CAPABILITY', self.mail.capability)
+            if status == 'OK' and data and data[-1]:
+                text = data[-1].decode('ascii', errors='ignore') if isinstance(data[-1], bytes) else str(data[-1])
+                self.mail.capabilities = tuple(text.upper().split())
+            capabilities = self.server_capabilities()
+            if 'QRESYNC' in capabilities and 'ENABLE' in capabilities:
+                status, _data = self.imap_metrics.call('ENABLE', self.mail.enable, 'QRESYNC')
+                self.qresync_enabled = status == 'OK'
+        except (imaplib.IMAP4.abort, OSError):
+            raise
+        except Exception as e:
+            self.logger.warning(f"⚠️ Сервер не включил QRESYNC ({e}), удаления отслеживаются только пересканированием")
+
+    def supports_condstore(self) -> bool:
+        """🔁 Можно ли спрашивать только измененные письма (MODSEQ / CHANGEDSINCE)"""
+        return CONDSTORE_ENABLED and (self.qresync_enabled or 'CONDSTORE' in self.server_capabilities())
+
+    def fetch_vanished(self, modseq: int) -> List[int]:
+        """🗑️ UID писем, удаленных из папки после modseq (VANISHED EARLIER, нужен QRESYNC)"""
+        if not self.qresync_enabled or not modseq:
+            return []
+        status, _data = self.imap_metrics.call('FETCH CHANGEDSINCE', self.mail.uid, 'FETCH', '1:*', '(UID)',
+                                               f'(CHANGEDSINCE {modseq} VANISHED)')
+        if status != 'OK':
+            raise Exception(f"IMAP fetch returned: {status}")
+        _code, vanished = self.mail.response('VANISHED')
+        return parse_vanished([item for item in vanished or [] if item])
+
+    def mark_vanished(self, uids: List[int], uidvalidity: int):
+        """🗑️ Отметка в индексе писем, исчезнувших из текущей папки (локальные копии остаются)"""
+        if not uids:
+            return
+        removed = self.message_index.mark_removed(self.get_mailbox_key(), uidvalidity, uids)
+        self.stats['vanished'] += len(removed)
+        self.logger.info(f"🗑️ Удалено или перенесено на сервере: {len(uids)} UID, из них сохраненных писем: {len(removed)}")
+
     def safe_fetch(self, msg_id: bytes, flags: str = '(RFC822)') -> Optional[List]:
         """🛡️ УЛУЧШЕННОЕ получение письма с fallback стратегиями"""
         for attempt in range(MAX_RETRIES):
+            if attempt:
+                self.imap_metrics.count('retries')
             try:
-                time.sleep(REQUEST_DELAY)
+                time.sleep(self.request_delay)
                 
                 try:
-                    status, response = self.mail.noop()
+                    status, response = self.imap_metrics.call('NOOP', self.mail.noop)
                 except Exception as e:
                     self.logger.warning(f"   ⚠️ NOOP failed: {e}")
                     raise ConnectionError("IMAP connection lost")
 
-                timeout_seconds = 30 + (attempt * 15)  # 30, 45, 60 секунд
-                import signal
+                base_timeout = LARGE_FETCH_TIMEOUT if self.large_lane else FETCH_TIMEOUT
+                timeout_seconds = base_timeout + (attempt * FETCH_TIMEOUT_STEP)  # 30, 45, 60 секунд
 
-                def timeout_handler(signum, frame):
-                    raise TimeoutError(f"Fetch операция превысила {timeout_seconds} секунд")
+                with self.operation_deadline(timeout_seconds, 'Fetch'):
+                    status, data = self.imap_fetch(msg_id, flags)
 
-                signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(timeout_seconds)
-
-                try:
-                    fetch_start = time.time()
-                    status, data = self.mail.fetch(msg_id, flags)
-                    fetch_time = time.time() - fetch_start
-                    signal.alarm(0)
-
-                    if status == 'OK':
-                        if data:
-                            return data
-                        else:
-                            self.logger.warning(f"   ⚠️ Пустые данные в ответе")
-                            return None
+                if status == 'OK':
+                    if data:
+                        return data
                     else:
-                        raise Exception(f"IMAP fetch returned: {status}")
-
-                except TimeoutError:
-                    signal.alarm(0)
-                    raise
+                        self.logger.warning(f"   ⚠️ Пустые данные в ответе")
+                        return None
+                else:
+                    raise Exception(f"IMAP fetch returned: {status}")
 
             except TimeoutError as e:
+                self.imap_metrics.count('timeouts')
                 self.logger.error(f"   ⏰ ТАЙМАУТ на попытке {attempt + 1}: {e}")
                 if attempt < MAX_RETRIES - 1:
                     self.logger.info(f"   🔄 Переподключение после таймаута...")
@@ -674,6 +1080,9 @@ class AdvancedEmailFetcherV2:
                         continue
                 else:
                     self.logger.warning(f"   ⚠️ Все попытки исчерпаны, пробуем fallback...")
+                    # Сессия после дедлайна закрыта - fallback идет по новому соединению
+                    if not self.connect():
+                        return None
                     return self.try_fallback_fetch(msg_id)
 
             except (imaplib.IMAP4.abort, ssl.SSLError, OSError, ConnectionError) as e:
@@ -701,14 +1110,16 @@ class AdvancedEmailFetcherV2:
             self.logger.info("   🆘 Пробуем загрузить только заголовки и текст...")
             
             # Попытка 1: Только заголовки и текст без вложений
-            status, data = self.mail.fetch(msg_id, '(BODY.PEEK[HEADER] BODY.PEEK[TEXT])')
+            with self.operation_deadline(FALLBACK_TIMEOUT, 'Fallback'):
+                status, data = self.imap_fetch(msg_id, '(BODY.PEEK[HEADER] BODY.PEEK[TEXT])')
             if status == 'OK' and data:
                 self.logger.info("   ✅ Fallback успешен - загружены заголовки и текст")
                 return data
                 
             # Попытка 2: Только заголовки
             self.logger.info("   🆘 Пробуем загрузить только заголовки...")
-            status, data = self.mail.fetch(msg_id, '(BODY.PEEK[HEADER])')
+            with self.operation_deadline(FALLBACK_TIMEOUT, 'Fallback'):
+                status, data = self.imap_fetch(msg_id, '(BODY.PEEK[HEADER])')
             if status == 'OK' and data:
                 self.logger.info("   ✅ Fallback частично успешен - загружены только заголовки")
                 return [(b'FALLBACK', b'HEADERS_ONLY')]
@@ -763,11 +1174,13 @@ class AdvancedEmailFetcherV2:
             self.logger.error(f"   ❌ Критическая ошибка в extract_raw_email: {e}")
             return None
 
-    def safe_search(self, criteria: str) -> List[bytes]:
-        """🔍 Безопасный поиск писем"""
+    def safe_search(self, criteria: str, strict: bool = False) -> List[bytes]:
+        """🔍 Безопасный поиск писем (strict - после всех попыток исключение вместо пустого списка)"""
         for attempt in range(MAX_RETRIES):
+            if attempt:
+                self.imap_metrics.count('retries')
             try:
-                status, data = self.mail.search(None, criteria)
+                status, data = self.imap_search(criteria)
                 if status == 'OK':
                     return data[0].split() if data else []
                 else:
@@ -780,14 +1193,51 @@ class AdvancedEmailFetcherV2:
                         continue
                 else:
                     self.logger.error(f"❌ Поиск не удался")
+                    if strict:
+                        raise
                     return []
         return []
 
+    def search_with_server_filters(self, criteria: str, strict: bool = False) -> Tuple[List[bytes], List[bytes]]:
+        """📡 Поиск с исключением черного списка и тем на стороне сервера
+
+        Returns:
+            (все найденные письма, кандидаты после серверных фильтров). Локальные
+            фильтры в process_single_email остаются страховкой для кандидатов.
+            strict - сбой поиска поднимает исключение (см. safe_search).
+        """
+        all_ids = self.safe_search(criteria, strict)
+        exclusions = self.filters.server_search_criteria() if SERVER_SIDE_FILTERS and self.server_filters_enabled else ''
+        if not all_ids or not exclusions:
+            return all_ids, all_ids
+
+        try:
+            status, data = self.imap_search(f'{criteria} {exclusions}')
+            if status != 'OK':
+                raise Exception(f"IMAP search returned: {status}")
+            found = set(data[0].split()) if data and data[0] else set()
+        except (imaplib.IMAP4.abort, OSError):
+            raise
+        except Exception as e:
+            # Сервер не понял критерии - дальше фильтруем только локально
+            self.logger.warning(f"⚠️ Сервер отклонил критерии фильтрации ({e}), фильтруем локально")
+            self.server_filters_enabled = False
+            return all_ids, all_ids
+
+        candidates = [msg_id for msg_id in all_ids if msg_id in found]
+        excluded = len(all_ids) - len(candidates)
+        self.stats['filtered_server_side'] += excluded
+        if excluded:
+            self.logger.info(f"📡 Исключено на сервере: {excluded} из {len(all_ids)} писем")
+        return all_ids, candidates
+
     def get_email_headers_only(self, msg_id: bytes) -> Optional[email.message.Message]:
         """📋 УСТОЙЧИВАЯ загрузка заголовков с переподключением"""
         for attempt in range(MAX_RETRIES):
+            if attempt:
+                self.imap_metrics.count('retries')
             try:
-                status, header_data = self.mail.fetch(msg_id, '(BODY.PEEK[HEADER])')
+                status, header_data = self.imap_fetch(msg_id, '(BODY.PEEK[HEADER])')
                 if status != 'OK':
                     raise Exception(f"Ошибка загрузки заголовков: {status}")
 
@@ -853,48 +1303,36 @@ class AdvancedEmailFetcherV2:
     def analyze_bodystructure(self, msg_id: bytes) -> Dict:
         """🔍 ИСПРАВЛЕННЫЙ анализ структуры письма"""
         try:
-            status, structure_data = self.mail.fetch(msg_id, '(BODYSTRUCTURE)')
+            status, structure_data = self.imap_fetch(msg_id, '(BODYSTRUCTURE)')
             if status != 'OK':
-                return {'has_large_attachments': False, 'structure': ''}
-
-            structure_str = ''
-            if structure_data and len(structure_data) > 0:
-                structure_item = structure_data[0]
-                if isinstance(structure_item, bytes):
-                    structure_str = structure_item.decode('utf-8', errors='ignore')
-                elif isinstance(structure_item, str):
-                    structure_str = structure_item
-                else:
-                    structure_str = str(structure_item)
+                return {'has_large_attachments': False, 'structure': '', 'bodystructure': None}
+
+            records = parse_fetch_response(structure_data)
+            bodystructure = records[0].get('BODYSTRUCTURE') if records else None
+            structure_str = format_imap_value(bodystructure) if bodystructure is not None else ''
 
             has_large = self.detect_large_attachments_from_structure(structure_str)
             return {
                 'has_large_attachments': has_large,
-                'structure': structure_str
+                'structure': structure_str,
+                'bodystructure': bodystructure
             }
 
         except Exception as e:
             self.logger.warning(f"   ⚠️ Ошибка анализа структуры: {e}")
-            return {'has_large_attachments': False, 'structure': ''}
+            return {'has_large_attachments': False, 'structure': '', 'bodystructure': None}
 
     def detect_large_attachments_from_structure(self, structure_str: str) -> bool:
-        """🔍 ИСПРАВЛЕННОЕ определение больших вложений из структуры"""
+        """🔍 Определение больших вложений по дереву частей BODYSTRUCTURE"""
         try:
             if not structure_str:
                 return False
 
-            structure_lower = structure_str.lower()
-            
             # ✅ УСЛОВНОЕ ЛОГИРОВАНИЕ
             if self.enable_size_logging:
                 self.logger.info(f"🔍 Анализ структуры письма...")
                 self.logger.info(f"📋 Начальные символы структуры: {structure_str[:500]}...")
 
-            if 'attachment' not in structure_lower and 'application' not in structure_lower:
-                if self.enable_size_logging:
-                    self.logger.info(f"📋 Нет вложений в структуре")
-                return False
-
             # Поиск больших файлов по типу
             large_indicators = [
                 'application/vnd.ms-powerpoint',
@@ -905,46 +1343,17 @@ class AdvancedEmailFetcherV2:
                 'audio/',
             ]
 
-            for indicator in large_indicators:
-                if indicator in structure_lower:
+            parts = parse_bodystructure(parse_list([structure_str.encode('utf-8')])[0])
+
+            for part in parts:
+                if any(part.mime_type.startswith(indicator) for indicator in large_indicators):
                     if self.enable_size_logging:
-                        self.logger.info(f"⚠️ Обнаружен потенциально большой файл: {indicator}")
+                        self.logger.info(f"⚠️ Обнаружен потенциально большой файл: {part.mime_type} (секция {part.section})")
                     return True
 
-            # Анализ размеров с фильтрацией boundary ID
-            import re
-            size_matches = re.findall(r'(\d+)', structure_lower)
-            
-            valid_sizes = []
-            suspicious_numbers = []
-            
-            for size_str in size_matches:
-                size = self.safe_parse_size(size_str)
-                
-                # Пропускаем boundary ID
-                if len(size_str) == 8 and 'boundary' in structure_lower and size_str in structure_lower:
-                    if self.enable_size_logging:
-                        self.logger.info(f"🔍 Пропускаем boundary ID: {size}")
-                    continue
-                    
-                # Классифицируем размеры
-                if 10_000 <= size <= 200_000_000:  # От 10KB до 200MB
-                    valid_sizes.append(size)
-                elif size > 200_000_000:
-                    suspicious_numbers.append(size)
-            
-            # Логируем найденные размеры
-            if self.enable_size_logging:
-                if valid_sizes:
-                    self.logger.info(f"📊 Разумные размеры в структуре: {valid_sizes}")
-                if suspicious_numbers:
-                    self.logger.info(f"🔍 Подозрительные большие числа (игнорируем): {suspicious_numbers[:5]}...")
-
-            # Проверяем на большие компоненты
-            for size in valid_sizes:
-                if size > 20_000_000:  # 20MB
+                if part.size > LARGE_PART_SIZE:
                     if self.enable_size_logging:
-                        self.logger.info(f"⚠️ Обнаружен большой компонент: {size} байт ({size/1024/1024:.1f} МБ)")
+                        self.logger.info(f"⚠️ Обнаружен большой компонент: {part.size} байт ({part.size/1024/1024:.1f} МБ), секция {part.section}")
                     return True
 
             if self.enable_size_logging:
@@ -955,6 +1364,200 @@ class AdvancedEmailFetcherV2:
             self.logger.warning(f"⚠️ Ошибка анализа размеров структуры: {e}")
             return False
 
+    def get_structure_parts(self, structure_info: Dict) -> Optional[List[BodyPart]]:
+        """🌳 Части письма для выборочной загрузки (None - письмо грузится целиком)
+
+        Одночастные письма и письма с вложенными message/rfc822 загружаются целиком:
+        экономии нет, а вложенные письма разбираются обычным обходом MIME.
+        """
+        bodystructure = structure_info.get('bodystructure')
+        if not isinstance(bodystructure, list) or not bodystructure or not isinstance(bodystructure[0], list):
+            return None
+
+        try:
+            parts = parse_bodystructure(bodystructure)
+        except ImapParseError as e:
+            self.logger.warning(f"   ⚠️ Не удалось разобрать BODYSTRUCTURE: {e}")
+            return None
+
+        if any(part.mime_type == 'message/rfc822' for part in parts):
+            return None
+        return parts
+
+    def is_attachment_wanted(self, filename: str) -> bool:
+        """✅ Пройдет ли вложение фильтры save_attachment_or_inline (без загрузки содержимого)"""
+        base_filename = filename[1:] if filename.startswith(("~", ".")) else filename
+        if filename in self.specific_excluded_files or base_filename in self.specific_excluded_files:
+            return False
+        if self.filters.is_filename_excluded(filename):
+            return False
+
+        file_ext = Path(filename).suffix.lower()
+        return file_ext not in EXCLUDED_EXTENSIONS and file_ext in SUPPORTED_ATTACHMENTS
+
+    def select_parts_to_fetch(self, parts: List[BodyPart], attachments_exist: bool, skip_large: bool) -> List[BodyPart]:
+        """🎯 Выбор секций для BODY.PEEK: текст письма и вложения, которые будут сохранены"""
+        selected = []
+
+        for part in parts:
+            filename = self.decode_header_value(part.filename) if part.filename else None
+
+            if part.is_text and part.disposition != 'attachment':
+                selected.append(part)
+                continue
+
+            # Та же классификация вложений, что и при обходе письма в process_single_email
+            is_real_attachment = (
+                part.disposition == 'attachment' or
+                (not part.disposition and filename and part.mime_type.startswith('image/'))
+            )
+            if not is_real_attachment or attachments_exist or not filename:
+                continue
+            if not self.is_attachment_wanted(filename):
+                continue
+            if skip_large and part.size > LARGE_PART_SIZE:
+                self.logger.info(f"📎 Пропускаем большое вложение {filename} ({part.size/1024/1024:.1f} МБ)")
+                continue
+
+            selected.append(part)
+
+        return selected
+
+    def fetch_selected_parts(self, msg_id: bytes, headers_msg: email.message.Message,
+                             parts: List[BodyPart], selected: List[BodyPart]) -> Optional[email.message.Message]:
+        """📥 Загрузка только выбранных секций и сборка письма из них
+
+        Невыбранные части остаются в письме пустыми, чтобы фильтры вложений
+        и статистика видели их так же, как при загрузке RFC822 целиком.
+        """
+        contents: Dict[str, bytes] = {}
+
+        if selected:
+            items = '(' + ' '.join(f'BODY.PEEK[{part.section}]' for part in selected) + ')'
+            fetch_data = self.safe_fetch(msg_id, items)
+            if not fetch_data:
+                return None
+
+            records = parse_fetch_response(fetch_data)
+            if not records:
+                return None
+
+            for part in selected:
+                value = records[0].get(f'BODY[{part.section}]')
+                if value is None:
+                    self.logger.warning(f"   ⚠️ Сервер не вернул секцию {part.section}")
+                    return None
+                contents[part.section] = value if isinstance(value, bytes) else value.encode('utf-8', errors='replace')
+
+        msg = email.message.Message()
+        for key, value in headers_msg.items():
+            if not key.lower().startswith('content-') and key.lower() != 'mime-version':
+                msg[key] = value
+        msg['MIME-Version'] = '1.0'
+        msg['Content-Type'] = 'multipart/mixed'
+
+        for part in parts:
+            sub = email.message.Message()
+            sub['Content-Type'] = part.mime_type
+            for key, value in part.params.items():
+                if not key.endswith('*'):
+                    sub.set_param(key, value)
+            if part.filename and not sub.get_param('name'):
+                sub.set_param('name', part.filename)
+            sub['Content-Transfer-Encoding'] = part.encoding
+            if part.disposition:
+                if part.filename:
+                    sub.add_header('Content-Disposition', part.disposition, filename=part.filename)
+                else:
+                    sub['Content-Disposition'] = part.disposition
+            sub.set_payload(contents.get(part.section, b'').decode('ascii', errors='surrogateescape'))
+            msg.attach(sub)
+
+        fetched_bytes = sum(len(content) for content in contents.values())
+        skipped_bytes = sum(part.size for part in parts if part.section not in contents)
+        self.stats['selective_fetches'] += 1
+        self.stats['skipped_parts'] += len(parts) - len(contents)
+        self.stats['skipped_part_bytes'] += skipped_bytes
+        self.logger.info(f"📉 Выборочная загрузка: {len(contents)} из {len(parts)} частей, "
+                         f"{fetched_bytes/1024:.1f} КБ, пропущено {skipped_bytes/1024:.1f} КБ")
+        return msg
+
+    def fetch_metadata_batch(self, msg_ids: List[bytes]) -> Dict[bytes, Dict]:
+        """📦 Пакетная загрузка метаданных: один FETCH на группу писем вместо 3-4 запросов на письмо
+
+        Returns:
+            Dict[bytes, Dict]: msg_id → запись с ключами 'uid', 'size', 'internaldate', 'structure',
+            'bodystructure' и 'headers' (email.message.Message с нужными полями)
+        """
+        metadata: Dict[bytes, Dict] = {}
+        if not msg_ids:
+            return metadata
+
+        fields = ' '.join(METADATA_HEADER_FIELDS)
+        items = f'(UID INTERNALDATE RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({fields})])'
+
+        for start in range(0, len(msg_ids), METADATA_BATCH_SIZE):
+            chunk = msg_ids[start:start + METADATA_BATCH_SIZE]
+            msg_set = b','.join(chunk).decode()
+
+            for attempt in range(MAX_RETRIES):
+                if attempt:
+                    self.imap_metrics.count('retries')
+                try:
+                    status, data = self.imap_fetch(msg_set, items)
+                    if status != 'OK':
+                        raise Exception(f"IMAP fetch returned: {status}")
+                    for record in parse_fetch_response(data):
+                        entry = self.build_metadata_record(record)
+                        if entry:
+                            metadata[entry['msg_id']] = entry
+                    break
+
+                except (OSError, imaplib.IMAP4.error) as e:
+                    self.logger.warning(f"   ⚠️ Сетевая ошибка пакетной загрузки метаданных (попытка {attempt + 1}): {e}")
+                    if attempt < MAX_RETRIES - 1 and self.connect():
+                        continue
+                    break
+
+                except Exception as e:
+                    self.logger.warning(f"   ⚠️ Ошибка пакетной загрузки метаданных: {e}")
+                    break
+
+        missing = len(msg_ids) - len(metadata)
+        self.logger.info(f"📦 Метаданные получены пакетно: {len(metadata)} писем" +
+                         (f", без метаданных {missing} (будут загружены по одному)" if missing > 0 else ""))
+        return metadata
+
+    def build_metadata_record(self, record: Dict) -> Optional[Dict]:
+        """🔧 Запись метаданных письма из разобранного ответа FETCH"""
+        try:
+            raw_headers = find_item(record, 'BODY[HEADER')
+            if raw_headers is None:
+                return None
+            if isinstance(raw_headers, str):
+                raw_headers = raw_headers.encode('utf-8', errors='replace')
+
+            uid = record.get('UID')
+            size = self.safe_parse_size(record.get('RFC822.SIZE'))
+            bodystructure = record.get('BODYSTRUCTURE')
+
+            uid = int(uid) if isinstance(uid, str) and uid.isdigit() else None
+            if self.use_uid and uid is None:
+                return None
+
+            return {
+                'msg_id': str(uid).encode() if self.use_uid else record['SEQ'].encode(),
+                'uid': uid,
+                'size': size if size > 0 else -1,
+                'internaldate': record.get('INTERNALDATE'),
+                'bodystructure': bodystructure,
+                'structure': format_imap_value(bodystructure) if bodystructure is not None else '',
+                'headers': email.message_from_bytes(raw_headers),
+            }
+        except Exception as e:
+            self.logger.warning(f"   ⚠️ Не удалось разобрать метаданные письма: {e}")
+            return None
+
 
     def decode_header_value(self, val: str) -> str:
         """📝 ИСПРАВЛЕННОЕ декодирование MIME-заголовков с правильным извлечением email"""
@@ -978,90 +1581,14 @@ class AdvancedEmailFetcherV2:
             return val or ''
 
     def extract_plain_text(self, msg: email.message.Message, include_attachment_data: bool = False) -> str:
-        """📄 ИСПРАВЛЕННОЕ извлечение текста письма - точное определение тела"""
-        text_parts = []
-        max_len = 500_000
-        
+        """📄 Текст тела письма (text/plain и text/html без вложений) за один обход дерева"""
         try:
-            if msg.is_multipart():
-                body_found = False
-                for part in msg.walk():
-                    ctype = part.get_content_type()
-                    
-                    # Точное определение: text/plain и text/html всегда считаются телом письма
-                    if ctype in ('text/plain', 'text/html'):
-                        # Проверяем disposition только для attachment, не для inline
-                        disposition = part.get('Content-Disposition', '')
-                        is_attachment = disposition and 'attachment' in disposition.lower()
-                        
-                        # Пропускаем только явные вложения, inline считаем частью тела
-                        if is_attachment:
-                            continue
-                        
-                        try:
-                            raw = part.get_payload(decode=True)
-                            if raw and len(raw.strip()) > 0:
-                                charset = part.get_content_charset() or 'utf-8'
-                                chunk = raw.decode(charset, errors='ignore')
-                                
-                                if ctype == 'text/html':
-                                    chunk = re.sub(r'<[^>]+>', '', chunk)
-                                    chunk = re.sub(r'&[a-z]+;', ' ', chunk)
-                                
-                                # Проверяем, что это действительно текст, а не пустой HTML
-                                if chunk and len(chunk.strip()) > 10:
-                                    text_parts.append(chunk.strip())
-                                    body_found = True
-                        except Exception as e:
-                            self.logger.warning(f"⚠️ Ошибка извлечения текста: {e}")
-                            continue
-                
-                # Если не найдено обычного текста, проверяем inline content
-                if not body_found:
-                    for part in msg.walk():
-                        ctype = part.get_content_type()
-                        if ctype in ('text/plain', 'text/html'):
-                            disposition = part.get('Content-Disposition', '')
-                            if disposition and 'inline' in disposition.lower():
-                                try:
-                                    raw = part.get_payload(decode=True)
-                                    if raw and len(raw.strip()) > 0:
-                                        charset = part.get_content_charset() or 'utf-8'
-                                        chunk = raw.decode(charset, errors='ignore')
-                                        if ctype == 'text/html':
-                                            chunk = re.sub(r'<[^>]+>', '', chunk)
-                                            chunk = re.sub(r'&[a-z]+;', ' ', chunk)
-                                        if chunk and len(chunk.strip()) > 10:
-                                            text_parts.append(chunk.strip())
-                                except Exception as e:
-                                    self.logger.warning(f"⚠️ Ошибка извлечения inline текста: {e}")
-            else:
-                # Простое письмо без multipart
-                try:
-                    ctype = msg.get_content_type()
-                    if ctype in ('text/plain', 'text/html'):
-                        raw = msg.get_payload(decode=True)
-                        if raw and len(raw.strip()) > 0:
-                            charset = msg.get_content_charset() or 'utf-8'
-                            chunk = raw.decode(charset, errors='ignore')
-                            if ctype == 'text/html':
-                                chunk = re.sub(r'<[^>]+>', '', chunk)
-                                chunk = re.sub(r'&[a-z]+;', ' ', chunk)
-                            if chunk and len(chunk.strip()) > 10:
-                                text_parts.append(chunk.strip())
-                except Exception as e:
-                    self.logger.warning(f"⚠️ Ошибка извлечения простого текста: {e}")
-
-            full_text = '\n'.join(text_parts).strip()
-            
-            # Логируем результат для диагностики
+            full_text = walk_message(msg, self.logger).body_text
             if full_text:
                 self.logger.debug(f"📄 Тело письма извлечено: {len(full_text)} символов")
             else:
                 self.logger.debug(f"📄 Тело письма пусто или не содержит текст")
-                
-            return full_text[:max_len]
-        
+            return full_text
         except Exception as e:
             self.logger.error(f"❌ Критическая ошибка извлечения текста: {e}")
             return ""
@@ -1076,9 +1603,51 @@ class AdvancedEmailFetcherV2:
         emails = re.findall(email_pattern, recipients_str)
         return emails
 
-    def save_attachment_or_inline(self, part: email.message.Message, thread_id: str, date_folder: str, is_inline: bool = False) -> Optional[Dict]:
-        """📎 Сохранение вложения с детальной диагностикой размеров"""
+    def reject_junk_image(self, filename: str, sniff: Dict, verdict: Dict, is_inline: bool) -> Dict:
+        """🚫 Отказ по индексу мусорных изображений; отказ по правилу запоминается как отпечаток"""
+        dimensions = f"{sniff['width']}×{sniff['height']}" if sniff.get('width') is not None else None
+        if verdict['kind'] == 'fingerprint':
+            self.logger.info(f"🚫 ИСКЛЮЧЕНО ПО ОТПЕЧАТКУ: {filename} - {verdict['reason']}")
+            self.stats['excluded_by_fingerprint'] += 1
+            status, file_type = "excluded_by_fingerprint", "excluded_by_fingerprint"
+        elif verdict['kind'] == 'dimensions':
+            self.logger.info(f"🚫 ИСКЛЮЧЕНО ПО РАЗМЕРАМ ИЗОБРАЖЕНИЯ: {filename} - {dimensions} пикселей")
+            self.stats['excluded_by_image_dimensions'] += 1
+            status, file_type = "excluded_by_size", "excluded_by_image_size"
+        else:
+            self.logger.info(f"🚫 ИСКЛЮЧЕН МЕЛКИЙ МУСОРНЫЙ ФАЙЛ: {filename} - {sniff['size']} байт ({verdict['reason']})")
+            self.stats['excluded_by_size'] += 1
+            status, file_type = "excluded_by_size", "excluded_by_size"
+
+        if verdict['kind'] != 'fingerprint':
+            self.junk_images.learn(sniff, verdict['reason'], 'rejected')
+
+        result = {
+            "original_filename": filename,
+            "saved_filename": None,
+            "file_path": None,
+            "relative_path": None,
+            "file_size": sniff['size'],
+            "file_type": file_type,
+            "exclusion_reason": verdict['reason'],
+            "saved_at": self.get_local_time().isoformat(),
+            "status": status,
+            "is_inline": is_inline
+        }
+        if dimensions:
+            result["image_dimensions"] = dimensions
+        return result
+
+    def save_attachment_or_inline(self, part: email.message.Message, thread_id: str, date_folder: str, is_inline: bool = False, message_id: str = '', sender: str = '') -> Optional[Dict]:
+        """📎 Сохранение вложения с детальной диагностикой размеров
+
+        Содержимое кладется в AttachmentStore по SHA-256; message_id (или thread_id)
+        регистрируется как ссылка письма на blob. Изображения сначала проверяются
+        по заголовку через JunkImageIndex (config/junk_images.json); sender нужен
+        для обучения индекса на картинках, которые приходят от многих отправителей.
+        """
         
+        staged = None
         try:
             # Для встроенных изображений имя файла может отсутствовать
             filename = part.get_filename()
@@ -1147,38 +1716,32 @@ class AdvancedEmailFetcherV2:
                     "is_inline": is_inline
                 }
 
-            # 🆕 ФИЛЬТРАЦИЯ ПО РАЗМЕРУ И ПАРАМЕТРАМ ИЗОБРАЖЕНИЯ
+            # 🆕 ФИЛЬТРАЦИЯ МУСОРНЫХ ИЗОБРАЖЕНИЙ: сначала по заголовку, без полного декодирования
+            sniff = None
             if is_inline or (filename and Path(filename).suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp']):
                 try:
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        # Проверяем размер файла
-                        file_size = len(payload)
-
-                        # ✅ Детальное логирование каждого вложения
-                        #self.logger.info(f"🔍 Анализ вложения: {filename}")
-                        #self.logger.info(f"📏 Реальный размер файла: {file_size} байт ({file_size / 1024:.1f} КБ)")
-
-                        # ✅ УМНЫЙ ФИЛЬТР: разные пороги для разных типов файлов
-                        size_thresholds = {
-                            'image': 50000,      # 50 КБ для image*
-                            'logo': 30000,       # 30 КБ для logo*
-                            'signature': 30000,  # 30 КБ для signature*
-                            'stamp': 30000,      # 30 КБ для stamp*
-                            'icon': 20000,       # 20 КБ - иконки
-                        }
-                            
-                        for pattern, threshold in size_thresholds.items():
-                            if filename and filename.lower().startswith(pattern) and file_size < threshold:
-                                self.logger.info(f"🚫 ИСКЛЮЧЕН МЕЛКИЙ МУСОРНЫЙ ФАЙЛ: {filename} - {file_size} байт (паттерн: {pattern})")
-                                self.stats['excluded_by_size'] += 1
-                                return {
-                                    "original_filename": filename,
-                                    "status": "excluded_by_size",
-                                    "file_size": file_size,
-                                    "exclusion_reason": f"мелкий мусорный файл {pattern} < {threshold} байт",
-                                    "is_inline": is_inline
-                                }
+                    sniff = sniff_image(part)
+                    if sniff:
+                        file_size = sniff['size']
+                        if sniff['width'] is None:
+                            # Заголовок не разобран (TIFF и т.п.) - размеры читает PIL после декодирования
+                            staged = self.attachment_store.stage(part)
+                            try:
+                                with Image.open(staged['tmp_path']) as img:
+                                    sniff['width'], sniff['height'] = img.size
+                            except Exception as e:
+                                self.logger.warning(f"⚠️ Не удалось проанализировать изображение {filename}: {e}")
+
+                        verdict = self.junk_images.check(filename, sniff)
+                        if verdict is None and self.junk_images.needs_dhash(sniff):
+                            # Отпечаток с теми же размерами: сравниваем перцептивный хэш
+                            staged = staged or self.attachment_store.stage(part)
+                            entry = self.junk_images.match_dhash(sniff, image_dhash(staged['tmp_path']))
+                            if entry:
+                                verdict = {'kind': 'fingerprint', 'reason': entry.get('reason', 'похоже на известный мусорный файл')}
+
+                        if verdict:
+                            return self.reject_junk_image(filename, sniff, verdict, is_inline)
 
                         # ✅ Фильтр по размеру конкретного вложения
                         if file_size > 10_000_000:  # 10MB для отдельного файла
@@ -1191,52 +1754,6 @@ class AdvancedEmailFetcherV2:
                                 "is_inline": is_inline
                             }
 
-                        # Точный размер мусорных файлов
-                        if file_size == 83509:
-                            self.logger.info(f"🚫 ИСКЛЮЧЕНО ПО РАЗМЕРУ ФАЙЛА: {filename} - {file_size} байт (мусорное изображение)")
-                            self.stats['excluded_by_size'] += 1
-                            return {
-                                "original_filename": filename,
-                                "saved_filename": None,
-                                "file_path": None,
-                                "relative_path": None,
-                                "file_size": file_size,
-                                "file_type": "excluded_by_size",
-                                "exclusion_reason": f"размер файла {file_size} байт - известный мусорный файл",
-                                "saved_at": self.get_local_time().isoformat(),
-                                "status": "excluded_by_size",
-                                "is_inline": is_inline
-                            }
-                        
-
-                        # 🆕 Проверяем размеры изображения через PIL
-                        try:
-                            img = Image.open(io.BytesIO(payload))
-                            width, height = img.size
-                            
-                            # Исключаем изображения 416×250 (мусорные)
-                            if width == 416 and height == 250:
-                                self.logger.info(f"🚫 ИСКЛЮЧЕНО ПО РАЗМЕРАМ ИЗОБРАЖЕНИЯ: {filename} - {width}×{height} пикселей")
-                                self.stats['excluded_by_image_dimensions'] += 1
-                                return {
-                                    "original_filename": filename,
-                                    "saved_filename": None,
-                                    "file_path": None,
-                                    "relative_path": None,
-                                    "file_size": file_size,
-                                    "file_type": "excluded_by_image_size",
-                                    "exclusion_reason": f"размеры изображения {width}×{height} - известный мусорный формат",
-                                    "saved_at": self.get_local_time().isoformat(),
-                                    "status": "excluded_by_size",
-                                    "is_inline": is_inline,
-                                    "image_dimensions": f"{width}×{height}"
-                                }
-                                
-                        except Exception as e:
-                            # Если не удалось проанализировать как изображение, продолжаем
-                            self.logger.warning(f"⚠️ Не удалось проанализировать изображение {filename}: {e}")
-                            pass
-                            
                 except Exception as e:
                     self.logger.warning(f"⚠️ Ошибка анализа размера файла {filename}: {e}")
             
@@ -1280,91 +1797,68 @@ class AdvancedEmailFetcherV2:
             attachment_type = "🖼️ Встроенное изображение" if is_inline else "⬇️ Вложение"
             self.logger.info(f"{attachment_type}: {filename}")
             
-            # Создаем папку для вложений по дате ПИСЬМА
-            attachments_date_dir = self.attachments_dir / date_folder
-            attachments_date_dir.mkdir(exist_ok=True)
-            
-            # 🆕 ПРОВЕРКА СУЩЕСТВУЮЩИХ ФАЙЛОВ - предотвращение дублирования
-            # Проверяем, есть ли уже файлы с таким же оригинальным именем в папке
-            existing_files = list(attachments_date_dir.glob(f"*_{filename}"))
-            if existing_files:
-                self.logger.info(f"📁 ФАЙЛ УЖЕ СУЩЕСТВУЕТ: {filename} - найдено {len(existing_files)} файл(ов)")
-                # Возвращаем информацию о существующем файле
-                existing_file = existing_files[0]
-                file_size = existing_file.stat().st_size if existing_file.exists() else 0
-                
-                # Обновляем статистику как будто сохранили
-                if is_inline:
-                    self.stats['saved_inline_images'] += 1
+            # 🆕 Контентно-адресуемое хранение: один файл на уникальное содержимое
+            staged = staged or self.attachment_store.stage(part)
+            if staged['file_size']:
+                blob = self.attachment_store.commit(staged, filename, message_id or thread_id, date_folder)
+                staged = None
+                blob_path = blob['blob_path']
+                file_size = blob['file_size']
+
+                if sniff and sender:
+                    # Одна и та же картинка у многих отправителей - подпись или баннер, запоминаем отпечаток
+                    self.junk_images.record_sighting(blob['sha256'], sender, sniff, blob_path)
+
+                if blob['duplicate']:
+                    self.logger.info(f"📁 ФАЙЛ УЖЕ СУЩЕСТВУЕТ: {filename} - sha256 {blob['sha256'][:12]}, ссылок: {blob['refcount']}")
+                    self.stats['deduplicated_attachments'] += 1
                 else:
-                    self.stats['saved_attachments'] += 1
-                
-                return {
-                    "original_filename": filename,
-                    "saved_filename": existing_file.name,
-                    "file_path": str(existing_file),
-                    "relative_path": f"attachments/{date_folder}/{existing_file.name}",
-                    "file_size": file_size,
-                    "file_type": SUPPORTED_ATTACHMENTS.get(Path(filename).suffix.lower(), 'unknown'),
-                    "content_type": content_type,
-                    "saved_at": self.get_local_time().isoformat(),
-                    "status": "already_exists",
-                    "is_inline": is_inline
-                }
-            
-            # Создаем безопасное имя файла
-            safe_filename = re.sub(r'[^\w\s\-\.]', '_', filename)
-            timestamp = self.get_local_time().strftime('%H%M%S')
-            
-            # 🆕 Префикс для встроенных изображений
-            prefix = "inline" if is_inline else "attach"
-            unique_filename = f"{thread_id}_{timestamp}_{prefix}_{safe_filename}"
-            
-            # Путь для сохранения
-            attachment_path = attachments_date_dir / unique_filename
-            
-            # Сохраняем файл
-            payload = part.get_payload(decode=True)
-            if payload:
-                with open(attachment_path, 'wb') as f:
-                    f.write(payload)
-                
-                file_size = len(payload)
-                self.logger.info(f"✅ Сохранено: {filename} ({file_size} байт)")
-                
+                    self.logger.info(f"✅ Сохранено: {filename} ({file_size} байт)")
+
                 # Обновляем статистику в зависимости от типа
                 if is_inline:
                     self.stats['saved_inline_images'] += 1
                 else:
                     self.stats['saved_attachments'] += 1
-                
+
                 return {
                     "original_filename": filename,
-                    "saved_filename": unique_filename,
-                    "file_path": str(attachment_path),
-                    "relative_path": f"attachments/{date_folder}/{unique_filename}",
+                    "saved_filename": blob_path.name,
+                    "file_path": str(blob_path),
+                    "relative_path": blob_path.relative_to(self.data_dir).as_posix(),
                     "file_size": file_size,
                     "file_type": SUPPORTED_ATTACHMENTS[file_ext],
                     "content_type": content_type,
+                    "sha256": blob['sha256'],
+                    "blob_date_folder": blob['first_date_folder'],
                     "saved_at": self.get_local_time().isoformat(),
                     "status": "saved",
+                    "deduplicated": blob['duplicate'],  # Содержимое уже было в хранилище - файл общий
                     "is_inline": is_inline
                 }
             
         except Exception as e:
             self.logger.error(f"❌ Ошибка сохранения {'встроенного изображения' if is_inline else 'вложения'} {filename}: {e}")
             return None
+        finally:
+            # Отклоненное или не сохраненное вложение не оставляет временных файлов
+            if staged is not None:
+                self.attachment_store.discard(staged)
         
         return None
 
-    def process_single_email(self, msg_id: bytes, date_str: str, email_num_in_day: int, total_emails_in_day: int, include_attachment_data: bool = False) -> Optional[Dict]:
-        """📧 ИСПРАВЛЕННАЯ ЛОГИКА: заголовки → фильтры → загрузка"""
+    def process_single_email(self, msg_id: bytes, date_str: str, email_num_in_day: int, total_emails_in_day: int, include_attachment_data: bool = False, metadata: Optional[Dict] = None) -> Optional[Dict]:
+        """📧 ИСПРАВЛЕННАЯ ЛОГИКА: заголовки → фильтры → загрузка
+
+        metadata - запись из fetch_metadata_batch; если передана, заголовки, размер
+        и структура берутся из неё без отдельных запросов к серверу
+        """
         
         # Инициализация ВСЕХ переменных в начале метода
         attachments = []
         attachments_stats = {
             'total': 0, 'saved': 0, 'excluded': 0, 'excluded_filenames': 0,
-            'excluded_by_size': 0, 'excluded_by_image_dimensions': 0,
+            'excluded_by_size': 0, 'excluded_by_image_dimensions': 0, 'excluded_by_fingerprint': 0,
             'unsupported': 0, 'inline_images': 0
         }
         body_text = ""
@@ -1379,18 +1873,20 @@ class AdvancedEmailFetcherV2:
         to_emails = []
         cc_emails = []
         raw_email = b""
+        raw_size = 0
         email_date_formatted = "неизвестная дата"
+        email_uid = metadata.get('uid') if metadata else None
 
         self.logger.info("_" * 70)
         self.stats['processed'] += 1
 
         try:
-            # ШАГ 1: Загружаем заголовки
-            headers_msg = self.get_email_headers_only(msg_id)
+            # ШАГ 1: Загружаем заголовки (или берем из пакетных метаданных)
+            headers_msg = metadata['headers'] if metadata else self.get_email_headers_only(msg_id)
             if not headers_msg:
                 self.logger.error(f"❌ Не удалось загрузить заголовки")
                 self.stats['errors'] += 1
-                self.save_skipped_email(msg_id, date_str, "failed_to_load_headers")  # ✅ ДОБАВИТЬ
+                self.save_skipped_email(msg_id, date_str, "failed_to_load_headers", uid=email_uid)  # ✅ ДОБАВИТЬ
                 return None
 
             # ШАГ 2: Извлекаем информацию из заголовков
@@ -1498,7 +1994,7 @@ class AdvancedEmailFetcherV2:
             self.logger.info(f"✅ Письмо прошло все фильтры, загружаем полностью...")
 
             # 📏 ПРОВЕРКА РАЗМЕРА ПИСЬМА
-            email_size = self.check_email_size(msg_id)
+            email_size = metadata['size'] if metadata else self.check_email_size(msg_id)
 
             if email_size == -1:
                 if self.enable_size_logging:
@@ -1507,10 +2003,10 @@ class AdvancedEmailFetcherV2:
             elif email_size > 100_000_000:  # 100MB
                 self.logger.warning(f"⚠️ Очень большое письмо ({email_size} байт), пропускаем")
                 self.stats['skipped_large_emails'] += 1
-                self.save_skipped_email(msg_id, date_str, f"large_email_{email_size}_bytes")
+                self.save_skipped_email(msg_id, date_str, f"large_email_{email_size}_bytes", uid=email_uid)
                 return None
                 
-            elif email_size > 20_000_000:  # 20MB
+            elif email_size > LARGE_EMAIL_SIZE:  # 20MB
                 if self.enable_size_logging:
                     self.logger.info(f"📏 Большое письмо ({email_size} байт), обрабатываем осторожно")
             else:
@@ -1518,7 +2014,14 @@ class AdvancedEmailFetcherV2:
                     self.logger.info(f"📊 Нормальный размер письма: {email_size} байт")
 
             # ШАГ 4: Анализ структуры
-            structure_info = self.analyze_bodystructure(msg_id)
+            if metadata:
+                structure_info = {
+                    'has_large_attachments': self.detect_large_attachments_from_structure(metadata['structure']),
+                    'structure': metadata['structure'],
+                    'bodystructure': metadata.get('bodystructure')
+                }
+            else:
+                structure_info = self.analyze_bodystructure(msg_id)
 
             # ✅ УЛУЧШЕННАЯ ЛОГИКА: учитываем реальный размер письма
             if email_size != -1 and email_size < 50_000_000:  # 50MB
@@ -1541,11 +2044,19 @@ class AdvancedEmailFetcherV2:
             emails_date_dir.mkdir(exist_ok=True)
 
             # ШАГ 5: УМНАЯ ЗАГРУЗКА
-            if has_large_attachments:
+            # 🆕 Выборочная загрузка: только текст и вложения, которые пройдут фильтры
+            part_tree = self.get_structure_parts(structure_info)
+            if part_tree is not None:
+                selected_parts = self.select_parts_to_fetch(part_tree, email_check['attachments_exist'], has_large_attachments)
+                msg = self.fetch_selected_parts(msg_id, headers_msg, part_tree, selected_parts)
+                if msg is None:
+                    self.logger.warning(f"⚠️ Выборочная загрузка не удалась, загружаем письмо целиком")
+
+            if msg is None and has_large_attachments:
                 self.logger.warning(f"⚠️ Обнаружены большие вложения, загружаем без них...")
                 msg = headers_msg
                 try:
-                    status, text_data = self.mail.fetch(msg_id, '(BODY.PEEK[1])')
+                    status, text_data = self.imap_fetch(msg_id, '(BODY.PEEK[1])')
                     if status == 'OK' and text_data:
                         raw_text = self.extract_raw_email(text_data)
                         if raw_text:
@@ -1562,46 +2073,44 @@ class AdvancedEmailFetcherV2:
                 self.stats['skipped_large_emails'] += 1
 
             else:
-                fetch_data = self.safe_fetch(msg_id)
-                if not fetch_data:
-                    self.logger.error(f"❌ Не удалось загрузить письмо")
-                    self.stats['errors'] += 1
-                    self.save_skipped_email(msg_id, date_str, "failed_to_fetch")  # ✅ ДОБАВИТЬ
-                    return None
+                if msg is None:
+                    fetch_data = self.safe_fetch(msg_id)
+                    if not fetch_data:
+                        self.logger.error(f"❌ Не удалось загрузить письмо")
+                        self.stats['errors'] += 1
+                        self.save_skipped_email(msg_id, date_str, "failed_to_fetch", uid=email_uid)  # ✅ ДОБАВИТЬ
+                        return None
+
+                    raw_email = self.extract_raw_email(fetch_data)
+                    if not raw_email:
+                        self.logger.error(f"❌ Не удалось извлечь сырой байтовый поток письма")
+                        self.stats['errors'] += 1
+                        self.save_skipped_email(msg_id, date_str, "failed_to_extract_raw", uid=email_uid)  # ✅ ДОБАВИТЬ
+                        return None
 
-                raw_email = self.extract_raw_email(fetch_data)
-                if not raw_email:
-                    self.logger.error(f"❌ Не удалось извлечь сырой байтовый поток письма")
-                    self.stats['errors'] += 1
-                    self.save_skipped_email(msg_id, date_str, "failed_to_extract_raw")  # ✅ ДОБАВИТЬ
-                    return None
+                    try:
+                        msg = email.message_from_bytes(raw_email)
+                    except Exception as e:
+                        self.logger.error(f"❌ Ошибка парсинга email: {e}")
+                        self.stats['errors'] += 1
+                        self.save_skipped_email(msg_id, date_str, f"parsing_error_{type(e).__name__}", uid=email_uid)  # ✅ ДОБАВИТЬ
+                        return None
 
-                try:
-                    msg = email.message_from_bytes(raw_email)
-                except Exception as e:
-                    self.logger.error(f"❌ Ошибка парсинга email: {e}")
-                    self.stats['errors'] += 1
-                    self.save_skipped_email(msg_id, date_str, f"parsing_error_{type(e).__name__}")  # ✅ ДОБАВИТЬ
-                    return None
+                    # Дерево письма построено - сырые байты больше не держим в памяти
+                    raw_size = len(raw_email)
+                    raw_email = b""
+                    fetch_data = None
+
+                # Один проход по дереву: тело письма и части-вложения сразу
+                mime = walk_message(msg, self.logger)
 
                 try:
-                    body_text = self.extract_plain_text(msg, include_attachment_data)
+                    body_text = mime.body_text
                     # ИСПРАВЛЕНИЕ: более точное определение наличия тела письма
                     if not body_text or len(body_text.strip()) <= 10:
-                        # Дополнительная проверка на текстовый контент
-                        text_content_found = False
-                        for part in msg.walk():
-                            content_disposition = part.get_content_disposition()
-                            if content_disposition not in ['attachment', 'inline']:
-                                ctype = part.get_content_type()
-                                if ctype in ('text/plain', 'text/html'):
-                                    payload = part.get_payload(decode=True)
-                                    if payload and len(payload.strip()) > 10:
-                                        text_content_found = True
-                                        body_text = payload.decode('utf-8', errors='ignore')
-                                        break
-                        
-                        if text_content_found:
+                        # Текст мог целиком уйти с разметкой - берем сырую текстовую часть
+                        if mime.fallback_text is not None:
+                            body_text = mime.fallback_text
                             self.logger.info("📄 Тело письма обнаружено после дополнительной проверки")
                         else:
                             self.logger.info("📄 Тело письма действительно отсутствует")
@@ -1616,54 +2125,34 @@ class AdvancedEmailFetcherV2:
                 self.logger.info("🔍 Обработка вложений...")
                 try:
                     if msg.is_multipart():
-                        # Счетчики для диагностики
-                        real_attachments = []
-                        inline_images = []
-                        
-                        for part_num, part in enumerate(msg.walk()):
+                        # ИСПРАВЛЕНИЕ: строгое разделение attachment vs inline (классификация в walk_message)
+                        real_attachments = mime.attachments
+                        inline_images = mime.inline_images
+
+                        # Обрабатываем только настоящие вложения
+                        for part_num, part in enumerate(real_attachments if not email_check['attachments_exist'] else []):
                             try:
-                                content_disposition = part.get_content_disposition()
-                                content_type = part.get_content_type()
-                                filename = part.get_filename()
-
-                                # ИСПРАВЛЕНИЕ: строгое разделение attachment vs inline
-                                is_real_attachment = False
-                                is_inline_image = False
-
-                                if content_disposition == 'attachment':
-                                    # Настоящее вложение
-                                    is_real_attachment = True
-                                    real_attachments.append(part)
-                                elif content_disposition == 'inline' and content_type.startswith('image/') and filename:
-                                    # Inline изображение с именем файла
-                                    is_inline_image = True
-                                    inline_images.append(part)
-                                elif not content_disposition and filename and content_type.startswith('image/'):
-                                    # Изображение без явного disposition, но с именем
-                                    is_real_attachment = True
-                                    real_attachments.append(part)
-
-                                # Обрабатываем только настоящие вложения
-                                if is_real_attachment and not email_check['attachments_exist']:
-                                    attachments_stats['total'] += 1
-                                    attachment_info = self.save_attachment_or_inline(part, thread_id, date_folder, is_inline=False)
-
-                                    if attachment_info:
-                                        attachments.append(attachment_info)
-                                        status = attachment_info.get('status', 'unknown')
-                                        if status == 'saved':
-                                            attachments_stats['saved'] += 1
-                                        elif status == 'excluded':
-                                            attachments_stats['excluded'] += 1
-                                        elif status == 'excluded_filename':
-                                            attachments_stats['excluded_filenames'] += 1
-                                        elif status == 'excluded_by_size':
-                                            attachments_stats['excluded_by_size'] += 1
-                                        elif status == 'unsupported':
-                                            attachments_stats['unsupported'] += 1
+                                attachments_stats['total'] += 1
+                                attachment_info = self.save_attachment_or_inline(part, thread_id, date_folder, is_inline=False, message_id=message_id, sender=email.utils.parseaddr(from_addr)[1])
+
+                                if attachment_info:
+                                    attachments.append(attachment_info)
+                                    status = attachment_info.get('status', 'unknown')
+                                    if status == 'saved':
+                                        attachments_stats['saved'] += 1
+                                    elif status == 'excluded':
+                                        attachments_stats['excluded'] += 1
+                                    elif status == 'excluded_filename':
+                                        attachments_stats['excluded_filenames'] += 1
+                                    elif status == 'excluded_by_size':
+                                        attachments_stats['excluded_by_size'] += 1
+                                    elif status == 'excluded_by_fingerprint':
+                                        attachments_stats['excluded_by_fingerprint'] += 1
+                                    elif status == 'unsupported':
+                                        attachments_stats['unsupported'] += 1
 
                             except Exception as e:
-                                self.logger.warning(f"⚠️ Ошибка обработки части {part_num}: {e}")
+                                self.logger.warning(f"⚠️ Ошибка обработки вложения {part_num}: {e}")
                                 continue
 
                         # Логирование результатов
@@ -1681,6 +2170,8 @@ class AdvancedEmailFetcherV2:
             email_data = {
                 "thread_id": thread_id,
                 "message_id": headers_msg.get('Message-ID', ''),
+                "in_reply_to": ' '.join(parse_message_ids(headers_msg.get('In-Reply-To', ''))),
+                "references": parse_message_ids(headers_msg.get('References', '')),
                 "from": from_addr,
                 "to": to_addr,
                 "cc": cc_addr,
@@ -1694,24 +2185,41 @@ class AdvancedEmailFetcherV2:
                 "attachments": attachments,
                 "attachments_stats": attachments_stats,
                 "processed_at": self.get_local_time().isoformat(),
-                "raw_size": len(raw_email) if raw_email else 0,
-                "date_folder": date_folder
+                "raw_size": raw_size if raw_size else max(email_size, 0),
+                "date_folder": date_folder,
+                "uid": metadata.get('uid') if metadata else (int(msg_id) if self.use_uid else None),
+                "account": self.source.account if self.source else IMAP_USER,
+                "folder": self.mailbox,
+                "mailbox_key": self.get_mailbox_key()
             }
+            email_data["uidvalidity"] = self.current_uidvalidity() if email_data['uid'] is not None else None
 
             # Сохраняем письмо
             try:
                 email_filename = f"email_{email_num_in_day:03d}_{date_folder.replace('-', '')}_{thread_id}.json"
-                email_path = emails_date_dir / email_filename
+                email_path = self.email_store.locator(date_folder, email_filename)
 
-                with open(email_path, 'w', encoding='utf-8') as f:
-                    json.dump(email_data, f, ensure_ascii=False, indent=2)
+                email_data.update(self.conversation_index.add(
+                    message_id, email_data['in_reply_to'], email_data['references'], str(email_path), date_folder,
+                    subject, from_addr, email_data['parsed_date'] or ''
+                ))
+
+                self.email_store.save(date_folder, email_filename, email_data)
+                self.email_manifest.record(date_folder, email_filename, email_data)
 
                 self.logger.info(f"✅ Сохранено: {email_filename}")
 
+                self.message_index.upsert(
+                    message_id, str(email_path), date_folder,
+                    has_body=bool(body_text and body_text.strip()),
+                    attachment_paths=[att['file_path'] for att in attachments if att.get('file_path')],
+                    uid=email_data['uid'], mailbox=email_data['mailbox_key'], uidvalidity=email_data['uidvalidity']
+                )
+
             except Exception as e:
                 self.logger.error(f"❌ Ошибка сохранения письма: {e}")
                 self.stats['errors'] += 1
-                self.save_skipped_email(msg_id, date_str, f"save_error_{type(e).__name__}")  # ✅ ДОБАВИТЬ
+                self.save_skipped_email(msg_id, date_str, f"save_error_{type(e).__name__}", uid=email_uid)  # ✅ ДОБАВИТЬ
                 return None
 
             # ИСПРАВЛЕНИЕ: корректное определение наличия компонентов
@@ -1746,7 +2254,7 @@ class AdvancedEmailFetcherV2:
             self.stats['errors'] += 1
             
             # ✅ ДОБАВИТЬ: Сохраняем письмо для повторной обработки
-            self.save_skipped_email(msg_id, date_str, f"critical_error_{type(e).__name__}")
+            self.save_skipped_email(msg_id, date_str, f"critical_error_{type(e).__name__}", uid=email_uid)
             
             return None
 
@@ -1779,61 +2287,555 @@ class AdvancedEmailFetcherV2:
         self.logger.info(f"   🚀 НОВАЯ ЛОГИКА: заголовки → фильтры → загрузка")
         self.logger.info("-" * 70)
 
-        if not self.connect():
-            self.logger.error(f"❌ Не удалось подключиться к серверу")
-            return []
-
         all_emails = []
-        current_date = start_date
-        processed_emails_total = 0
         total_saved = 0
 
-        while current_date <= end_date:
-            date_imap = current_date.strftime('%d-%b-%Y')
-            date_display = current_date.strftime('%Y-%m-%d')
+        # 🏊 Пул сессий: дни и письма распределяются между соединениями. Письма адресуются
+        # по UID: номера сдвигаются, если между поиском и загрузкой другая сессия сделала EXPUNGE
+        self.use_uid = True
+        pool = self.pool_factory(self, self.pool_size)
 
-            self.logger.info("=" * 70)
-            self.logger.info(f"📬 Обработка {date_display}...")
+        try:
+            if not pool.open():
+                self.logger.error(f"❌ Не удалось подключиться к серверу")
+                return []
+
+            # ЭТАП 0: CONDSTORE - при повторном прогоне нужны только письма, измененные после прошлого
+            uid_state, changed_since = self.open_change_window(pool, start_date, end_date)
+
+            # ЭТАП 1: один поиск SINCE/BEFORE на весь период и пакетные метаданные
+            msg_ids, metadata_by_id, scanned = self.scan_range(pool, start_date, end_date, changed_since)
+
+            # ЭТАП 2: раскладка по папкам дней (UTC+7) и обработка порциями на свободных сессиях
+            buckets = self.build_range_buckets(start_date, end_date, msg_ids, metadata_by_id,
+                                               continue_numbering=bool(changed_since))
+            chunk_errors = self.chunk_errors
+            all_emails = self.process_day_buckets(pool, buckets, metadata_by_id)
+            total_saved = len(all_emails)
+
+            # MODSEQ периода сохраняется только после полного прохода: иначе следующий
+            # прогон с MODSEQ пропустил бы письма, которые в этот раз не обработаны
+            if scanned and self.chunk_errors == chunk_errors:
+                self.save_range_modseq(uid_state, start_date, end_date)
+            elif uid_state and uid_state.get('highestmodseq'):
+                self.logger.warning("⚠️ Период обработан не полностью, MODSEQ не сохранен - следующий прогон просканирует его целиком")
+
+        finally:
+            pool.close()
+            self.use_uid = False
 
-            criteria = f'(ON "{date_imap}")'
-            msg_ids = self.safe_search(criteria)
+        self.logger.info("=" * 70)
+        self.logger.info(f"🎯 ОБЩИЙ ИТОГ ЗА ВСЕ ДНИ: сохранено {total_saved} писем")
+        self.save_processing_stats(start_date, end_date)
+        self.print_final_stats()
 
-            if len(msg_ids) > 0:
-                self.logger.info(f"   Найдено писем: {len(msg_ids)}")
-                saved_today = 0
+        # ✅ ДОБАВИТЬ ПОВТОРНУЮ ОБРАБОТКУ
+        self.retry_skipped_emails()
+
+        return all_emails
 
-                for day_email_num, msg_id in enumerate(msg_ids, 1):
-                    if processed_emails_total > 0 and processed_emails_total % BATCH_SIZE == 0:
-                        self.logger.info(f"🔄 Профилактическое переподключение...")
-                        if not self.connect():
-                            continue
+    def run_pool_tasks(self, pool: 'ImapConnectionPool', func, tasks: List[tuple], max_workers: Optional[int] = None) -> List:
+        """⚙️ Выполнение задач на сессиях пула (в потоках, если сессий больше одной)
 
-                    email_data = self.process_single_email(msg_id, date_display, day_email_num, len(msg_ids), include_attachment_data=False)
+        max_workers ограничивает, сколько сессий задачи занимают одновременно.
+        """
+        max_workers = min(max_workers or len(pool.workers), len(pool.workers))
+        if max_workers <= 1:
+            return [func(*task) for task in tasks]
 
-                    if email_data:
-                        all_emails.append(email_data)
-                        saved_today += 1
-                        total_saved += 1
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='imap') as executor:
+            futures = [executor.submit(func, *task) for task in tasks]
+            return [future.result() for future in futures]
 
-                    processed_emails_total += 1
+    def is_large_email(self, metadata: Optional[Dict]) -> bool:
+        """🐘 Большое письмо по RFC822.SIZE из пакетных метаданных (без метаданных размер неизвестен)"""
+        return bool(metadata) and metadata.get('size', -1) > LARGE_EMAIL_SIZE
+
+    def process_day_buckets(self, pool: 'ImapConnectionPool', buckets: List[tuple], metadata_by_id: Dict[bytes, Dict]) -> List[Dict]:
+        """📬 Обработка писем, разложенных по дням: (дата, [(номер_в_дне, msg_id)], всего_в_дне)
+
+        Мелкие письма идут быстрой полосой порциями по WORKER_CHUNK_SIZE, большие
+        (RFC822.SIZE > LARGE_EMAIL_SIZE) - по одному в отдельной полосе, которая
+        занимает не больше LARGE_LANE_WORKERS сессий и не задерживает остальные дни.
+        """
+        fast_tasks = []
+        large_tasks = []
+        for date_display, numbered, total_in_day in buckets:
+            self.logger.info("=" * 70)
+            self.logger.info(f"📬 Обработка {date_display}...")
 
-                self.logger.info(f"📊 Итого сохранено писем за {date_display}: {saved_today}")
+            if numbered:
+                self.logger.info(f"   Найдено писем: {len(numbered)}")
+                small = [item for item in numbered if not self.is_large_email(metadata_by_id.get(item[1]))]
+                large = [item for item in numbered if self.is_large_email(metadata_by_id.get(item[1]))]
+                for i in range(0, len(small), WORKER_CHUNK_SIZE):
+                    fast_tasks.append((pool, date_display, small[i:i + WORKER_CHUNK_SIZE], total_in_day, metadata_by_id, 'fast'))
+                if large:
+                    self.logger.info(f"   🐘 Больших писем (> {LARGE_EMAIL_SIZE // 1_000_000} МБ): {len(large)}, отдельная полоса")
+                    large_tasks += [(pool, date_display, [item], total_in_day, metadata_by_id, 'large') for item in large]
             else:
                 self.logger.info(f"📭 Писем не найдено")
 
+        large_workers = max(1, min(LARGE_LANE_WORKERS, len(pool.workers) - 1))
+        if large_tasks and fast_tasks and len(pool.workers) > 1:
+            # Полосы работают одновременно: большая держит не больше large_workers сессий
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='large-lane') as lane:
+                large_future = lane.submit(self.run_lane, pool, 'large', large_tasks, large_workers)
+                fast_results = self.run_lane(pool, 'fast', fast_tasks)
+                large_results = large_future.result()
+        else:
+            fast_results = self.run_lane(pool, 'fast', fast_tasks)
+            large_results = self.run_lane(pool, 'large', large_tasks, large_workers)
+
+        chunk_tasks = fast_tasks + large_tasks
+        chunk_results = fast_results + large_results
+
+        all_emails = []
+        saved_by_day = {}
+        for task, results in zip(chunk_tasks, chunk_results):
+            date_display = task[1]
+            saved_by_day[date_display] = saved_by_day.get(date_display, 0) + len(results)
+            all_emails.extend(results)
+
+        for date_display, numbered, _ in buckets:
+            if numbered:
+                self.logger.info(f"📊 Итого сохранено писем за {date_display}: {saved_by_day.get(date_display, 0)}")
+
+        return all_emails
+
+    def open_change_window(self, pool: 'ImapConnectionPool', start_date: datetime,
+                           end_date: datetime) -> Tuple[Optional[Dict[str, int]], int]:
+        """🔁 Состояние папки и MODSEQ прошлого прогона периода (CONDSTORE/QRESYNC)
+
+        Если все дни периода уже сканировались, поиск ограничивается письмами с
+        MODSEQ новее прошлого прогона, а удаленные с тех пор UID (QRESYNC) отмечаются
+        в индексе. Без расширений возвращает (None, 0) - период сканируется целиком.
+        """
+        try:
+            with pool.session() as worker:
+                if not worker.supports_condstore():
+                    return None, 0
+                uid_state = worker.get_mailbox_uid_state()
+                changed_since = self.range_changed_since(uid_state, start_date, end_date)
+                if changed_since:
+                    self.logger.info(f"🔁 CONDSTORE: только изменения после MODSEQ {changed_since} "
+                                     f"(HIGHESTMODSEQ {uid_state['highestmodseq']})")
+                    self.mark_vanished(worker.fetch_vanished(changed_since), uid_state['uidvalidity'])
+                return uid_state, changed_since
+        except Exception as e:
+            self.logger.warning(f"⚠️ CONDSTORE недоступен ({e}), полное сканирование периода")
+            return None, 0
+
+    def scan_range(self, pool: 'ImapConnectionPool', start_date: datetime, end_date: datetime,
+                   changed_since: int = 0) -> Tuple[List[bytes], Dict[bytes, Dict], bool]:
+        """🔍 Один SEARCH SINCE/BEFORE на весь период и метаданные порциями на сессиях пула
+
+        changed_since - только письма с MODSEQ больше этого значения (CONDSTORE).
+        Третье значение - False, если поиск не удался (список писем тогда пуст).
+        """
+        since = start_date.strftime('%d-%b-%Y')
+        before = (end_date + timedelta(days=1)).strftime('%d-%b-%Y')
+        modseq = f' MODSEQ {changed_since + 1}' if changed_since else ''
+
+        try:
+            with pool.session() as worker:
+                worker.current_uidvalidity()  # для ключей очереди повторов
+                _all_ids, msg_ids = worker.search_with_server_filters(f'(SINCE "{since}" BEFORE "{before}"{modseq})', strict=True)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка поиска писем за период {since} - {before}: {e}")
+            return [], {}, False
+
+        self.logger.info(f"🔍 Найдено писем за период: {len(msg_ids)}" + (" (измененных)" if changed_since else ""))
+        chunks = [(pool, msg_ids[i:i + METADATA_BATCH_SIZE]) for i in range(0, len(msg_ids), METADATA_BATCH_SIZE)]
+        metadata_by_id: Dict[bytes, Dict] = {}
+        for chunk_metadata in self.run_pool_tasks(pool, self.fetch_metadata_chunk, chunks):
+            metadata_by_id.update(chunk_metadata)
+        return msg_ids, metadata_by_id, True
+
+    def fetch_metadata_chunk(self, pool: 'ImapConnectionPool', msg_ids: List[bytes]) -> Dict[bytes, Dict]:
+        """📦 Пакет метаданных на свободной сессии пула"""
+        try:
+            with pool.session() as worker:
+                return worker.fetch_metadata_batch(msg_ids)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка пакетной загрузки метаданных: {e}")
+            return {}
+
+    def build_range_buckets(self, start_date: datetime, end_date: datetime, msg_ids: List[bytes],
+                            metadata_by_id: Dict[bytes, Dict], continue_numbering: bool = False) -> List[tuple]:
+        """🗂️ Письма периода по дням: (дата, [(номер_в_дне, msg_id)], всего_в_дне)
+
+        Каждый день периода получает свой отчет (в том числе пустой) и нумерацию с 1
+        (continue_numbering - после уже сохраненных писем дня, для выборки изменений).
+        SEARCH работает по дате сервера, поэтому письмо может попасть в папку за
+        границей периода - такие папки продолжают уже существующую нумерацию.
+        Письма без метаданных идут в конец первого дня: их дату определит
+        process_single_email по заголовкам.
+        """
+        by_folder = self.bucket_by_date_folder(msg_ids, metadata_by_id)
+        buckets = []
+
+        current_date = start_date
+        while current_date <= end_date:
+            date_display = current_date.strftime('%Y-%m-%d')
+            day_ids = by_folder.pop(date_display, [])
+            first_num = self.next_email_number(date_display) if continue_numbering and day_ids else 1
+            buckets.append((date_display, list(enumerate(day_ids, first_num)), first_num + len(day_ids) - 1))
+            current_date += timedelta(days=1)
+
+        for date_folder, day_ids in by_folder.items():
+            first_num = self.next_email_number(date_folder)
+            buckets.append((date_folder, list(enumerate(day_ids, first_num)), first_num + len(day_ids) - 1))
+
+        missing = [msg_id for msg_id in msg_ids if msg_id not in metadata_by_id]
+        if missing and buckets:
+            date_display, numbered, total = buckets[0]
+            numbered += list(enumerate(missing, total + 1))
+            buckets[0] = (date_display, numbered, total + len(missing))
+
+        return sorted(buckets, key=lambda bucket: bucket[0])
+
+    def run_lane(self, pool: 'ImapConnectionPool', lane: str, tasks: List[tuple], max_workers: Optional[int] = None) -> List:
+        """🛣️ Задачи одной полосы на сессиях пула с учетом ее пропускной способности"""
+        if not tasks:
+            return []
+        started = time.perf_counter()
+        results = self.run_pool_tasks(pool, self.process_email_chunk, tasks, max_workers)
+        elapsed = time.perf_counter() - started
+
+        metadata_by_id = tasks[0][4]
+        lane_stats = self.lane_stats[lane]
+        lane_stats['messages'] += sum(len(task[2]) for task in tasks)
+        lane_stats['saved'] += sum(len(chunk_results) for chunk_results in results)
+        lane_stats['bytes'] += sum(max(0, (metadata_by_id.get(msg_id) or {}).get('size', 0))
+                                   for task in tasks for _num, msg_id in task[2])
+        lane_stats['seconds'] += elapsed
+        self.logger.info(f"🛣️ Полоса {lane}: {self.format_lane_stats(lane)}")
+        return results
+
+    def format_lane_stats(self, lane: str) -> str:
+        """📈 Пропускная способность полосы для лога"""
+        lane_stats = self.lane_stats[lane]
+        seconds = lane_stats['seconds'] or 1e-9
+        return (f"писем {lane_stats['messages']}, сохранено {lane_stats['saved']}, "
+                f"{lane_stats['bytes'] / 1024 / 1024:.1f} МБ за {lane_stats['seconds']:.1f} с "
+                f"({lane_stats['messages'] / seconds:.2f} писем/с, {lane_stats['bytes'] / 1024 / 1024 / seconds:.2f} МБ/с)")
+
+    def lane_report(self) -> Dict[str, Dict[str, float]]:
+        """📋 Счетчики полос с пропускной способностью для processing_stats_*.json"""
+        report = {}
+        for lane, lane_stats in self.lane_stats.items():
+            seconds = lane_stats['seconds']
+            report[lane] = dict(lane_stats,
+                                seconds=round(seconds, 3),
+                                messages_per_s=round(lane_stats['messages'] / seconds, 3) if seconds else 0.0,
+                                mb_per_s=round(lane_stats['bytes'] / 1024 / 1024 / seconds, 3) if seconds else 0.0)
+        return report
+
+    def process_email_chunk(self, pool: 'ImapConnectionPool', date_display: str, chunk: List[tuple],
+                            total_emails_in_day: int, metadata_by_id: Dict[bytes, Dict], lane: str = 'fast') -> List[Dict]:
+        """📨 Обработка порции писем одного дня на сессии из пула (lane='large' - длинные дедлайны)"""
+        results = []
+        with pool.session() as worker:
+            worker.large_lane = lane == 'large'
+            worker.apply_lane_timeout()
+            try:
+                for day_email_num, msg_id in chunk:
+                    try:
+                        with worker.imap_metrics.local_stage('process_message'):
+                            email_data = worker.process_single_email(msg_id, date_display, day_email_num, total_emails_in_day,
+                                                                     include_attachment_data=False,
+                                                                     metadata=metadata_by_id.get(msg_id))
+                        if email_data:
+                            results.append(email_data)
+                    except Exception as e:
+                        self.logger.error(f"❌ Ошибка обработки письма {day_email_num} за {date_display}: {e}")
+                        with self._queue_lock:
+                            self.chunk_errors += 1
+                        worker.save_skipped_email(msg_id, date_display, f"chunk_error_{type(e).__name__}")
+            finally:
+                worker.large_lane = False
+                worker.apply_lane_timeout()
+        return results
+
+    def get_mailbox_key(self) -> str:
+        """🔑 Ключ чекпоинта синхронизации: учетная запись + папка"""
+        if self.source is not None:
+            return self.source.key
+        return f"{IMAP_USER}@{IMAP_SERVER}/{self.mailbox}"
+
+    def get_mailbox_uid_state(self) -> Optional[Dict[str, int]]:
+        """🔢 UIDVALIDITY, UIDNEXT и HIGHESTMODSEQ (0 без CONDSTORE) выбранной папки"""
+        try:
+            items = '(UIDVALIDITY UIDNEXT HIGHESTMODSEQ)' if self.supports_condstore() else '(UIDVALIDITY UIDNEXT)'
+            status, data = self.imap_metrics.call('STATUS', self.mail.status, encode_mailbox_name(self.mailbox), items)
+            if status != 'OK' or not data:
+                raise Exception(f"IMAP status returned: {status}")
+
+            text = data[0].decode('utf-8', errors='ignore') if isinstance(data[0], bytes) else str(data[0])
+            validity_match = re.search(r'UIDVALIDITY (\d+)', text)
+            uidnext_match = re.search(r'UIDNEXT (\d+)', text)
+            modseq_match = re.search(r'HIGHESTMODSEQ (\d+)', text)
+            if not validity_match:
+                self.logger.error(f"❌ Сервер не вернул UIDVALIDITY: {text}")
+                return None
+
+            self.uidvalidity_cache[self.get_mailbox_key()] = int(validity_match.group(1))
+            return {
+                'uidvalidity': int(validity_match.group(1)),
+                'uidnext': int(uidnext_match.group(1)) if uidnext_match else 0,
+                'highestmodseq': int(modseq_match.group(1)) if modseq_match else 0
+            }
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка получения UIDVALIDITY: {e}")
+            return None
+
+    def load_sync_state(self) -> Dict[str, dict]:
+        """📋 Загрузка чекпоинтов синхронизации"""
+        if self.sync_state_path.exists():
+            try:
+                with open(self.sync_state_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Ошибка чтения чекпоинтов синхронизации: {e}")
+        return {}
+
+    def update_sync_state(self, **fields):
+        """💾 Обновление полей чекпоинта текущей папки (остальные поля сохраняются)"""
+        with self._queue_lock:
+            state = self.load_sync_state()
+            entry = state.setdefault(self.get_mailbox_key(), {})
+            entry.update(fields, updated_at=self.get_local_time().isoformat())
+            tmp_path = self.sync_state_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.sync_state_path)
+
+    def save_sync_checkpoint(self, uidvalidity: int, last_uid: int, highestmodseq: int = 0):
+        """💾 Сохранение чекпоинта UIDVALIDITY + последний обработанный UID (+ HIGHESTMODSEQ)"""
+        self.update_sync_state(uidvalidity=uidvalidity, last_uid=last_uid, highestmodseq=highestmodseq)
+        self.logger.info(f"💾 Чекпоинт {self.get_mailbox_key()}: UIDVALIDITY={uidvalidity}, последний UID={last_uid}" +
+                         (f", HIGHESTMODSEQ={highestmodseq}" if highestmodseq else ""))
+
+    def range_changed_since(self, uid_state: Optional[Dict[str, int]], start_date: datetime, end_date: datetime) -> int:
+        """🔁 MODSEQ, после которого искать изменения периода (0 - нужен полный поиск)
+
+        Каждый день периода должен быть уже просканирован при том же UIDVALIDITY;
+        берется самый ранний MODSEQ среди дней.
+        """
+        if not uid_state or not uid_state.get('highestmodseq'):
+            return 0
+        days_state = self.load_sync_state().get(self.get_mailbox_key(), {}).get('modseq_days', {})
+        if days_state.get('uidvalidity') != uid_state['uidvalidity']:
+            return 0
+        seen = days_state.get('days', {})
+        modseqs = []
+        current_date = start_date
+        while current_date <= end_date:
+            modseq = seen.get(current_date.strftime('%Y-%m-%d'))
+            if not modseq:
+                return 0
+            modseqs.append(modseq)
             current_date += timedelta(days=1)
-            time.sleep(0.1)
+        return min(modseqs)
+
+    def save_range_modseq(self, uid_state: Optional[Dict[str, int]], start_date: datetime, end_date: datetime):
+        """💾 HIGHESTMODSEQ на момент поиска для каждого дня просканированного периода"""
+        if not uid_state or not uid_state.get('highestmodseq'):
+            return
+        with self._queue_lock:
+            days_state = self.load_sync_state().get(self.get_mailbox_key(), {}).get('modseq_days', {})
+            seen = days_state.get('days', {}) if days_state.get('uidvalidity') == uid_state['uidvalidity'] else {}
+            current_date = start_date
+            while current_date <= end_date:
+                seen[current_date.strftime('%Y-%m-%d')] = uid_state['highestmodseq']
+                current_date += timedelta(days=1)
+            self.update_sync_state(modseq_days={'uidvalidity': uid_state['uidvalidity'], 'days': seen})
+
+    def has_saved_emails(self) -> bool:
+        """📂 Есть ли уже сохраненные письма (отдельные JSON-файлы или записи сегментов)"""
+        return any(self.emails_dir.glob("*/email_*.json")) or any(self.emails_dir.glob("*/emails.jsonl.*"))
+
+    def next_email_number(self, date_folder: str) -> int:
+        """🔢 Следующий свободный номер письма в папке дня"""
+        max_num = 0
+        for name in self.email_store.names(date_folder):
+            parts = name.split('_')
+            if len(parts) > 1 and parts[1].isdigit():
+                max_num = max(max_num, int(parts[1]))
+        return max_num + 1
+
+    def bucket_by_date_folder(self, msg_ids: List[bytes], metadata_by_id: Dict[bytes, Dict]) -> Dict[str, List[bytes]]:
+        """🗂️ Раскладка писем по папкам дней (UTC+7) по заголовку Date из метаданных (или INTERNALDATE)"""
+        buckets: Dict[str, List[bytes]] = {}
+        for msg_id in msg_ids:
+            record = metadata_by_id.get(msg_id)
+            if not record:
+                continue
+            date_folder = self.metadata_date(record).strftime('%Y-%m-%d')
+            buckets.setdefault(date_folder, []).append(msg_id)
+        return dict(sorted(buckets.items()))
+
+    def metadata_date(self, record: Dict) -> datetime:
+        """📅 Дата письма (UTC+7) из метаданных: заголовок Date, без него - INTERNALDATE сервера"""
+        date_header = record['headers'].get('Date', '')
+        if not date_header and record.get('internaldate'):
+            try:
+                return datetime.strptime(record['internaldate'], '%d-%b-%Y %H:%M:%S %z').astimezone(LOCAL_TIMEZONE)
+            except ValueError:
+                pass
+        return self.parse_email_date(date_header)
+
+    def sync_new_emails(self, single_session: bool = False, report: bool = True) -> List[Dict]:
+        """🔄 Инкрементальная синхронизация: только UID больше сохраненного чекпоинта
+
+        Полное пересканирование папки выполняется только при смене UIDVALIDITY
+        (или при первом запуске без чекпоинта). С QRESYNC письма, удаленные после
+        прошлого чекпоинта (VANISHED), отмечаются в индексе.
+
+        single_session - без пула, на уже открытой сессии парсера (небольшие
+        порции демона); report=False - без файла статистики, итогов и повтора
+        очереди (демон делает это по таймеру и при остановке).
+        """
+        self.logger.info(f"🔄 ИНКРЕМЕНТАЛЬНАЯ СИНХРОНИЗАЦИЯ ПО UID: {self.get_mailbox_key()}")
+        self.logger.info("-" * 70)
+
+        all_emails = []
+        self.use_uid = True
+        pool = ImapConnectionPool(self, 1) if single_session else self.pool_factory(self, self.pool_size)
+
+        try:
+            if not pool.open():
+                self.logger.error(f"❌ Не удалось подключиться к серверу")
+                return []
+
+            with pool.session() as worker:
+                uid_state = worker.get_mailbox_uid_state()
+                if not uid_state:
+                    return []
+
+                checkpoint = self.load_sync_state().get(self.get_mailbox_key())
+                last_uid = 0
+                if not checkpoint:
+                    self.logger.info("📋 Чекпоинт не найден, полное сканирование папки")
+                elif checkpoint.get('uidvalidity') != uid_state['uidvalidity']:
+                    self.logger.warning(f"⚠️ UIDVALIDITY изменился ({checkpoint.get('uidvalidity')} → {uid_state['uidvalidity']}), полное пересканирование")
+                else:
+                    last_uid = checkpoint.get('last_uid', 0)
+                    if checkpoint.get('highestmodseq') and uid_state['highestmodseq'] != checkpoint['highestmodseq']:
+                        self.mark_vanished(worker.fetch_vanished(checkpoint['highestmodseq']), uid_state['uidvalidity'])
+
+                if uid_state['uidnext'] and uid_state['uidnext'] <= last_uid + 1:
+                    all_uids, uids = [], []
+                else:
+                    # UID n+1:* всегда возвращает хотя бы последнее письмо - отбрасываем старые
+                    all_uids, uids = worker.search_with_server_filters(f'UID {last_uid + 1}:*')
+                    all_uids = [uid for uid in all_uids if int(uid) > last_uid]
+                    uids = [uid for uid in uids if int(uid) > last_uid]
+                metadata_by_id = worker.fetch_metadata_batch(uids) if uids else {}
+
+            self.logger.info(f"📨 Новых писем после UID {last_uid}: {len(all_uids)}" +
+                             (f", к загрузке после серверных фильтров: {len(uids)}" if len(uids) != len(all_uids) else ""))
+
+            if uids:
+                buckets = []
+                for date_folder, day_uids in self.bucket_by_date_folder(uids, metadata_by_id).items():
+                    first_num = self.next_email_number(date_folder)
+                    numbered = list(enumerate(day_uids, first_num))
+                    buckets.append((date_folder, numbered, first_num + len(day_uids) - 1))
+
+                all_emails = self.process_day_buckets(pool, buckets, metadata_by_id)
+
+            if all_uids:
+                # Письма без метаданных не пропускаем: чекпоинт встает перед первым из них;
+                # исключенные на сервере письма чекпоинт проходит
+                missing = [int(uid) for uid in uids if uid not in metadata_by_id]
+                new_last_uid = min(missing) - 1 if missing else max(int(uid) for uid in all_uids)
+                self.save_sync_checkpoint(uid_state['uidvalidity'], max(new_last_uid, last_uid), uid_state['highestmodseq'])
+            elif not checkpoint or checkpoint.get('uidvalidity') != uid_state['uidvalidity'] \
+                    or checkpoint.get('highestmodseq', 0) != uid_state['highestmodseq']:
+                self.save_sync_checkpoint(uid_state['uidvalidity'], last_uid, uid_state['highestmodseq'])
+            else:
+                self.logger.info("📭 Новых писем нет")
+
+        finally:
+            pool.close()
+            self.use_uid = False
 
         self.logger.info("=" * 70)
-        self.logger.info(f"🎯 ОБЩИЙ ИТОГ ЗА ВСЕ ДНИ: сохранено {total_saved} писем")
-        self.save_processing_stats(start_date, end_date)
+        self.logger.info(f"🎯 ИТОГ СИНХРОНИЗАЦИИ: сохранено {len(all_emails)} писем")
+        if not report:
+            return all_emails
+
+        today = self.get_local_time()
+        self.save_processing_stats(today, today)
         self.print_final_stats()
 
-        # ✅ ДОБАВИТЬ ПОВТОРНУЮ ОБРАБОТКУ
+        # Чекпоинт уже прошел письма из очереди повторов - они догружаются только отсюда
         self.retry_skipped_emails()
 
         return all_emails
 
+    def fetch_from_sources(self, sources: List[MailboxSource], run) -> List[Dict]:
+        """📬 Загрузка из нескольких учетных записей и папок с общей итоговой статистикой
+
+        run(worker) - загрузка одной папки (например, sync_new_emails или прогон
+        периода). Учетные записи обрабатываются одновременно; папки одной
+        учетной записи делят ее max_connections: параллельно идут не больше
+        папок, чем сессий, и каждая получает поровну оставшихся сессий.
+        """
+        accounts: Dict[Tuple[Optional[str], Optional[str]], List[MailboxSource]] = {}
+        for source in sources:
+            accounts.setdefault((source.user, source.server), []).append(source)
+
+        results: Dict[str, Tuple[List[Dict], 'AdvancedEmailFetcherV2', float]] = {}
+        results_lock = threading.Lock()
+
+        def run_source(source: MailboxSource, slots: int):
+            worker = self.for_source(source)
+            worker.pool_size = slots
+            started = time.time()
+            try:
+                emails = run(worker) or []
+            except Exception as e:
+                self.logger.error(f"❌ Источник {source.label}: {e}")
+                emails = []
+            finally:
+                worker.close()
+            with results_lock:
+                results[source.key] = (emails, worker, time.time() - started)
+
+        def run_account(folders: List[MailboxSource]):
+            budget = min(folder.max_connections for folder in folders)
+            parallel = min(len(folders), budget)
+            slots = max(1, budget // parallel)
+            with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='imap-folder') as executor:
+                list(executor.map(lambda folder: run_source(folder, slots), folders))
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix='imap-account') as executor:
+            list(executor.map(run_account, accounts.values()))
+        elapsed = max(time.time() - started, 1e-6)
+
+        all_emails: List[Dict] = []
+        self.stats = dict.fromkeys(self.stats, 0)
+        self.logger.info("=" * 70)
+        self.logger.info(f"📬 ИТОГ ПО ИСТОЧНИКАМ: {len(sources)} папок в {len(accounts)} учетных записях")
+        for source in sources:
+            if source.key not in results:
+                continue
+            emails, worker, seconds = results[source.key]
+            all_emails.extend(emails)
+            self.merge_stats(worker.stats)
+            self.merge_lane_stats(worker.lane_stats)
+            self.imap_metrics.merge(worker.imap_metrics)
+            self.logger.info(f"   📁 {source.label}: сохранено {len(emails)} писем за {seconds:.1f} с")
+        self.logger.info(f"🚀 Общая пропускная способность: {len(all_emails)} писем за {elapsed:.1f} с "
+                         f"({len(all_emails) / elapsed:.2f} писем/с)")
+        self.logger.info("=" * 70)
+        self.write_metrics_textfile()
+        return all_emails
+
     def save_processing_stats(self, start_date: datetime, end_date: datetime):
         """📊 Сохранение статистики обработки"""
         start_str = start_date.strftime('%Y%m%d')
@@ -1849,10 +2851,14 @@ class AdvancedEmailFetcherV2:
                 "filename_excludes": self.filters.filename_excludes
             },
             "supported_attachments": list(SUPPORTED_ATTACHMENTS.keys()),
-            "excluded_extensions": list(EXCLUDED_EXTENSIONS)
+            "excluded_extensions": list(EXCLUDED_EXTENSIONS),
+            "lanes": self.lane_report(),
+            "imap_metrics": self.imap_metrics.to_dict()
         }
 
-        stats_path = self.logs_dir / f"processing_stats_{start_str}_{end_str}.json"
+        # Папки из config/mailboxes.json пишут статистику в отдельные файлы
+        suffix = '' if self.source is None else '_' + re.sub(r'[^\w.-]+', '_', self.source.label)
+        stats_path = self.logs_dir / f"processing_stats_{start_str}_{end_str}{suffix}.json"
 
         try:
             with open(stats_path, 'w', encoding='utf-8') as f:
@@ -1861,6 +2867,20 @@ class AdvancedEmailFetcherV2:
         except Exception as e:
             self.logger.error(f"❌ Ошибка сохранения статистики: {e}")
 
+        # Папки из config/mailboxes.json не пишут textfile: общий пишет fetch_from_sources
+        if self.source is None:
+            self.write_metrics_textfile()
+
+    def write_metrics_textfile(self):
+        """📈 Метрики IMAP в textfile для node_exporter (если задан IMAP_METRICS_TEXTFILE)"""
+        if not METRICS_TEXTFILE:
+            return
+        try:
+            textfile = self.imap_metrics.write_prometheus(Path(METRICS_TEXTFILE))
+            self.logger.info(f"📈 Метрики IMAP для Prometheus: {textfile}")
+        except OSError as e:
+            self.logger.error(f"❌ Ошибка записи метрик Prometheus: {e}")
+
     def print_final_stats(self):
         """📊 Вывод итоговой статистики с полной фильтрацией"""
         self.logger.info("="*70)
@@ -1872,20 +2892,25 @@ class AdvancedEmailFetcherV2:
         self.logger.info(f"🚫 Исключено по теме: {self.stats['filtered_subject']}")
         self.logger.info(f"🚫 Исключено по черному списку: {self.stats['filtered_blacklist']}")
         self.logger.info(f"🚫 Исключено массовых рассылок: {self.stats['filtered_mass_mailing']}")
+        self.logger.info(f"📡 Исключено на сервере (черный список и темы): {self.stats['filtered_server_side']}")
         self.logger.info("")
         self.logger.info("📎 СТАТИСТИКА ВЛОЖЕНИЙ:")
         self.logger.info(f"✅ Скачано вложений: {self.stats['saved_attachments']}")
         self.logger.info(f"🖼️ Встроенных изображений: {self.stats['saved_inline_images']}")
+        self.logger.info(f"♻️ Из них уже были в хранилище: {self.stats['deduplicated_attachments']}")
+        self.logger.info(f"📉 Выборочных загрузок: {self.stats['selective_fetches']}, "
+                         f"не скачано частей: {self.stats['skipped_parts']} ({self.stats['skipped_part_bytes']/1024/1024:.1f} МБ)")
         self.logger.info(f"🚫 Исключено по расширению: {self.stats['excluded_attachments']}")
         self.logger.info(f"📝 Исключено по имени файла: {self.stats['excluded_filenames']}")
         self.logger.info(f"📏 Исключено по размеру файла: {self.stats['excluded_by_size']}")
         self.logger.info(f"🖼️ Исключено по размерам изображения: {self.stats['excluded_by_image_dimensions']}")
+        self.logger.info(f"🧬 Исключено по отпечатку изображения: {self.stats['excluded_by_fingerprint']}")
         self.logger.info(f"⚠️ Неподдерживаемых: {self.stats['unsupported_attachments']}")
 
         total_attachments = (self.stats['saved_attachments'] + self.stats['saved_inline_images'] +
                            self.stats['excluded_attachments'] + self.stats['excluded_filenames'] +
                            self.stats['excluded_by_size'] + self.stats['excluded_by_image_dimensions'] +
-                           self.stats['unsupported_attachments'])
+                           self.stats['excluded_by_fingerprint'] + self.stats['unsupported_attachments'])
 
         if total_attachments > 0:
             saved_total = self.stats['saved_attachments'] + self.stats['saved_inline_images']
@@ -1894,6 +2919,9 @@ class AdvancedEmailFetcherV2:
 
         self.logger.info(f"❌ Ошибок обработки: {self.stats['errors']}")
         self.logger.info(f"📏 Пропущено больших писем: {self.stats['skipped_large_emails']}")
+        for lane in ('fast', 'large'):
+            if self.lane_stats[lane]['messages']:
+                self.logger.info(f"🛣️ Полоса {lane}: {self.format_lane_stats(lane)}")
 
         total_filtered = (self.stats['filtered_subject'] + self.stats['filtered_blacklist'] + 
                          self.stats['filtered_mass_mailing'])
@@ -1905,6 +2933,117 @@ class AdvancedEmailFetcherV2:
 
         self.logger.info("="*70)
 
+    def run_daemon(self, stop_event: Optional[threading.Event] = None):
+        """📡 Режим демона: непрерывный прием новых писем по IDLE (или опросом NOOP)
+
+        Каждое оповещение о новых письмах запускает инкрементальную синхронизацию
+        по UID (заголовки → фильтры → загрузка). Догоняющая синхронизация (при
+        запуске и после сбоя) идет на пуле сессий, оповещения - на сессии самого
+        демона без новых входов. Раз в DAEMON_MAINTENANCE_INTERVAL повторяется
+        очередь пропущенных писем и обновляется файл статистики с момента запуска;
+        итоги печатаются при остановке. При сбое соединения - переподключение
+        с экспоненциальной паузой. Останавливается по stop_event или Ctrl+C.
+        """
+        stop_event = stop_event or threading.Event()
+        failures = 0
+        needs_sync = True
+        catch_up = True
+        started = self.get_local_time()
+        maintenance_due = time.monotonic() + DAEMON_MAINTENANCE_INTERVAL
+        self.logger.info(f"📡 РЕЖИМ ДЕМОНА: {self.get_mailbox_key()}")
+
+        try:
+            while not stop_event.is_set():
+                try:
+                    if needs_sync:
+                        self.sync_new_emails(single_session=not catch_up, report=False)
+                        needs_sync = catch_up = False
+
+                    if self.mail is None and not self.connect():
+                        raise ConnectionError("нет соединения с сервером")
+
+                    if time.monotonic() >= maintenance_due:
+                        self.retry_skipped_emails()
+                        self.save_processing_stats(started, self.get_local_time())
+                        maintenance_due = time.monotonic() + DAEMON_MAINTENANCE_INTERVAL
+
+                    needs_sync = self.wait_for_new_mail(stop_event, max(0.0, maintenance_due - time.monotonic()))
+                    failures = 0
+
+                except Exception as e:
+                    failures += 1
+                    delay = min(DAEMON_BACKOFF_MAX, DAEMON_BACKOFF_BASE * 2 ** (failures - 1))
+                    self.logger.error(f"❌ Сбой демона ({e}), переподключение через {delay} с (попытка {failures})")
+                    self.close()
+                    self.mail = None
+                    needs_sync = catch_up = True
+                    stop_event.wait(delay)
+        finally:
+            self.save_processing_stats(started, self.get_local_time())
+            self.print_final_stats()
+
+        self.logger.info("⏹️ Демон остановлен")
+
+    def wait_for_new_mail(self, stop_event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """⏳ Ожидание изменений в папке: IDLE, если сервер умеет, иначе NOOP по таймеру
+
+        timeout - ждать не дольше (например, до ближайшего обслуживания демона).
+
+        Returns:
+            True, если сервер сообщил о новых письмах (пора синхронизироваться).
+        """
+        capabilities = getattr(self.mail, 'capabilities', ()) or ()
+        if self.idle_enabled and 'IDLE' in capabilities and getattr(self.mail, 'sock', None) is not None:
+            return self.idle_wait(stop_event, timeout)
+
+        if stop_event.wait(DAEMON_POLL_INTERVAL if timeout is None else min(DAEMON_POLL_INTERVAL, timeout)):
+            return False
+        status, _ = self.imap_metrics.call('NOOP', self.mail.noop)
+        if status != 'OK':
+            raise ConnectionError(f"NOOP вернул {status}")
+        _, exists = self.mail.response('EXISTS')
+        return exists != [None]
+
+    def idle_wait(self, stop_event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """💤 Одна сессия IDLE: до оповещения сервера, остановки, интервала переотправки или timeout"""
+        tag = f'IDLE{int(time.time() * 1000) % 1_000_000:06d}'.encode()
+        sock = self.mail.sock
+        self.mail.send(tag + b' IDLE\r\n')
+
+        line = self.mail.readline()
+        if not line.startswith(b'+'):
+            # Сервер отказался от IDLE - дальше работаем опросом
+            self.logger.warning(f"⚠️ Сервер отклонил IDLE ({line.strip()!r}), переход на опрос NOOP")
+            self.idle_enabled = False
+            return True
+
+        changed = False
+        deadline = time.monotonic() + (IDLE_REFRESH_INTERVAL if timeout is None else min(IDLE_REFRESH_INTERVAL, timeout))
+        try:
+            while not stop_event.is_set() and time.monotonic() < deadline:
+                pending = getattr(sock, 'pending', lambda: 0)()
+                if not pending and not select.select([sock], [], [], DAEMON_STOP_CHECK)[0]:
+                    continue
+                line = self.mail.readline()
+                if not line or line.startswith(b'* BYE'):
+                    raise imaplib.IMAP4.abort("сервер закрыл соединение во время IDLE")
+                # Любой непомеченный ответ завершает IDLE: разбор остатка буфера - после DONE
+                changed = changed or line.rstrip().endswith(b'EXISTS')
+                break
+        finally:
+            self.mail.send(b'DONE\r\n')
+            while True:
+                line = self.mail.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("сервер закрыл соединение после IDLE")
+                if line.startswith(tag + b' '):
+                    break
+                changed = changed or line.rstrip().endswith(b'EXISTS')
+
+        if changed:
+            self.logger.info("📨 IDLE: сервер сообщил о новых письмах")
+        return changed
+
     def close(self):
         """🔐 Закрытие соединения"""
         if self.mail:
@@ -1915,8 +3054,8 @@ class AdvancedEmailFetcherV2:
                 pass
 
     def check_email_already_saved(self, message_id: str, date_folder: str) -> Dict[str, bool]:
-        """📁 ИСПРАВЛЕННАЯ проверка существования письма и его компонентов
-        
+        """📁 Проверка существования письма и его компонентов по индексу Message-ID
+
         Returns:
             Dict[str, bool]: Словарь с флагами существования:
                 - 'email_exists': существует ли JSON файл письма
@@ -1924,109 +3063,63 @@ class AdvancedEmailFetcherV2:
                 - 'attachments_exist': существуют ли вложения
                 - 'all_exist': все компоненты существуют
         """
-        
+
         result = {
             'email_exists': False,
             'body_exists': False,
             'attachments_exist': False,
             'all_exist': False
         }
-        
+
         # Диагностическое логирование
         self.logger.debug(f"🔍 Проверяем дубликат по Message-ID: {message_id}")
         self.logger.debug(f"   Папка: {date_folder}")
-        
+
         try:
-            # Проверяем существование папки с письмами за эту дату
-            email_path = self.data_dir / 'emails' / date_folder
-            
-            if not email_path.exists():
-                self.logger.debug(f"📂 Папка {date_folder} не существует")
-                return result
-                
-            # Получаем все JSON файлы за эту дату
-            json_files = list(email_path.glob("email_*.json"))
-            
-            if not json_files:
-                self.logger.debug(f"📭 JSON файлов в папке нет")
-                return result
-                
-            # Проверяем каждый файл на совпадение Message-ID
-            email_file = None
-            for json_file in json_files:
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        email_data = json.load(f)
-                        stored_message_id = email_data.get('message_id', '')
-                        
-                        # Сравниваем Message-ID
-                        if stored_message_id and stored_message_id == message_id:
-                            email_file = json_file
-                            result['email_exists'] = True
-                            break
-                            
-                except Exception as e:
-                    self.logger.warning(f"⚠️ Ошибка проверки файла {json_file.name}: {e}")
-                    continue
-            
-            if not email_file:
-                self.logger.debug(f"✅ Дубликат не найден среди {len(json_files)} файлов")
+            entry = self.message_index.get(message_id)
+
+            if not entry or not self.email_store.exists(entry['email_path']):
+                self.logger.debug(f"✅ Дубликат не найден в индексе")
                 return result
-            
+
+            result['email_exists'] = True
+
             # Проверяем наличие тела письма
-            try:
-                with open(email_file, 'r', encoding='utf-8') as f:
-                    email_data = json.load(f)
-                    body_text = email_data.get('body_text', '')
-                    if body_text and len(body_text.strip()) > 0:
-                        result['body_exists'] = True
-                        self.logger.debug(f"   📄 Тело письма существует")
-                    else:
-                        self.logger.debug(f"   📄 Тело письма отсутствует или пусто")
-            except Exception as e:
-                self.logger.warning(f"⚠️ Ошибка проверки тела письма: {e}")
-            
-            # Проверяем наличие вложений
-            try:
-                with open(email_file, 'r', encoding='utf-8') as f:
-                    email_data = json.load(f)
-                    attachments = email_data.get('attachments', [])
-                    if attachments and len(attachments) > 0:
-                        # Проверяем, что вложения действительно существуют на диске
-                        attachments_dir = self.data_dir / 'attachments' / date_folder
-                        existing_attachments = 0
-                        for att in attachments:
-                            file_path = att.get('file_path', '')
-                            if file_path and Path(file_path).exists():
-                                existing_attachments += 1
-                        
-                        if existing_attachments > 0:
-                            result['attachments_exist'] = True
-                            self.logger.debug(f"   📎 Вложения существуют ({existing_attachments} из {len(attachments)})")
-                        else:
-                            self.logger.debug(f"   📎 Вложения указаны, но файлы отсутствуют")
-                    else:
-                        self.logger.debug(f"   📎 Вложений нет")
-            except Exception as e:
-                self.logger.warning(f"⚠️ Ошибка проверки вложений: {e}")
-            
+            if entry['has_body']:
+                result['body_exists'] = True
+                self.logger.debug(f"   📄 Тело письма существует")
+            else:
+                self.logger.debug(f"   📄 Тело письма отсутствует или пусто")
+
+            # Проверяем, что вложения действительно существуют на диске
+            attachment_paths = entry['attachment_paths']
+            if attachment_paths:
+                existing_attachments = sum(1 for file_path in attachment_paths if Path(file_path).exists())
+                if existing_attachments > 0:
+                    result['attachments_exist'] = True
+                    self.logger.debug(f"   📎 Вложения существуют ({existing_attachments} из {len(attachment_paths)})")
+                else:
+                    self.logger.debug(f"   📎 Вложения указаны, но файлы отсутствуют")
+            else:
+                self.logger.debug(f"   📎 Вложений нет")
+
             # Определяем, все ли компоненты существуют
             result['all_exist'] = result['email_exists'] and result['body_exists'] and result['attachments_exist']
-            
+
             # Логируем результат проверки
             if result['all_exist']:
                 self.logger.info(f"📁 Письмо полностью сохранено: {message_id}")
-            elif result['email_exists']:
+            else:
                 missing_parts = []
                 if not result['body_exists']:
                     missing_parts.append("тело письма")
                 if not result['attachments_exist']:
                     missing_parts.append("вложения")
-                
+
                 self.logger.info(f"📁 Письмо существует, но отсутствуют: {', '.join(missing_parts)}")
-            
+
             return result
-            
+
         except Exception as e:
             self.logger.warning(f"⚠️ Ошибка проверки существования письма: {e}")
             return result
@@ -2039,11 +3132,25 @@ def main():
     parser.add_argument('--date', type=str, help='Дата для загрузки писем в формате YYYY-MM-DD')
     parser.add_argument('--start-date', type=str, help='Начальная дата диапазона в формате YYYY-MM-DD')
     parser.add_argument('--end-date', type=str, help='Конечная дата диапазона в формате YYYY-MM-DD')
+    parser.add_argument('--workers', type=int, default=IMAP_POOL_SIZE, help='Число параллельных IMAP-сессий (для --engine async - число соединений)')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync',
+                        help='Движок загрузки: sync - imaplib в потоках, async - asyncio с конвейером FETCH')
+    parser.add_argument('--sync', action='store_true', help='Инкрементальная синхронизация по UID (только новые письма)')
+    parser.add_argument('--daemon', action='store_true', help='Режим демона: непрерывный прием новых писем по IMAP IDLE')
+    parser.add_argument('--rebuild-index', action='store_true', help='Пересобрать индексы Message-ID и переписок из data/emails/ перед загрузкой')
+    parser.add_argument('--convert-store', action='store_true', help='Перенести email_*.json в сжатые сегменты по дням (EMAIL_STORE=segments) и пересобрать индексы')
+    parser.add_argument('--offline', type=str, metavar='PATH', help='Офлайн-загрузка из архива: mbox, Maildir или папка с .eml')
+    parser.add_argument('--processes', type=int, default=None, help='Число процессов для --offline (по умолчанию - число ядер)')
+    parser.add_argument('--mailboxes', type=str, default=str(MAILBOXES_CONFIG),
+                        help='Файл учетных записей и папок (JSON); без файла - IMAP_* из окружения и INBOX')
     
     args = parser.parse_args()
     
     # Определяем период для обработки
-    if args.date:
+    if args.sync or args.daemon or args.offline:
+        # Синхронизация и архивы не зависят от дат - период нужен только для имени лога
+        start_date = end_date = datetime.now()
+    elif args.date:
         # Если указана конкретная дата
         try:
             target_date = datetime.strptime(args.date, '%Y-%m-%d')
@@ -2079,6 +3186,18 @@ def main():
     # Создаем парсер с логгером
     fetcher = AdvancedEmailFetcherV2(logger=logger)
     fetcher.enable_size_logging = False  # ✅ Включить детальные логи - True, ✅ Отключить детальные логи - False
+    fetcher.pool_size = args.workers
+    if args.engine == 'async':
+        fetcher.pool_factory = AsyncImapPool
+
+    if args.convert_store:
+        fetcher.email_store.close()
+        fetcher.email_store = EmailStore(fetcher.emails_dir, backend='segments', logger=logger)
+        fetcher.email_store.convert_all()
+
+    if args.rebuild_index or args.convert_store:
+        fetcher.message_index.rebuild(fetcher.emails_dir, fetcher.email_store.iter_all())
+        fetcher.conversation_index.rebuild(fetcher.emails_dir, fetcher.email_store.iter_all())
 
     # ✅ ДОБАВИТЬ: тестирование фильтра
     logger.info("🔍 ТЕСТИРОВАНИЕ ФИЛЬТРА ИМЕН:")
@@ -2089,7 +3208,25 @@ def main():
 
     try:
         # Загружаем письма
-        emails = fetcher.fetch_emails_by_date_range(start_date, end_date)
+        if args.daemon:
+            fetcher.run_daemon()
+            emails = []
+        elif args.offline:
+            ingest_offline(fetcher, Path(args.offline), args.processes)
+            fetcher.print_final_stats()
+            emails = []
+        elif Path(args.mailboxes).exists():
+            # Несколько учетных записей и папок: свои чекпоинты, общая статистика
+            sources = load_mailbox_sources(Path(args.mailboxes), args.workers)
+            if args.sync:
+                emails = fetcher.fetch_from_sources(sources, lambda worker: worker.sync_new_emails())
+            else:
+                emails = fetcher.fetch_from_sources(
+                    sources, lambda worker: worker.fetch_emails_by_date_range(start_date, end_date))
+        elif args.sync:
+            emails = fetcher.sync_new_emails()
+        else:
+            emails = fetcher.fetch_emails_by_date_range(start_date, end_date)
 
         logger.info("🎉 ЗАГРУЗКА ЗАВЕРШЕНА С ПОЛНЫМ ИСПРАВЛЕНИЕМ БАГОВ!")
         logger.info("   📁 Письма сохранены в: data/emails/[дата_письма]/")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚡ Асинхронный IMAP-клиент (asyncio) для движка загрузки --engine async
+Несколько соединений, на каждом - конвейер из нескольких команд без ожидания
+ответа на предыдущую. Разбор писем и сохранение остаются в обычном парсере:
+его воркеры получают вместо imaplib.IMAP4 мост SessionBridge с тем же интерфейсом,
+поэтому файлы, манифесты и статистика совпадают с синхронным режимом.
+"""
+
+import os
+import re
+import ssl
+import asyncio
+import imaplib
+import itertools
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Команд в полете на одно соединение и признак STARTTLS перед авторизацией
+ASYNC_PIPELINE_DEPTH = int(os.getenv('IMAP_ASYNC_PIPELINE_DEPTH', 8))
+ASYNC_STARTTLS = os.getenv('IMAP_ASYNC_STARTTLS', '1') != '0'
+COMMAND_TIMEOUT = 60
+
+# Исключения imaplib: воркеры парсера перехватывают именно их
+ImapError = imaplib.IMAP4.error
+ImapAbort = imaplib.IMAP4.abort
+
+LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+UNTAGGED_STATUS_RE = re.compile(rb'\* (?P<num>\d+) (?P<type>[A-Z-]+)(?: (?P<data>.*))?$', re.S)
+UNTAGGED_RE = re.compile(rb'\* (?P<type>[A-Z-]+)(?: (?P<data>.*))?$', re.S)
+TAGGED_RE = re.compile(rb'(?P<tag>[A-Z]\d+) (?P<status>[A-Z]+)(?: (?P<text>.*))?$', re.S)
+UID_RE = re.compile(rb'UID (\d+)')
+
+
+def _quote(value: str) -> str:
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _parse_set(msg_set: str) -> List[Tuple[int, float]]:
+    """🔢 Набор сообщений IMAP (1,3:5,7:*) в список диапазонов"""
+    ranges = []
+    for token in msg_set.split(','):
+        first, _, last = token.partition(':')
+        low = int(first) if first != '*' else float('inf')
+        high = low if not last else (float('inf') if last == '*' else int(last))
+        ranges.append((min(low, high), max(low, high)))
+    return ranges
+
+
+class _PendingCommand:
+    """📨 Команда в конвейере: ждет свой тег, собирает относящиеся к ней ответы"""
+
+    def __init__(self, name: str, args: List[str], future: asyncio.Future):
+        self.name = name
+        self.response_type = name.split()[-1]
+        self.by_uid = name.startswith('UID ')
+        self.ranges = _parse_set(args[0]) if self.response_type == 'FETCH' and args else []
+        self.future = future
+        self.data: List = []
+
+    def owns(self, response_type: str, number: Optional[int], uid: Optional[int]) -> bool:
+        if response_type != self.response_type:
+            return False
+        if response_type != 'FETCH':
+            return True
+        key = uid if self.by_uid else number
+        return key is not None and any(low <= key <= high for low, high in self.ranges)
+
+
+class AsyncImapSession:
+    """🔌 Одно соединение IMAP на asyncio с конвейером команд
+
+    Ответы разбираются в ту же форму, что возвращает imaplib: для FETCH это
+    [(b'1 (UID 5 RFC822 {N}', literal), b')'], для SEARCH - [b'1 2 3'].
+    Непомеченные ответы FETCH относятся к команде по номеру (или UID) письма,
+    остальные - к самой ранней ожидающей команде того же типа.
+    """
+
+    def __init__(self, name: str, pipeline_depth: int = ASYNC_PIPELINE_DEPTH):
+        self.name = name
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.alive = False
+        self._tags = itertools.count(1)
+        self._pending: Dict[bytes, _PendingCommand] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def open(self, host: str, port: int, user: str, password: str, mailbox: str,
+                   starttls: bool = True, timeout: float = COMMAND_TIMEOUT):
+        """🔐 Подключение, STARTTLS, LOGIN и SELECT"""
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        greeting = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not greeting.startswith(b'* OK') and not greeting.startswith(b'* PREAUTH'):
+            raise ImapError(f"Неожиданное приветствие сервера: {greeting!r}")
+
+        if starttls:
+            # До шифрования конвейер не нужен: одна команда, ответ читаем сами
+            tag = self._next_tag()
+            self.writer.write(tag + b' STARTTLS\r\n')
+            await self.writer.drain()
+            while True:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+                if not line:
+                    raise ImapAbort("Соединение закрыто во время STARTTLS")
+                if line.startswith(tag + b' '):
+                    if not line.startswith(tag + b' OK'):
+                        raise ImapError(f"STARTTLS отклонен: {line!r}")
+                    break
+            await self.writer.start_tls(ssl.create_default_context())
+
+        self._slots = asyncio.Semaphore(self.pipeline_depth)
+        self.alive = True
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+        status, data = await self.command('LOGIN', _quote(user), _quote(password))
+        if status != 'OK':
+            raise ImapError(f"LOGIN: {data}")
+        status, data = await self.command('SELECT', mailbox)
+        if status != 'OK':
+            raise ImapError(f"SELECT {mailbox}: {data}")
+
+    def _next_tag(self) -> bytes:
+        return f'A{next(self._tags):04d}'.encode()
+
+    async def command(self, name: str, *args) -> Tuple[str, List]:
+        """📡 Отправка команды в конвейер и ожидание ее тега"""
+        args = [arg.decode() if isinstance(arg, bytes) else str(arg) for arg in args if arg is not None]
+        async with self._slots:
+            if not self.alive:
+                raise ImapAbort(f"{self.name}: соединение закрыто")
+
+            tag = self._next_tag()
+            pending = _PendingCommand(name, args, asyncio.get_running_loop().create_future())
+            self._pending[tag] = pending
+            try:
+                self.writer.write(b' '.join([tag, name.encode()] + [a.encode('utf-8') for a in args]) + b'\r\n')
+                await self.writer.drain()
+                status, text = await pending.future
+            finally:
+                self._pending.pop(tag, None)
+
+        if status == 'BAD':
+            raise ImapError(f"{name} command error: BAD [{text!r}]")
+        if status != 'OK':
+            return status, [text]
+        return status, pending.data or [None]
+
+    async def _read_response(self) -> List:
+        """📥 Один ответ сервера: строки и литералы {N} в форме imaplib"""
+        parts = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ImapAbort(f"{self.name}: сервер закрыл соединение")
+            line = line.rstrip(b'\r\n')
+            match = LITERAL_RE.search(line)
+            if not match:
+                parts.append(line)
+                return parts
+            literal = await self.reader.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+
+    async def _read_loop(self):
+        """🔁 Чтение ответов и раздача их ожидающим командам"""
+        try:
+            while True:
+                parts = await self._read_response()
+                head = parts[0][0] if isinstance(parts[0], tuple) else parts[0]
+
+                tagged = TAGGED_RE.match(head)
+                if tagged and tagged.group('tag') in self._pending:
+                    # Завершенная команда сразу снимается с конвейера: следующие ответы с тем же
+                    # UID (повтор FETCH) принадлежат уже другой команде
+                    pending = self._pending.pop(tagged.group('tag'))
+                    if not pending.future.done():
+                        pending.future.set_result((tagged.group('status').decode(), tagged.group('text') or b''))
+                    continue
+
+                if head.startswith(b'* '):
+                    self._dispatch_untagged(head, parts)
+        except (ImapAbort, asyncio.IncompleteReadError, OSError) as e:
+            self._fail_pending(e)
+        except asyncio.CancelledError:
+            self._fail_pending(ImapAbort(f"{self.name}: соединение закрыто"))
+            raise
+
+    def _dispatch_untagged(self, head: bytes, parts: List):
+        number = None
+        match = UNTAGGED_STATUS_RE.match(head)
+        if match:
+            number = int(match.group('num'))
+            data = match.group('num') + (b' ' + match.group('data') if match.group('data') is not None else b'')
+        else:
+            match = UNTAGGED_RE.match(head)
+            if not match:
+                return
+            data = match.group('data') or b''
+        response_type = match.group('type').decode()
+
+        if response_type == 'BYE':
+            self.alive = False
+            return
+
+        uid_match = UID_RE.search(head)
+        uid = int(uid_match.group(1)) if uid_match else None
+        for pending in self._pending.values():
+            if pending.owns(response_type, number, uid):
+                first = (data, parts[0][1]) if isinstance(parts[0], tuple) else data
+                pending.data.append(first)
+                pending.data.extend(parts[1:])
+                return
+        # Непрошеные ответы (EXISTS, FLAGS, чужие FETCH) пропускаем
+
+    def _fail_pending(self, error: Exception):
+        self.alive = False
+        for pending in list(self._pending.values()):
+            if not pending.future.done():
+                pending.future.set_exception(ImapAbort(str(error)))
+
+    def abort(self, reason: str):
+        """💥 Аварийный разрыв соединения (вызывается в цикле событий)
+
+        Ответ на отмененную по таймауту команду все равно придет и собьет
+        раздачу ответов конвейера, поэтому сессию нельзя продолжать: ожидающие
+        команды получают ImapAbort, пул переподключит сессию при следующем мосте.
+        """
+        self._fail_pending(ImapAbort(reason))
+        if self.writer is not None:
+            self.writer.transport.abort()
+
+    async def close(self):
+        """🔐 LOGOUT и закрытие соединения"""
+        if self.alive:
+            try:
+                await asyncio.wait_for(self.command('LOGOUT'), 5)
+            except Exception:
+                pass
+        self.alive = False
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+
+class SessionBridge:
+    """🌉 Синхронный интерфейс imaplib.IMAP4 поверх асинхронной сессии
+
+    Вызывается из потоков воркеров; несколько мостов делят одну сессию, и их
+    команды идут по соединению конвейером. timeout ограничивает каждую команду,
+    deadline() переопределяет его на время блока (operation_deadline парсера).
+    """
+
+    error = ImapError
+    abort = ImapAbort
+
+    def __init__(self, session: AsyncImapSession, loop: asyncio.AbstractEventLoop, timeout: float = COMMAND_TIMEOUT):
+        self.session = session
+        self.loop = loop
+        self.timeout = timeout
+        self._deadline: Optional[Tuple[float, str]] = None
+
+    @contextmanager
+    def deadline(self, seconds: float, operation: str = 'IMAP'):
+        """⏱️ Дедлайн команд внутри блока вместо обычного timeout"""
+        previous = self._deadline
+        self._deadline = (seconds, operation)
+        try:
+            yield
+        finally:
+            self._deadline = previous
+
+    def _call(self, name: str, *args) -> Tuple[str, List]:
+        if not self.session.alive:
+            raise ImapAbort(f"{self.session.name}: соединение закрыто")
+        seconds, operation = self._deadline or (self.timeout, name)
+        future = asyncio.run_coroutine_threadsafe(self.session.command(name, *args), self.loop)
+        try:
+            return future.result(seconds)
+        except TimeoutError:
+            future.cancel()
+            message = f"{operation} операция превысила {seconds} секунд"
+            self.loop.call_soon_threadsafe(self.session.abort, f"{self.session.name}: {message}")
+            raise TimeoutError(message)
+
+    def fetch(self, msg_set, items: str):
+        return self._call('FETCH', msg_set, items)
+
+    def search(self, charset, criteria: str):
+        return self._call('SEARCH', charset, criteria) if charset else self._call('SEARCH', criteria)
+
+    def uid(self, command: str, *args):
+        return self._call(f'UID {command.upper()}', *args)
+
+    def status(self, mailbox: str, items: str):
+        return self._call('STATUS', mailbox, items)
+
+    def noop(self):
+        # Живость соединения отслеживает читатель сессии - лишний круг по сети не нужен
+        if not self.session.alive:
+            raise ImapAbort(f"{self.session.name}: соединение закрыто")
+        return 'OK', [b'']
+
+    def logout(self):
+        # Общую сессию закрывает пул, а не отдельный воркер
+        return 'BYE', [b'']
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📦 Контентно-адресуемое хранилище вложений (SHA-256)
+Каждый уникальный файл хранится один раз: data/attachments/blobs/<ab>/<sha256><ext>.
+Письма ссылаются на blob из своего манифеста, индекс SQLite считает ссылки.
+Части письма декодируются (base64/QP) порциями сразу во временный файл с
+подсчетом хэша и размера, затем файл атомарно переименовывается в blob.
+"""
+
+import binascii
+import email.message
+import hashlib
+import os
+import quopri
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+STREAM_CHUNK_SIZE = 1 << 20  # Символов закодированного текста в одной порции декодирования
+
+_NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+def iter_decoded_payload(part: email.message.Message, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """🔓 Декодированное содержимое части порциями (как get_payload(decode=True), но без полной копии)"""
+    payload = part.get_payload()
+    encoding = str(part.get('content-transfer-encoding', '')).strip().lower()
+
+    if not isinstance(payload, str) or encoding not in ('base64', 'quoted-printable'):
+        data = part.get_payload(decode=True)
+        if data:
+            yield data
+        return
+
+    if encoding == 'base64':
+        leftover = ''
+        for start in range(0, len(payload), chunk_size):
+            chunk = leftover + _NOT_BASE64.sub('', payload[start:start + chunk_size])
+            usable = len(chunk) - len(chunk) % 4
+            leftover = chunk[usable:]
+            if usable:
+                yield binascii.a2b_base64(chunk[:usable])
+        if leftover.rstrip('='):
+            try:
+                yield binascii.a2b_base64(leftover + '=' * (-len(leftover) % 4))
+            except binascii.Error:
+                pass
+        return
+
+    # quoted-printable: режем по концам строк, чтобы мягкие переносы (=\n) не разрывались
+    start = 0
+    while start < len(payload):
+        end = payload.find('\n', start + chunk_size)
+        end = len(payload) if end < 0 else end + 1
+        yield quopri.decodestring(payload[start:end].encode('ascii', 'surrogateescape'))
+        start = end
+
+
+class AttachmentStore:
+    """📦 Хранилище вложений с дедупликацией по содержимому"""
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            blob_path TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            first_date_folder TEXT,
+            first_filename TEXT,
+            created_at TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS refs (
+            sha256 TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            date_folder TEXT,
+            PRIMARY KEY (sha256, owner, original_filename)
+        )
+        """,
+    )
+
+    def __init__(self, attachments_dir: Path, logger=None):
+        self.attachments_dir = Path(attachments_dir)
+        self.blobs_dir = self.attachments_dir / "blobs"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = self.blobs_dir / "tmp"
+        self.tmp_dir.mkdir(exist_ok=True)
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.attachments_dir / "attachment_index.db"),
+                                     check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+    def blob_path(self, sha256: str, extension: str) -> Path:
+        """📍 Путь blob-файла по хэшу содержимого"""
+        return self.blobs_dir / sha256[:2] / f"{sha256}{extension.lower()}"
+
+    def stage(self, part: email.message.Message) -> Dict:
+        """📥 Потоковое декодирование части письма во временный файл
+
+        Returns: {'tmp_path', 'sha256', 'file_size'} для проверок и commit/discard.
+        """
+        return self._stage_chunks(iter_decoded_payload(part))
+
+    def _stage_chunks(self, chunks: Iterable[bytes]) -> Dict:
+        tmp_path = self.tmp_dir / f"{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return {'tmp_path': tmp_path, 'sha256': digest.hexdigest(), 'file_size': size}
+
+    def discard(self, staged: Dict):
+        """🗑️ Удаление временного файла отклоненного вложения"""
+        Path(staged['tmp_path']).unlink(missing_ok=True)
+
+    def put(self, payload: bytes, original_filename: str, owner: str, date_folder: str) -> Dict:
+        """💾 Сохранение содержимого (если его еще нет) и регистрация ссылки письма
+
+        Возвращает sha256, путь blob, размер, признак дубликата и число ссылок.
+        """
+        return self.commit(self._stage_chunks([payload]), original_filename, owner, date_folder)
+
+    def commit(self, staged: Dict, original_filename: str, owner: str, date_folder: str) -> Dict:
+        """✅ Перенос подготовленного файла в blob (атомарно) или отбрасывание дубликата"""
+        sha256 = staged['sha256']
+        file_size = staged['file_size']
+        tmp_path = Path(staged['tmp_path'])
+        path = self.blob_path(sha256, Path(original_filename).suffix)
+
+        with self._lock:
+            # BEGIN IMMEDIATE: проверка и запись blob атомарны и между процессами (офлайн-загрузка)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT blob_path FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+                duplicate = row is not None and Path(row['blob_path']).exists()
+
+                if duplicate:
+                    path = Path(row['blob_path'])
+                    tmp_path.unlink(missing_ok=True)
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_path, path)
+                    self._conn.execute(
+                        """
+                        INSERT OR REPLACE INTO blobs (sha256, blob_path, file_size, first_date_folder, first_filename, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (sha256, str(path), file_size, date_folder, original_filename, datetime.now().isoformat())
+                    )
+
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO refs (sha256, owner, original_filename, date_folder) VALUES (?, ?, ?, ?)",
+                    (sha256, owner, original_filename, date_folder)
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            refcount = self._refcount(sha256)
+            first_date_folder = self._conn.execute(
+                "SELECT first_date_folder FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()[0]
+
+        return {
+            'sha256': sha256,
+            'blob_path': path,
+            'file_size': file_size,
+            'duplicate': duplicate,
+            'refcount': refcount,
+            'first_date_folder': first_date_folder,
+        }
+
+    def _refcount(self, sha256: str) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM refs WHERE sha256 = ?", (sha256,)).fetchone()[0]
+
+    def refcount(self, sha256: str) -> int:
+        """🔢 Сколько вложений писем ссылается на blob"""
+        with self._lock:
+            return self._refcount(sha256)
+
+    def get(self, sha256: str) -> Optional[Dict]:
+        """🔍 Запись blob по хэшу"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                return None
+            entry = dict(row)
+            entry['refcount'] = self._refcount(sha256)
+        return entry
+
+    def close(self):
+        """🔐 Закрытие соединения с индексом"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧵 Постоянный индекс переписок по Message-ID / In-Reply-To / References (SQLite)
+Каждое письмо получает устойчивый корень переписки (Message-ID самого раннего
+известного письма цепочки) и родителя. Ответ в другой день или с измененной
+темой остается в той же переписке, а LLM-обработка может найти всю цепочку
+и уже разобранные письма без чтения JSON-файлов.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_MESSAGE_ID = re.compile(r'<[^<>\s]+>')
+
+
+def parse_message_ids(value) -> List[str]:
+    """🔍 Message-ID из заголовка References / In-Reply-To (в порядке появления, без повторов)"""
+    if isinstance(value, (list, tuple)):
+        value = ' '.join(str(item) for item in value)
+    seen = []
+    for message_id in _MESSAGE_ID.findall(str(value or '')):
+        if message_id not in seen:
+            seen.append(message_id)
+    return seen
+
+
+class ConversationIndex:
+    """🧵 Индекс переписок: письмо → корень и родитель"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            message_id TEXT PRIMARY KEY,
+            parent_id TEXT,
+            root_id TEXT NOT NULL,
+            refs TEXT NOT NULL DEFAULT '[]',
+            subject TEXT,
+            sender TEXT,
+            sent_at TEXT,
+            date_folder TEXT,
+            email_path TEXT,
+            analyzed_at TEXT,
+            updated_at TEXT
+        )
+    """
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS conversations_root ON conversations(root_id)",
+        "CREATE INDEX IF NOT EXISTS conversations_parent ON conversations(parent_id)",
+    )
+
+    def __init__(self, db_path: Path, logger=None):
+        self.db_path = Path(db_path)
+        self.logger = logger
+        self.is_new = not self.db_path.exists()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Одно соединение на все потоки пула, доступ через блокировку
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+            for statement in self.INDEXES:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+    def add(self, message_id: str, in_reply_to: str = '', references: str = '', email_path: str = '',
+            date_folder: str = '', subject: str = '', sender: str = '', sent_at: str = '') -> Dict[str, Optional[str]]:
+        """🧵 Запись письма в индекс
+
+        Родитель - In-Reply-To (или последний из References), корень - корень самого
+        раннего уже известного предка, иначе первый из References. Письма, сохраненные
+        раньше своих предков, переносятся в найденный корень.
+        Returns: {'conversation_id': корень, 'parent_id': родитель или None}
+        """
+        if not message_id:
+            return {'conversation_id': None, 'parent_id': None}
+
+        refs = [ref for ref in parse_message_ids(references) if ref != message_id]
+        reply_to = [ref for ref in parse_message_ids(in_reply_to) if ref != message_id]
+        parent_id = reply_to[0] if reply_to else (refs[-1] if refs else None)
+        if parent_id and parent_id not in refs:
+            refs.append(parent_id)
+
+        with self._lock:
+            root_id = None
+            for ref in refs:
+                row = self._conn.execute("SELECT root_id FROM conversations WHERE message_id = ?", (ref,)).fetchone()
+                if row is not None:
+                    root_id = row['root_id']
+                    break
+            if root_id is None:
+                root_id = refs[0] if refs else message_id
+
+            self._upsert(message_id, parent_id, root_id, refs, subject, sender, sent_at, date_folder, email_path)
+            self._reroot(root_id, refs + [message_id])
+            self._conn.commit()
+
+        return {'conversation_id': root_id, 'parent_id': parent_id}
+
+    def _upsert(self, message_id, parent_id, root_id, refs, subject, sender, sent_at, date_folder, email_path):
+        self._conn.execute(
+            """
+            INSERT INTO conversations (message_id, parent_id, root_id, refs, subject, sender, sent_at,
+                                       date_folder, email_path, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(message_id) DO UPDATE SET
+                parent_id = excluded.parent_id,
+                root_id = excluded.root_id,
+                refs = excluded.refs,
+                subject = excluded.subject,
+                sender = excluded.sender,
+                sent_at = excluded.sent_at,
+                date_folder = excluded.date_folder,
+                email_path = excluded.email_path,
+                updated_at = excluded.updated_at
+            """,
+            (message_id, parent_id, root_id, json.dumps(refs), subject, sender, sent_at,
+             date_folder, str(email_path), datetime.now().isoformat())
+        )
+
+    def _reroot(self, root_id: str, message_ids: List[str]):
+        """🔀 Переписки, начатые с писем этой цепочки, сливаются в общий корень"""
+        for stale_root in message_ids:
+            if stale_root != root_id:
+                self._conn.execute("UPDATE conversations SET root_id = ? WHERE root_id = ?", (root_id, stale_root))
+
+    def get(self, message_id: str) -> Optional[Dict]:
+        """🔍 Запись индекса по Message-ID (None, если письмо не индексировалось)"""
+        if not message_id:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM conversations WHERE message_id = ?", (message_id,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def conversation(self, root_id: str) -> List[Dict]:
+        """🧵 Все письма переписки в хронологическом порядке"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM conversations WHERE root_id = ? ORDER BY sent_at, date_folder, message_id", (root_id,)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def thread_of(self, message_id: str) -> List[Dict]:
+        """🧵 Переписка, к которой относится письмо (пусто, если письма нет в индексе)"""
+        entry = self.get(message_id)
+        return self.conversation(entry['root_id']) if entry else []
+
+    def children(self, message_id: str) -> List[Dict]:
+        """↪️ Прямые ответы на письмо"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM conversations WHERE parent_id = ? ORDER BY sent_at, message_id", (message_id,)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def mark_analyzed(self, message_id: str):
+        """✅ Отметка, что письмо уже разобрано LLM (история переписки не анализируется повторно)"""
+        with self._lock:
+            self._conn.execute("UPDATE conversations SET analyzed_at = ? WHERE message_id = ?",
+                               (datetime.now().isoformat(), message_id))
+            self._conn.commit()
+
+    def count(self) -> int:
+        """🔢 Число писем в индексе"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def rebuild(self, emails_dir: Path, stored: Optional[Iterable[Tuple[str, Dict]]] = None) -> int:
+        """🔄 Пересборка индекса из data/emails/<дата>/email_*.json (в хронологическом порядке)
+
+        stored - готовые пары (путь письма, письмо), например EmailStore.iter_all().
+        """
+        if stored is None:
+            stored = self._read_json_files(Path(emails_dir))
+        records = [(Path(path), email_data) for path, email_data in stored
+                   if (email_data.get('message_id') or '').strip()]
+
+        with self._lock:
+            analyzed = dict(self._conn.execute(
+                "SELECT message_id, analyzed_at FROM conversations WHERE analyzed_at IS NOT NULL").fetchall())
+            self._conn.execute("DELETE FROM conversations")
+            self._conn.commit()
+
+        records.sort(key=lambda record: (record[1].get('parsed_date') or '', str(record[0])))
+        for json_file, email_data in records:
+            self.add(email_data['message_id'].strip(), email_data.get('in_reply_to', ''),
+                     email_data.get('references', ''), str(json_file),
+                     email_data.get('date_folder') or json_file.parent.name,
+                     email_data.get('subject', ''), email_data.get('from', ''), email_data.get('parsed_date') or '')
+
+        with self._lock:
+            self._conn.executemany("UPDATE conversations SET analyzed_at = ? WHERE message_id = ?",
+                                   [(when, message_id) for message_id, when in analyzed.items()])
+            self._conn.commit()
+
+        if self.logger:
+            self.logger.info(f"🧵 Индекс переписок пересобран: {len(records)} писем")
+        return len(records)
+
+    def _read_json_files(self, emails_dir: Path) -> Iterable[Tuple[str, Dict]]:
+        for json_file in sorted(emails_dir.glob("*/email_*.json")):
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    yield str(json_file), json.load(f)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"⚠️ Индекс переписок: пропущен поврежденный файл {json_file.name}: {e}")
+
+    def close(self):
+        """🔐 Закрытие соединения с базой"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> Dict:
+        entry = dict(row)
+        entry['refs'] = json.loads(entry['refs'] or '[]')
+        return entry
@@ -4,11 +4,16 @@
 📧 Загрузчик обработанных писем v1.1 с исправлением ошибок
 """
 
-import json
+import sys
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime
 
+sys.path.append(str(Path(__file__).parent))
+
+from email_store import EmailStore
+from email_manifest import EmailManifest, STATE_ANALYZED
+
 
 class ProcessedEmailLoader:
     """📧 Загрузчик обработанных писем"""
@@ -20,11 +25,25 @@ class ProcessedEmailLoader:
         self.data_dir = project_root / "data"
         self.emails_dir = self.data_dir / "emails"
         self.attachments_dir = self.data_dir / "attachments"
+        self._email_store = None
+        self._manifest = None
         
         print("📁 Инициализация загрузчика:")
         print(f"   📧 Письма: {self.emails_dir}")
         print(f"   📎 Вложения: {self.attachments_dir}")
 
+    def get_email_store(self) -> EmailStore:
+        """🗄️ Хранилище писем (создается при первом чтении)"""
+        if self._email_store is None:
+            self._email_store = EmailStore(self.emails_dir)
+        return self._email_store
+
+    def get_manifest(self) -> EmailManifest:
+        """📋 Манифест писем по дням (создается при первом чтении)"""
+        if self._manifest is None:
+            self._manifest = EmailManifest(self.data_dir / "email_manifest.db")
+        return self._manifest
+
     def get_available_date_folders(self) -> List[str]:
         """📅 Получение списка доступных дат"""
         
@@ -48,23 +67,62 @@ class ProcessedEmailLoader:
             return []
         
         emails = []
-        json_files = list(date_folder.glob("email_*.json"))
+        names = self.get_email_store().names(date)
         
-        print(f"📧 Загрузка писем за {date}: найдено {len(json_files)} файлов")
+        print(f"📧 Загрузка писем за {date}: найдено {len(names)} файлов")
         
-        for json_file in sorted(json_files):
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    email_data = json.load(f)
-                    emails.append(email_data)
-            except Exception as e:
-                print(f"❌ Ошибка загрузки {json_file}: {e}")
+        try:
+            # Совместимое чтение: отдельные email_*.json и сжатый сегмент дня
+            for email_path, email_data in self.get_email_store().iter_day(date):
+                if email_data is None:
+                    print(f"❌ Ошибка загрузки {email_path}")
+                    continue
+                emails.append(email_data)
+        except Exception as e:
+            print(f"❌ Ошибка загрузки {date_folder}: {e}")
         
         print(f"✅ Успешно загружено: {len(emails)} писем")
         return emails
 
+    def iter_manifest(self, date: str, with_attachments: bool = False,
+                      unprocessed: bool = False) -> Iterator[Dict]:
+        """📋 Записи манифеста за дату без чтения самих писем
+
+        Письма, сохраненные до появления манифеста, дописываются в него при
+        первом обращении к дню. Фильтры - как в EmailManifest.entries.
+        """
+        if not (self.emails_dir / date).exists():
+            return
+        store = self.get_email_store()
+        manifest = self.get_manifest()
+        manifest.sync_day(date, store.names(date), lambda name: store.read(date, name))
+        yield from manifest.entries(date, with_attachments=with_attachments, unprocessed=unprocessed)
+
+    def load_email(self, entry: Dict) -> Optional[Dict]:
+        """📖 Полное письмо по записи манифеста (None, если письмо не читается)"""
+        return self.get_email_store().read(entry['date_folder'], entry['name'])
+
+    def iter_emails(self, date: str, with_attachments: bool = False,
+                    unprocessed: bool = False) -> Iterator[Dict]:
+        """🌊 Ленивый перебор писем за дату: в памяти только текущее письмо"""
+        for entry in self.iter_manifest(date, with_attachments=with_attachments, unprocessed=unprocessed):
+            email = self.load_email(entry)
+            if email is None:
+                print(f"❌ Ошибка загрузки {date}/{entry['name']}")
+                continue
+            yield email
+
+    def iter_all_emails(self, with_attachments: bool = False, unprocessed: bool = False) -> Iterator[Dict]:
+        """🌊 Ленивый перебор писем по всем датам"""
+        for date in self.get_available_date_folders():
+            yield from self.iter_emails(date, with_attachments=with_attachments, unprocessed=unprocessed)
+
+    def mark_processed(self, email: Dict):
+        """✅ Письмо разобрано LLM: iter_emails(unprocessed=True) его больше не отдает"""
+        self.get_manifest().mark(email.get('message_id') or '', STATE_ANALYZED)
+
     def load_all_emails(self) -> Dict[str, List[Dict]]:
-        """📧 Загрузка ВСЕХ писем по всем датам"""
+        """📧 Загрузка ВСЕХ писем по всем датам (весь архив в памяти - для больших архивов iter_all_emails)"""
         
         available_dates = self.get_available_date_folders()
         all_emails = {}
@@ -125,6 +183,13 @@ class ProcessedEmailLoader:
             if constructed_path.exists():
                 return constructed_path
         
+        # 🆕 Вложение из хранилища по SHA-256: attachments/blobs/<ab>/<sha256><ext>
+        sha256 = attachment.get('sha256')
+        if sha256 and saved_filename:
+            blob_path = self.attachments_dir / 'blobs' / sha256[:2] / saved_filename
+            if blob_path.exists():
+                return blob_path
+        
         print(f"⚠️ Файл вложения не найден: {attachment.get('original_filename', 'неизвестно')}")
         return None
 
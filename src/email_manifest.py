@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📋 Манифест сохраненных писем по дням (SQLite)
+Короткая запись на письмо: Message-ID, тема, отправитель, размер, число
+вложений, объем текста, хэш содержимого и состояние обработки. Парсер
+пополняет манифест при сохранении, загрузчик фильтрует и перебирает письма
+по нему, а полные JSON открывает только для отобранных писем.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+STATE_SAVED = 'saved'           # Письмо сохранено парсером
+STATE_ANALYZED = 'analyzed'     # Письмо разобрано LLM-процессором
+
+
+def content_hash(email_data: Dict) -> str:
+    """🔑 SHA-256 тела письма и отпечатков вложений: меняется только при изменении содержимого"""
+    digest = hashlib.sha256((email_data.get('body') or '').encode('utf-8'))
+    for att in email_data.get('attachments', []):
+        if isinstance(att, dict):
+            digest.update((att.get('sha256') or att.get('original_filename') or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def saved_attachment_count(email_data: Dict) -> int:
+    """📎 Число успешно скачанных вложений, включая общие с другими письмами (deduplicated)
+
+    Как в ProcessedEmailLoader.get_emails_with_attachments: статус saved и путь к файлу.
+    """
+    return sum(1 for att in email_data.get('attachments', [])
+               if isinstance(att, dict) and att.get('status') == 'saved' and att.get('file_path'))
+
+
+class EmailManifest:
+    """📋 Манифест писем: одна строка на письмо дня"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS manifest (
+            date_folder TEXT NOT NULL,
+            name TEXT NOT NULL,
+            message_id TEXT,
+            subject TEXT,
+            sender TEXT,
+            size INTEGER NOT NULL DEFAULT 0,
+            attachment_count INTEGER NOT NULL DEFAULT 0,
+            saved_attachments INTEGER NOT NULL DEFAULT 0,
+            char_count INTEGER NOT NULL DEFAULT 0,
+            content_hash TEXT,
+            state TEXT NOT NULL DEFAULT 'saved',
+            updated_at TEXT,
+            PRIMARY KEY (date_folder, name)
+        )
+    """
+
+    def __init__(self, db_path: Path, logger=None):
+        self.db_path = Path(db_path)
+        self.logger = logger
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Одно соединение на все потоки пула, доступ через блокировку
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS manifest_message ON manifest(message_id)")
+            self._conn.commit()
+
+    def record(self, date_folder: str, name: str, email_data: Dict):
+        """💾 Запись письма в манифест после сохранения
+
+        Повторное сохранение с тем же содержимым сохраняет состояние обработки,
+        измененное письмо снова считается необработанным.
+        """
+        with self._lock:
+            self._record(date_folder, name, email_data)
+            self._conn.commit()
+
+    def _record(self, date_folder: str, name: str, email_data: Dict):
+        self._conn.execute(
+            """
+            INSERT INTO manifest (date_folder, name, message_id, subject, sender, size, attachment_count,
+                                  saved_attachments, char_count, content_hash, state, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(date_folder, name) DO UPDATE SET
+                message_id = excluded.message_id,
+                subject = excluded.subject,
+                sender = excluded.sender,
+                size = excluded.size,
+                attachment_count = excluded.attachment_count,
+                saved_attachments = excluded.saved_attachments,
+                char_count = excluded.char_count,
+                state = CASE WHEN manifest.content_hash = excluded.content_hash
+                             THEN manifest.state ELSE excluded.state END,
+                content_hash = excluded.content_hash,
+                updated_at = excluded.updated_at
+            """,
+            (date_folder, name, (email_data.get('message_id') or '').strip() or None,
+             email_data.get('subject', ''), email_data.get('from', ''), email_data.get('raw_size') or 0,
+             len(email_data.get('attachments', [])), saved_attachment_count(email_data),
+             email_data.get('char_count') or len(email_data.get('body') or ''), content_hash(email_data),
+             STATE_SAVED, datetime.now().isoformat())
+        )
+
+    def sync_day(self, date_folder: str, names: List[str], read: Callable[[str], Optional[Dict]]) -> int:
+        """🔄 Дозапись писем дня, которых нет в манифесте (папки до появления манифеста)
+
+        names - все письма дня, read(имя) - чтение письма; открываются только недостающие.
+        Returns: число добавленных записей.
+        """
+        with self._lock:
+            known = {row[0] for row in self._conn.execute(
+                "SELECT name FROM manifest WHERE date_folder = ?", (date_folder,))}
+        missing = [name for name in names if name not in known]
+        if not missing:
+            return 0
+
+        added = 0
+        for name in missing:
+            email_data = read(name)
+            if email_data is None:
+                continue
+            with self._lock:
+                self._record(date_folder, name, email_data)
+            added += 1
+        with self._lock:
+            self._conn.commit()
+        if added and self.logger:
+            self.logger.info(f"📋 Манифест {date_folder}: добавлено {added} писем")
+        return added
+
+    def entries(self, date_folder: str, with_attachments: bool = False,
+                unprocessed: bool = False) -> Iterator[Dict]:
+        """📋 Записи дня по порядку имен; фильтры не открывают сами письма
+
+        with_attachments - только письма со скачанными вложениями,
+        unprocessed - только еще не разобранные LLM.
+        """
+        query = "SELECT * FROM manifest WHERE date_folder = ?"
+        if with_attachments:
+            query += " AND saved_attachments > 0"
+        if unprocessed:
+            query += f" AND state != '{STATE_ANALYZED}'"
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY name", (date_folder,)).fetchall()
+        for row in rows:
+            yield dict(row)
+
+    def mark(self, message_id: str, state: str = STATE_ANALYZED):
+        """✅ Смена состояния обработки письма (по всем дням, где оно сохранено)"""
+        if not message_id:
+            return
+        with self._lock:
+            self._conn.execute("UPDATE manifest SET state = ?, updated_at = ? WHERE message_id = ?",
+                               (state, datetime.now().isoformat(), message_id.strip()))
+            self._conn.commit()
+
+    def close(self):
+        """🔐 Закрытие соединения с базой"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗄️ Хранилище писем: JSON-файл на письмо или сжатый сегмент JSONL на день
+Режим 'json' (по умолчанию) пишет data/emails/<дата>/email_*.json как раньше.
+Режим 'segments' дописывает каждое письмо отдельным сжатым кадром (zstd, если
+установлен zstandard, иначе gzip) в data/emails/<дата>/emails.jsonl.<zst|gz>;
+смещения кадров лежат в SQLite-индексе data/emails/segments.db - по нему
+письмо читается по Message-ID без распаковки остального дня. Чтение всегда
+совместимо: день может содержать и сегмент, и старые JSON-файлы.
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+EMAIL_STORE = os.getenv('EMAIL_STORE', 'json')   # 'json' или 'segments'
+SEGMENT_STEM = 'emails.jsonl'
+SEGMENT_SUFFIXES = ('.zst', '.gz')
+INDEX_NAME = 'segments.db'
+LOCATOR_SEPARATOR = '#'      # Путь письма в сегменте: <сегмент>#<имя email_*.json>
+
+
+def compress_record(data: bytes, suffix: str) -> bytes:
+    """🗜️ Один самостоятельный кадр: кадры gzip/zstd можно склеивать подряд"""
+    if suffix == '.zst':
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress_record(data: bytes, suffix: str) -> bytes:
+    if suffix == '.zst':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class EmailStore:
+    """🗄️ Запись и чтение писем дня в JSON-файлах или в сжатом сегменте"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            date_folder TEXT NOT NULL,
+            name TEXT NOT NULL,
+            message_id TEXT,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            stored_at TEXT,
+            PRIMARY KEY (date_folder, name)
+        )
+    """
+
+    def __init__(self, emails_dir: Path, backend: Optional[str] = None, logger=None):
+        self.emails_dir = Path(emails_dir)
+        self.backend = backend or EMAIL_STORE
+        if self.backend not in ('json', 'segments'):
+            raise ValueError(f"Неизвестное хранилище писем: {self.backend}")
+        self.logger = logger
+        self.emails_dir.mkdir(parents=True, exist_ok=True)
+
+        # Одно соединение на все потоки пула; между процессами запись сериализует BEGIN IMMEDIATE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.emails_dir / INDEX_NAME), check_same_thread=False,
+                                     timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_message ON records(message_id)")
+
+    # ---------- запись ----------
+
+    def segment_path(self, date_folder: str) -> Path:
+        """📼 Сегмент дня: уже существующий (любого сжатия) или новый с лучшим доступным сжатием"""
+        day_dir = self.emails_dir / date_folder
+        for suffix in SEGMENT_SUFFIXES:
+            path = day_dir / f"{SEGMENT_STEM}{suffix}"
+            if path.exists():
+                return path
+        return day_dir / f"{SEGMENT_STEM}{'.zst' if ZSTD_AVAILABLE else '.gz'}"
+
+    def locator(self, date_folder: str, name: str) -> str:
+        """📍 Где будет лежать письмо: путь JSON-файла или <сегмент>#<имя>"""
+        if self.backend == 'json':
+            return str(self.emails_dir / date_folder / name)
+        return f"{self.segment_path(date_folder)}{LOCATOR_SEPARATOR}{name}"
+
+    def save(self, date_folder: str, name: str, email_data: Dict) -> str:
+        """💾 Сохранение письма. Returns: локатор для индексов (см. locator)"""
+        day_dir = self.emails_dir / date_folder
+        day_dir.mkdir(parents=True, exist_ok=True)
+        if self.backend == 'json':
+            email_path = day_dir / name
+            with open(email_path, 'w', encoding='utf-8') as f:
+                json.dump(email_data, f, ensure_ascii=False, indent=2)
+            return str(email_path)
+
+        self.append(date_folder, [(name, email_data)])
+        return self.locator(date_folder, name)
+
+    def append(self, date_folder: str, records: List[Tuple[str, Dict]]):
+        """➕ Дозапись писем в сегмент дня одной транзакцией индекса
+
+        Кадр пишется до фиксации строки индекса: после сбоя в сегменте может
+        остаться хвост без записи в индексе - читатели его не видят.
+        """
+        segment = self.segment_path(date_folder)
+        segment.parent.mkdir(parents=True, exist_ok=True)
+        frames = [(name, email_data, compress_record(
+            json.dumps(email_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n',
+            segment.suffix)) for name, email_data in records]
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                with open(segment, 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    rows = []
+                    for name, email_data, frame in frames:
+                        f.write(frame)
+                        rows.append((date_folder, name, (email_data.get('message_id') or '').strip() or None,
+                                     segment.name, offset, len(frame), datetime.now().isoformat()))
+                        offset += len(frame)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO records (date_folder, name, message_id, segment, offset, length, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---------- чтение ----------
+
+    def _read_frame(self, date_folder: str, row: sqlite3.Row, handle=None) -> Dict:
+        path = self.emails_dir / date_folder / row['segment']
+        if handle is None:
+            with open(path, 'rb') as f:
+                f.seek(row['offset'])
+                frame = f.read(row['length'])
+        else:
+            handle.seek(row['offset'])
+            frame = handle.read(row['length'])
+        return json.loads(decompress_record(frame, path.suffix))
+
+    def _segment_rows(self, date_folder: str) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM records WHERE date_folder = ? ORDER BY segment, offset", (date_folder,)
+            ).fetchall()
+
+    def names(self, date_folder: str) -> List[str]:
+        """📋 Имена писем дня (email_*.json) из сегмента и из отдельных файлов"""
+        loose = [path.name for path in (self.emails_dir / date_folder).glob("email_*.json")]
+        return sorted(set(loose) | {row['name'] for row in self._segment_rows(date_folder)})
+
+    def dates(self) -> List[str]:
+        """📅 Папки дней (YYYY-MM-DD), где есть письма"""
+        return sorted(folder.name for folder in self.emails_dir.iterdir()
+                      if folder.is_dir() and folder.name.count('-') == 2)
+
+    def iter_day(self, date_folder: str) -> Iterator[Tuple[str, Dict]]:
+        """🌊 Потоковое чтение писем дня по порядку имен: (локатор, письмо)
+
+        Сегмент читается одним открытым файлом, кадр за кадром; отдельные
+        JSON-файлы (старый формат или режим 'json') - как раньше. Вместо
+        поврежденного файла отдается (путь, None).
+        """
+        day_dir = self.emails_dir / date_folder
+        rows = {row['name']: row for row in self._segment_rows(date_folder)}
+        loose = {path.name: path for path in day_dir.glob("email_*.json")}
+        handles = {}
+        try:
+            for name in sorted(set(rows) | set(loose)):
+                if name in loose:
+                    try:
+                        with open(loose[name], 'r', encoding='utf-8') as f:
+                            email_data = json.load(f)
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.warning(f"⚠️ Хранилище: поврежденный файл {loose[name]}: {e}")
+                        email_data = None
+                    yield str(loose[name]), email_data
+                    continue
+                row = rows[name]
+                if row['segment'] not in handles:
+                    handles[row['segment']] = open(day_dir / row['segment'], 'rb')
+                yield f"{day_dir / row['segment']}{LOCATOR_SEPARATOR}{name}", self._read_frame(date_folder, row, handles[row['segment']])
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def iter_all(self) -> Iterator[Tuple[str, Dict]]:
+        """🌊 Все читаемые письма хранилища по дням"""
+        for date_folder in self.dates():
+            for locator, email_data in self.iter_day(date_folder):
+                if email_data is not None:
+                    yield locator, email_data
+
+    def _locate(self, locator: str) -> Optional[Tuple[str, sqlite3.Row]]:
+        segment, _, name = str(locator).partition(LOCATOR_SEPARATOR)
+        date_folder = Path(segment).parent.name
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM records WHERE date_folder = ? AND name = ?",
+                                     (date_folder, name)).fetchone()
+        return (date_folder, row) if row is not None else None
+
+    def exists(self, locator: str) -> bool:
+        """🔍 Есть ли письмо по локатору (путь JSON-файла или <сегмент>#<имя>)"""
+        if LOCATOR_SEPARATOR not in str(locator):
+            return Path(locator).exists()
+        return self._locate(locator) is not None
+
+    def load(self, locator: str) -> Optional[Dict]:
+        """📖 Письмо по локатору (None, если его нет)"""
+        if LOCATOR_SEPARATOR not in str(locator):
+            if not Path(locator).exists():
+                return None
+            with open(locator, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        found = self._locate(locator)
+        return self._read_frame(*found) if found else None
+
+    def read(self, date_folder: str, name: str) -> Optional[Dict]:
+        """📖 Письмо дня по имени: отдельный JSON-файл или кадр сегмента (None, если не читается)"""
+        path = self.emails_dir / date_folder / name
+        try:
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            with self._lock:
+                row = self._conn.execute("SELECT * FROM records WHERE date_folder = ? AND name = ?",
+                                         (date_folder, name)).fetchone()
+            return self._read_frame(date_folder, row) if row is not None else None
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"⚠️ Хранилище: письмо {date_folder}/{name} не прочитано: {e}")
+            return None
+
+    def get_by_message_id(self, message_id: str) -> Optional[Dict]:
+        """🎯 Произвольный доступ к письму сегмента по Message-ID (последняя запись)"""
+        if not message_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM records WHERE message_id = ? ORDER BY rowid DESC LIMIT 1", (message_id,)
+            ).fetchone()
+        return self._read_frame(row['date_folder'], row) if row is not None else None
+
+    # ---------- перенос старых папок ----------
+
+    def convert_day(self, date_folder: str) -> int:
+        """🔄 Перенос email_*.json дня в сегмент; файлы удаляются после фиксации индекса"""
+        files = sorted((self.emails_dir / date_folder).glob("email_*.json"))
+        records = []
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records.append((path.name, json.load(f)))
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"⚠️ Хранилище: пропущен поврежденный файл {path}: {e}")
+        if not records:
+            return 0
+
+        self.append(date_folder, records)
+        for name, _ in records:
+            (self.emails_dir / date_folder / name).unlink()
+        return len(records)
+
+    def convert_all(self) -> int:
+        """🔄 Перенос всех дней в сегменты. Returns: число перенесенных писем"""
+        converted = sum(self.convert_day(date_folder) for date_folder in self.dates())
+        if self.logger:
+            self.logger.info(f"🗄️ Письма перенесены в сжатые сегменты: {converted}")
+        return converted
+
+    def close(self):
+        """🔐 Закрытие индекса"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚡ Скомпилированные фильтры писем
+Правила из config/ разбираются один раз при загрузке: подстроки тем - в автомат
+Ахо-Корасик, черный список - в хэш-таблицы и префиксное дерево, маски имен
+файлов - в одно регулярное выражение. Проверка письма не перебирает правила.
+"""
+
+import re
+import fnmatch
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+class AhoCorasick:
+    """🔤 Автомат Ахо-Корасик для поиска любой из подстрок за один проход по тексту"""
+
+    def __init__(self, words: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[str]] = [None]
+
+        for word in words:
+            if word:
+                self._add(word)
+        self._build()
+
+    def _add(self, word: str):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            state = nxt
+        if self._output[state] is None:
+            self._output[state] = word
+
+    def _build(self):
+        """🔗 Переходы по неудаче (BFS) и наследование совпадений от суффиксов"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if state else 0
+                if self._output[nxt] is None:
+                    self._output[nxt] = self._output[self._fail[nxt]]
+
+    def search(self, text: str) -> Optional[str]:
+        """🔍 Первая найденная подстрока (None, если совпадений нет)"""
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class AddressMatcher:
+    """📮 Черный список адресов: точные адреса, домены (*@domain) и префиксы (info@*)"""
+
+    def __init__(self, rules: Iterable[str]):
+        self.exact = set()
+        self.domains = set()
+        self._prefix_trie: Dict[str, dict] = {}
+
+        for rule in rules:
+            rule = rule.strip().lower()
+            if not rule:
+                continue
+            if rule.endswith('*'):
+                self._add_prefix(rule[:-1])
+            elif rule.startswith('*@'):
+                self.domains.add(rule[2:])
+            else:
+                self.exact.add(rule)
+
+    def _add_prefix(self, prefix: str):
+        node = self._prefix_trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[''] = prefix  # маркер конца правила
+
+    def _match_prefix(self, address: str) -> Optional[str]:
+        node = self._prefix_trie
+        if '' in node:
+            return node['']
+        for ch in address:
+            node = node.get(ch)
+            if node is None:
+                return None
+            if '' in node:
+                return node['']
+        return None
+
+    def match(self, address: str) -> Optional[str]:
+        """🚫 Причина блокировки адреса (формулировки как у прежней построчной проверки)"""
+        prefix = self._match_prefix(address)
+        if prefix is not None:
+            return f"адрес начинается с '{prefix}' (в черном списке)"
+
+        if '@' in address:
+            domain = address.rsplit('@', 1)[1]
+            if domain in self.domains:
+                return f"домен в черном списке ({domain})"
+
+        if address in self.exact:
+            return f"адрес в черном списке"
+        return None
+
+
+class FilenameMatcher:
+    """📎 Исключения имен файлов: маски со * в одном регулярном выражении, точные имена в множестве"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.exact: Dict[str, str] = {}
+        self._globs: List[str] = []
+
+        for pattern in patterns:
+            if '*' in pattern:
+                self._globs.append(pattern)
+            else:
+                self.exact.setdefault(pattern.lower(), pattern)
+
+        self._regex = None
+        if self._globs:
+            combined = '|'.join(f'(?P<g{i}>{fnmatch.translate(glob.lower())})' for i, glob in enumerate(self._globs))
+            self._regex = re.compile(combined)
+
+    def match_glob(self, filename: str) -> Optional[str]:
+        """🔍 Маска, которой соответствует имя (в нижнем регистре)"""
+        if self._regex is None:
+            return None
+        m = self._regex.match(filename)
+        if m is None:
+            return None
+        return self._globs[int(m.lastgroup[1:])]
+
+    def match_exact(self, filename: str) -> Optional[str]:
+        return self.exact.get(filename)
+
+
+def _imap_quotable(value: str) -> bool:
+    """🔤 Строку можно передать в SEARCH без литерала: ASCII, без кавычек и управляющих символов"""
+    return value.isascii() and value.isprintable() and '"' not in value and '\\' not in value
+
+
+def build_search_exclusions(subject_terms: Iterable[str], blacklist_rules: Iterable[str],
+                            max_length: int) -> List[str]:
+    """📡 Перевод правил в ключи IMAP SEARCH вида NOT FROM "..." / NOT SUBJECT "..."
+
+    На сервер уходят только правила, которые там не могут исключить лишнего:
+    адреса ищутся в угловых скобках (<addr>, @domain>, <prefix), поэтому подстрока
+    не зацепит bigboss@ или notspam.ru. Письма с адресом без скобок и правила
+    с кириллицей или спецсимволами остаются локальной проверке. Общая длина
+    критериев ограничена max_length, чтобы не упереться в лимит строки команды.
+    """
+    keys: List[str] = []
+
+    for rule in sorted(r.strip().lower() for r in blacklist_rules):
+        if not rule:
+            continue
+        if rule.endswith('*'):
+            needle = '<' + rule[:-1]
+            if '*' in needle or len(needle) < 3:
+                continue
+        elif rule.startswith('*@'):
+            needle = '@' + rule[2:] + '>'
+            if '*' in needle:
+                continue
+        elif '@' in rule and '*' not in rule:
+            needle = '<' + rule + '>'
+        else:
+            continue
+        if _imap_quotable(needle):
+            keys.append(f'NOT FROM "{needle}"')
+
+    for term in sorted(t.strip() for t in subject_terms):
+        if len(term) >= 3 and _imap_quotable(term):
+            keys.append(f'NOT SUBJECT "{term}"')
+
+    selected: List[str] = []
+    length = 0
+    for key in keys:
+        if length + len(key) + 1 > max_length:
+            break
+        selected.append(key)
+        length += len(key) + 1
+    return selected
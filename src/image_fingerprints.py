@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🖼️ Индекс отпечатков мусорных изображений (логотипы, подписи, баннеры)
+Правила и отпечатки живут в config/junk_images.json и перечитываются при
+изменении файла. Изображение сначала проверяется по заголовку: формат,
+ширина и высота берутся из первых килобайт base64, размер считается по
+длине закодированного текста - полное декодирование не нужно. Отпечаток
+содержит SHA-256 и, если есть, перцептивный dHash (64 бита). Индекс учится
+на отклоненных изображениях и на картинках, пришедших от N разных отправителей.
+"""
+
+import binascii
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SNIFF_BYTES = 64 * 1024          # Декодированных байт начала файла для чтения заголовка
+SIGHTING_SENDERS = 3             # Картинка от стольких разных отправителей считается мусорной
+DHASH_MAX_DISTANCE = 4           # Допустимое расстояние Хэмминга между dHash
+RELOAD_INTERVAL = 5              # Как часто проверять изменения файла отпечатков, секунд
+
+# Несжатые форматы: длина файла следует из размеров, быстрый ключ не отличит разные картинки
+WEAK_KEY_FORMATS = {'bmp', 'tiff', None}
+
+# Файл, поставляемый с проектом: его правила и имена действуют, пока своего config/junk_images.json нет
+SHIPPED_CONFIG = Path(__file__).resolve().parent.parent / 'config' / 'junk_images.json'
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_BASE64_SKIP = ('\r', '\n', ' ', '\t')
+
+
+def image_header_info(data: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """🔍 Формат и размеры изображения по первым байтам файла: (format, width, height)"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+    if data[:2] == b'BM' and len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        return 'bmp', width, abs(height)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8X':
+            return 'webp', 1 + int.from_bytes(data[24:27], 'little'), 1 + int.from_bytes(data[27:30], 'little')
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return 'webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return 'webp', None, None
+    if data[:2] == b'\xff\xd8':
+        # Идем по сегментам до SOFn - там высота и ширина
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker in _JPEG_SOF:
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return 'jpeg', width, height
+            if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+        return 'jpeg', None, None
+    if data[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff', None, None
+    return None, None, None
+
+
+def sniff_image(part) -> Optional[Dict]:
+    """👃 Проверка изображения без полного декодирования
+
+    Для base64 декодируется только начало (SNIFF_BYTES), размер файла
+    вычисляется по длине текста без пробелов и выравнивания '='.
+    Returns: {'format', 'width', 'height', 'size'} или None, если часть пустая.
+    """
+    payload = part.get_payload()
+    encoding = str(part.get('content-transfer-encoding', '')).strip().lower()
+
+    if isinstance(payload, str) and encoding == 'base64':
+        stripped = len(payload) - sum(payload.count(ch) for ch in _BASE64_SKIP)
+        padding = len(payload.rstrip()) - len(payload.rstrip().rstrip('='))
+        size = max(0, stripped * 3 // 4 - padding)
+        head_text = ''.join(payload[:SNIFF_BYTES * 4 // 3 + 4096].split())
+        head_text = head_text[:len(head_text) - len(head_text) % 4]
+        try:
+            head = binascii.a2b_base64(head_text)
+        except binascii.Error:
+            head = b''
+    else:
+        head = part.get_payload(decode=True) or b''
+        size = len(head)
+
+    if not size:
+        return None
+    image_format, width, height = image_header_info(head[:SNIFF_BYTES])
+    return {'format': image_format, 'width': width, 'height': height, 'size': size}
+
+
+def image_dhash(path: Path) -> Optional[str]:
+    """🧮 Перцептивный dHash (64 бита, hex) - устойчив к пересжатию и смене формата"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            pixels = list(img.convert('L').resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def dhash_distance(first: str, second: str) -> int:
+    """📐 Расстояние Хэмминга между двумя dHash"""
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+
+class JunkImageIndex:
+    """🖼️ Правила и отпечатки мусорных изображений с обучением"""
+
+    def __init__(self, config_path: Path, sightings_path: Path, logger=None,
+                 sighting_senders: int = SIGHTING_SENDERS):
+        self.config_path = Path(config_path)
+        self.logger = logger
+        self.sighting_senders = sighting_senders
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._last_reload_check = 0.0
+
+        Path(sightings_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(sightings_path), check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sightings (
+                    sha256 TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    seen_at TEXT,
+                    PRIMARY KEY (sha256, sender)
+                )
+                """
+            )
+            self._conn.commit()
+        self.load()
+
+    def load(self):
+        """📋 Загрузка config/junk_images.json (без файла - правила и имена из SHIPPED_CONFIG)"""
+        data: Dict = {}
+        mtime = None
+        source = self.config_path
+        if not source.exists() and SHIPPED_CONFIG.exists():
+            source = SHIPPED_CONFIG
+        if source.exists():
+            try:
+                if source == self.config_path:
+                    mtime = source.stat().st_mtime
+                with open(source, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"❌ Ошибка загрузки отпечатков изображений: {e}")
+        rules: List[Dict] = data.get('rules', [])
+        filenames = frozenset(data.get('filenames', []))
+        # Выученные отпечатки берутся только из своего файла
+        fingerprints: Dict[str, Dict] = data.get('fingerprints', {}) if source == self.config_path else {}
+
+        # Быстрые ключи: точное совпадение формата, размеров и длины файла
+        by_quick_key = {}
+        by_dimensions: Dict[Tuple[int, int], List[Dict]] = {}
+        for key, entry in fingerprints.items():
+            if self.has_strong_key(entry):
+                by_quick_key[self.quick_key(entry)] = (key, entry)
+            if entry.get('dhash') and entry.get('width'):
+                by_dimensions.setdefault((entry['width'], entry['height']), []).append(entry)
+
+        # Подмена целиком: параллельные воркеры видят либо старый, либо новый набор
+        self.rules, self.filenames, self.fingerprints = rules, filenames, fingerprints
+        self._by_quick_key, self._by_dimensions = by_quick_key, by_dimensions
+        self._mtime = mtime
+
+    def reload_if_changed(self) -> bool:
+        """🔄 Перечитывание файла отпечатков, если он изменился (не чаще RELOAD_INTERVAL)"""
+        now = time.time()
+        if now - self._last_reload_check < RELOAD_INTERVAL:
+            return False
+        self._last_reload_check = now
+        try:
+            mtime = self.config_path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            self.load()
+        return True
+
+    @staticmethod
+    def quick_key(info: Dict) -> str:
+        """🔑 Ключ заголовочной проверки: формат:ШxВ:размер"""
+        return f"{info.get('format')}:{info.get('width')}x{info.get('height')}:{info.get('size')}"
+
+    @staticmethod
+    def has_strong_key(info: Dict) -> bool:
+        """🔑 Однозначен ли быстрый ключ (сжатый формат с известными размерами)"""
+        return info.get('format') not in WEAK_KEY_FORMATS and info.get('width') is not None
+
+    def check(self, filename: str, sniff: Dict) -> Optional[Dict]:
+        """🚫 Проверка по заголовку: отпечаток или правило. Returns: {'kind', 'reason'} или None"""
+        self.reload_if_changed()
+        found = self._by_quick_key.get(self.quick_key(sniff))
+        if found:
+            return {'kind': 'fingerprint', 'key': found[0], 'reason': found[1].get('reason', 'известный мусорный файл')}
+
+        name = (filename or '').lower()
+        for rule in self.rules:
+            match = rule.get('match')
+            if match == 'prefix' and name.startswith(rule['prefix']) and sniff['size'] < rule['max_size']:
+                return {'kind': 'size', 'reason': rule.get('reason', f"{rule['prefix']} < {rule['max_size']} байт")}
+            if match == 'size' and sniff['size'] == rule['size']:
+                return {'kind': 'size', 'reason': rule.get('reason', f"размер {rule['size']} байт")}
+            if match == 'dimensions' and (sniff['width'], sniff['height']) == (rule['width'], rule['height']):
+                return {'kind': 'dimensions', 'reason': rule.get('reason', f"{rule['width']}×{rule['height']}")}
+        return None
+
+    def needs_dhash(self, sniff: Dict) -> bool:
+        """🧮 Есть ли отпечатки с такими же размерами, которые сравниваются по dHash"""
+        return (sniff.get('width'), sniff.get('height')) in self._by_dimensions
+
+    def match_dhash(self, sniff: Dict, dhash: Optional[str]) -> Optional[Dict]:
+        """🧮 Отпечаток того же размера с близким dHash"""
+        if not dhash:
+            return None
+        for entry in self._by_dimensions.get((sniff.get('width'), sniff.get('height')), []):
+            if dhash_distance(entry['dhash'], dhash) <= DHASH_MAX_DISTANCE:
+                return entry
+        return None
+
+    def learn(self, sniff: Dict, reason: str, source: str, sha256: Optional[str] = None,
+              dhash: Optional[str] = None) -> bool:
+        """📚 Новый отпечаток (ключ - SHA-256 или быстрый ключ заголовка). Returns: добавлен ли"""
+        if not sha256 and not self.has_strong_key(sniff):
+            return False
+        key = sha256 or self.quick_key(sniff)
+        with self._lock:
+            self.load()  # файл могли дополнить другие процессы
+            if key in self.fingerprints or self.quick_key(sniff) in self._by_quick_key:
+                return False
+            fingerprints = dict(self.fingerprints)
+            fingerprints[key] = {
+                'size': sniff.get('size'), 'width': sniff.get('width'), 'height': sniff.get('height'),
+                'format': sniff.get('format'), 'dhash': dhash, 'sha256': sha256,
+                'reason': reason, 'source': source, 'added_at': datetime.now().isoformat(),
+            }
+            self._save(self.rules, fingerprints)
+            self.load()
+        if self.logger:
+            self.logger.info(f"📚 Новый отпечаток мусорного изображения: {key} ({reason})")
+        return True
+
+    def record_sighting(self, sha256: str, sender: str, sniff: Dict, blob_path: Optional[Path] = None) -> bool:
+        """👀 Учет отправителя картинки; от SIGHTING_SENDERS разных отправителей - в отпечатки"""
+        if not sha256 or not sender or sha256 in self.fingerprints:
+            return False
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO sightings (sha256, sender, seen_at) VALUES (?, ?, ?)",
+                               (sha256, sender.lower(), datetime.now().isoformat()))
+            self._conn.commit()
+            senders = self._conn.execute("SELECT COUNT(*) FROM sightings WHERE sha256 = ?", (sha256,)).fetchone()[0]
+        if senders < self.sighting_senders:
+            return False
+        dhash = image_dhash(blob_path) if blob_path else None
+        return self.learn(sniff, f"встречается у {senders} разных отправителей", 'sightings',
+                          sha256=sha256, dhash=dhash)
+
+    def _save(self, rules: List[Dict], fingerprints: Dict[str, Dict]):
+        """💾 Атомарная запись файла отпечатков"""
+        self.config_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.config_path.with_name(f".{self.config_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rules': rules, 'filenames': sorted(self.filenames), 'fingerprints': fingerprints},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.config_path)
+
+    def close(self):
+        """🔐 Закрытие базы наблюдений"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Метрики IMAP-уровня: задержка каждой команды, байты, повторы и переподключения
+Каждая команда (CONNECT, STARTTLS, LOGIN, SELECT, SEARCH, FETCH по типу
+запрошенных данных, NOOP, STATUS) попадает в гистограмму с фиксированными
+корзинами. Отдельно считается локальная обработка письма (время письма за
+вычетом IMAP-команд того же потока) - по ней видно, где теряется время:
+на сервере, на TLS или в нашем разборе. Объект общий для воркеров пула.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+
+# Верхние границы корзин гистограммы задержек, секунд
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Файл для textfile-коллектора node_exporter (пусто - не писать)
+METRICS_TEXTFILE = os.getenv('IMAP_METRICS_TEXTFILE', '')
+
+_SECTION_ITEM = re.compile(r'BODY(?:\.PEEK)?\[(\d+(?:\.\d+)*)(?:\.MIME)?\]')
+
+
+def fetch_label(items: str) -> str:
+    """🏷️ Метка FETCH по типу запрошенных данных: RFC822, METADATA, HEADER, PARTS, ..."""
+    items = items.upper()
+    if 'RFC822' in items.replace('RFC822.SIZE', '') or 'BODY[]' in items or 'BODY.PEEK[]' in items:
+        return 'FETCH RFC822'
+    if 'HEADER.FIELDS' in items:
+        return 'FETCH METADATA'
+    if _SECTION_ITEM.search(items):
+        return 'FETCH PARTS'
+    if 'HEADER' in items or 'TEXT' in items:
+        return 'FETCH HEADER'
+    if 'BODYSTRUCTURE' in items:
+        return 'FETCH BODYSTRUCTURE'
+    if 'RFC822.SIZE' in items:
+        return 'FETCH SIZE'
+    return 'FETCH'
+
+
+def payload_size(value) -> int:
+    """📏 Байты полезной нагрузки ответа imaplib (строки и литералы, без тегов)"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8', errors='ignore'))
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 0
+
+
+class LatencyHistogram:
+    """📊 Гистограмма задержек одной команды с суммой, максимумом и байтами"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Последняя корзина - +Inf
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def observe(self, seconds: float, bytes_in: int = 0, bytes_out: int = 0, failed: bool = False):
+        index = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.errors += int(failed)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def merge(self, other: 'LatencyHistogram'):
+        """➕ Сложение с гистограммой другого сборщика"""
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+
+    def quantile(self, q: float) -> float:
+        """📐 Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_s': round(self.total, 6),
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'buckets': {('+Inf' if i == len(LATENCY_BUCKETS) else str(LATENCY_BUCKETS[i])): count
+                        for i, count in enumerate(self.buckets)}
+        }
+
+
+class ImapMetrics:
+    """⏱️ Потокобезопасный сборщик метрик IMAP-команд и этапов обработки"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.commands: Dict[str, LatencyHistogram] = {}
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.events: Dict[str, int] = {'retries': 0, 'reconnects': 0, 'connect_failures': 0, 'timeouts': 0}
+        self.started_at = time.time()
+
+    def observe(self, command: str, seconds: float, bytes_in: int = 0, bytes_out: int = 0, failed: bool = False):
+        """➕ Одна выполненная команда"""
+        self._local.imap_seconds = self.thread_imap_seconds() + seconds
+        with self._lock:
+            self.commands.setdefault(command, LatencyHistogram()).observe(seconds, bytes_in, bytes_out, failed)
+
+    def observe_stage(self, stage: str, seconds: float):
+        """➕ Длительность этапа локальной обработки"""
+        with self._lock:
+            self.stages.setdefault(stage, LatencyHistogram()).observe(seconds)
+
+    def count(self, event: str, amount: int = 1):
+        """🔢 Повторы, переподключения, таймауты"""
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + amount
+
+    def merge(self, other: 'ImapMetrics'):
+        """➕ Сложение метрик другого сборщика (например, отдельной папки или учетной записи)"""
+        with other._lock:
+            commands = {name: copy_histogram(hist) for name, hist in other.commands.items()}
+            stages = {name: copy_histogram(hist) for name, hist in other.stages.items()}
+            events = dict(other.events)
+        with self._lock:
+            for target, histograms in ((self.commands, commands), (self.stages, stages)):
+                for name, hist in histograms.items():
+                    target.setdefault(name, LatencyHistogram()).merge(hist)
+            for event, value in events.items():
+                self.events[event] = self.events.get(event, 0) + value
+
+    def thread_imap_seconds(self) -> float:
+        """⏳ Сколько секунд текущий поток провел в IMAP-командах"""
+        return getattr(self._local, 'imap_seconds', 0.0)
+
+    def call(self, command: str, func, *args):
+        """📡 Выполнение команды imaplib с замером задержки и байтов ответа
+
+        Ответ со статусом не OK считается ошибкой, исключение - тоже (и пробрасывается).
+        """
+        bytes_out = len(command) + payload_size(args) + 2
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self.observe(command, time.perf_counter() - started, bytes_out=bytes_out, failed=True)
+            raise
+        status, data = result if isinstance(result, tuple) and len(result) == 2 else ('OK', result)
+        self.observe(command, time.perf_counter() - started, payload_size(data), bytes_out, failed=status != 'OK')
+        return result
+
+    @contextmanager
+    def timed(self, command: str):
+        """⏱️ Замер операции без ответа imaplib (например, установки TCP-соединения)"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(command, time.perf_counter() - started, failed=True)
+            raise
+        self.observe(command, time.perf_counter() - started)
+
+    @contextmanager
+    def local_stage(self, stage: str):
+        """🧮 Этап обработки за вычетом IMAP-команд, выполненных внутри него этим же потоком"""
+        started = time.perf_counter()
+        imap_before = self.thread_imap_seconds()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe_stage(stage, max(0.0, elapsed - (self.thread_imap_seconds() - imap_before)))
+
+    def to_dict(self) -> Dict:
+        """📋 Снимок для processing_stats_*.json"""
+        with self._lock:
+            commands = {name: hist.to_dict() for name, hist in sorted(self.commands.items())}
+            stages = {name: hist.to_dict() for name, hist in sorted(self.stages.items())}
+            events = dict(self.events)
+        return {
+            'commands': commands,
+            'stages': stages,
+            'events': events,
+            'round_trips': sum(item['count'] for item in commands.values()),
+            'bytes_in': sum(item['bytes_in'] for item in commands.values()),
+            'bytes_out': sum(item['bytes_out'] for item in commands.values()),
+            'imap_seconds': round(sum(item['total_s'] for item in commands.values()), 6),
+            'elapsed_s': round(time.time() - self.started_at, 3)
+        }
+
+    def prometheus_text(self) -> str:
+        """📈 Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            commands = {name: copy_histogram(hist) for name, hist in self.commands.items()}
+            stages = {name: copy_histogram(hist) for name, hist in self.stages.items()}
+            events = dict(self.events)
+
+        lines = []
+        for metric, label, histograms, help_text in (
+                ('imap_command_duration_seconds', 'command', commands, 'Задержка IMAP-команды'),
+                ('imap_stage_duration_seconds', 'stage', stages, 'Локальная обработка без IMAP')):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+            for name in sorted(histograms):
+                hist = histograms[name]
+                cumulative = 0
+                for i, count in enumerate(hist.buckets):
+                    cumulative += count
+                    bound = '+Inf' if i == len(LATENCY_BUCKETS) else repr(LATENCY_BUCKETS[i])
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {hist.total:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {hist.count}')
+
+        lines += ['# HELP imap_command_errors_total Команды с ошибкой или статусом не OK',
+                  '# TYPE imap_command_errors_total counter']
+        lines += [f'imap_command_errors_total{{command="{name}"}} {commands[name].errors}' for name in sorted(commands)]
+        lines += ['# HELP imap_bytes_total Байты полезной нагрузки команд и ответов',
+                  '# TYPE imap_bytes_total counter']
+        for name in sorted(commands):
+            lines.append(f'imap_bytes_total{{command="{name}",direction="in"}} {commands[name].bytes_in}')
+            lines.append(f'imap_bytes_total{{command="{name}",direction="out"}} {commands[name].bytes_out}')
+        lines += ['# HELP imap_events_total Повторы, переподключения и таймауты',
+                  '# TYPE imap_events_total counter']
+        lines += [f'imap_events_total{{event="{name}"}} {value}' for name, value in sorted(events.items())]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: Path) -> Path:
+        """💾 Атомарная запись textfile для node_exporter (через временный файл)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        tmp_path.write_text(self.prometheus_text(), encoding='utf-8')
+        os.replace(tmp_path, path)
+        return path
+
+
+def copy_histogram(hist: LatencyHistogram) -> LatencyHistogram:
+    clone = LatencyHistogram()
+    clone.__dict__.update(hist.__dict__, buckets=list(hist.buckets))
+    return clone
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📡 Разбор ответов IMAP-сервера без дополнительных зависимостей
+Токенизатор понимает атомы, строки в кавычках, литералы {N} и вложенные списки,
+поэтому один пакетный FETCH на много писем разбирается в отдельные записи.
+Разобранный BODYSTRUCTURE превращается в дерево частей письма с номерами секций.
+"""
+
+import base64
+import email.utils
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+
+# Служебные токены скобок
+LPAREN = object()
+RPAREN = object()
+
+
+class ImapParseError(ValueError):
+    """❌ Ошибка разбора ответа IMAP"""
+
+
+def _iter_segments(data) -> Iterator[Tuple[bytes, Optional[bytes]]]:
+    """🔧 Превращает ответ imaplib в пары (текст, литерал)"""
+    for item in data or []:
+        if isinstance(item, tuple):
+            head = item[0] if len(item) > 0 else b''
+            literal = item[1] if len(item) > 1 else None
+            if isinstance(head, str):
+                head = head.encode('utf-8', errors='replace')
+            if isinstance(literal, str):
+                literal = literal.encode('utf-8', errors='replace')
+            yield head or b'', literal
+        elif isinstance(item, bytes):
+            yield item, None
+        elif isinstance(item, str):
+            yield item.encode('utf-8', errors='replace'), None
+
+
+def _decode(raw: bytes) -> str:
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+def tokenize(data) -> List[Any]:
+    """🔍 Разбивка ответа на токены: LPAREN/RPAREN, str (атомы и строки), bytes (литералы)"""
+    tokens: List[Any] = []
+
+    for text, literal in _iter_segments(data):
+        literal_used = False
+        i = 0
+        length = len(text)
+
+        while i < length:
+            ch = text[i:i + 1]
+
+            if ch in (b' ', b'\t', b'\r', b'\n'):
+                i += 1
+            elif ch == b'(':
+                tokens.append(LPAREN)
+                i += 1
+            elif ch == b')':
+                tokens.append(RPAREN)
+                i += 1
+            elif ch == b'"':
+                # Строка в кавычках с экранированием
+                i += 1
+                buf = bytearray()
+                while i < length:
+                    c = text[i:i + 1]
+                    if c == b'\\' and i + 1 < length:
+                        buf += text[i + 1:i + 2]
+                        i += 2
+                        continue
+                    if c == b'"':
+                        i += 1
+                        break
+                    buf += c
+                    i += 1
+                tokens.append(_decode(bytes(buf)))
+            elif ch == b'{':
+                # Литерал: содержимое пришло отдельным элементом кортежа
+                end = text.find(b'}', i)
+                if end == -1:
+                    raise ImapParseError(f"Незакрытый литерал в ответе: {text[i:i + 20]!r}")
+                if literal is not None and not literal_used:
+                    tokens.append(literal)
+                    literal_used = True
+                i = end + 1
+            else:
+                # Атом; внутри [...] допускаются пробелы и скобки (BODY[HEADER.FIELDS (FROM)])
+                start = i
+                depth = 0
+                while i < length:
+                    c = text[i:i + 1]
+                    if c == b'[':
+                        depth += 1
+                    elif c == b']':
+                        depth = max(depth - 1, 0)
+                    elif depth == 0 and c in (b' ', b'(', b')', b'\r', b'\n'):
+                        break
+                    i += 1
+                tokens.append(_decode(text[start:i]))
+
+        # Литерал без маркера {N} (нестандартные ответы) всё равно сохраняем
+        if literal is not None and not literal_used:
+            tokens.append(literal)
+
+    return tokens
+
+
+def _parse_value(tokens: List[Any], pos: int) -> Tuple[Any, int]:
+    """🔧 Разбор одного значения начиная с позиции pos"""
+    token = tokens[pos]
+    if token is LPAREN:
+        items = []
+        pos += 1
+        while pos < len(tokens) and tokens[pos] is not RPAREN:
+            value, pos = _parse_value(tokens, pos)
+            items.append(value)
+        return items, pos + 1
+    if token is RPAREN:
+        raise ImapParseError("Неожиданная закрывающая скобка")
+    if isinstance(token, str) and token.upper() == 'NIL':
+        return None, pos + 1
+    return token, pos + 1
+
+
+def parse_list(data) -> List[Any]:
+    """📋 Разбор произвольного ответа в список значений (вложенные списки сохраняются)"""
+    tokens = tokenize(data)
+    values = []
+    pos = 0
+    while pos < len(tokens):
+        if tokens[pos] is RPAREN:
+            pos += 1
+            continue
+        value, pos = _parse_value(tokens, pos)
+        values.append(value)
+    return values
+
+
+def parse_fetch_response(data) -> List[Dict[str, Any]]:
+    """📨 Разбор ответа FETCH на набор писем
+
+    Returns:
+        List[Dict[str, Any]]: по записи на письмо; ключ 'SEQ' — номер письма,
+        остальные ключи — имена элементов в верхнем регистре ('UID', 'RFC822.SIZE',
+        'BODYSTRUCTURE', 'BODY[HEADER.FIELDS (...)]' и т.д.)
+    """
+    values = parse_list(data)
+    records: List[Dict[str, Any]] = []
+
+    i = 0
+    while i < len(values):
+        seq = values[i]
+        attrs = values[i + 1] if i + 1 < len(values) else None
+        if isinstance(seq, str) and seq.isdigit() and isinstance(attrs, list):
+            record: Dict[str, Any] = {'SEQ': seq}
+            for j in range(0, len(attrs) - 1, 2):
+                name = attrs[j]
+                if isinstance(name, str):
+                    record[name.upper()] = attrs[j + 1]
+            records.append(record)
+            i += 2
+        else:
+            # Мусор между записями (например, хвост ')' или служебные строки) пропускаем
+            i += 1
+
+    return records
+
+
+def find_item(record: Dict[str, Any], prefix: str) -> Any:
+    """🔎 Поиск элемента записи по префиксу имени (BODY[HEADER.FIELDS ... приходит с переменным хвостом)"""
+    prefix = prefix.upper()
+    for key, value in record.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def parse_uid_set(text: str) -> List[int]:
+    """🔢 Набор UID вида 3:5,9 в список чисел (диапазоны разворачиваются)"""
+    uids: List[int] = []
+    for token in str(text or '').split(','):
+        token = token.strip()
+        if not token:
+            continue
+        first, _, last = token.partition(':')
+        if not first.isdigit() or (last and not last.isdigit()):
+            continue
+        low, high = sorted((int(first), int(last or first)))
+        uids.extend(range(low, high + 1))
+    return uids
+
+
+def parse_vanished(data) -> List[int]:
+    """🗑️ UID из ответов VANISHED / VANISHED (EARLIER) (RFC 7162, QRESYNC)"""
+    uids: List[int] = []
+    for text, _literal in _iter_segments(data):
+        text = _decode(text).strip()
+        if text.upper().startswith('(EARLIER)'):
+            text = text[len('(EARLIER)'):]
+        uids.extend(parse_uid_set(text.strip()))
+    return sorted(set(uids))
+
+
+def encode_mailbox_name(name: str) -> str:
+    """📁 Имя папки для SELECT/STATUS: модифицированный UTF-7 (RFC 3501 5.1.3), в кавычках при необходимости"""
+    encoded = []
+    pending = ''
+
+    def flush():
+        if pending:
+            raw = pending.encode('utf-16-be')
+            encoded.append('&' + base64.b64encode(raw).decode('ascii').rstrip('=').replace('/', ',') + '-')
+
+    for ch in name:
+        if 0x20 <= ord(ch) <= 0x7e:
+            flush()
+            pending = ''
+            encoded.append('&-' if ch == '&' else ch)
+        else:
+            pending += ch
+    flush()
+
+    result = ''.join(encoded)
+    if not result or any(ch in result for ch in ' "\\(){%*]'):
+        return '"' + result.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return result
+
+
+def format_imap_value(value: Any) -> str:
+    """📝 Обратная сериализация разобранного значения в IMAP-подобную строку"""
+    if value is None:
+        return 'NIL'
+    if isinstance(value, list):
+        return '(' + ' '.join(format_imap_value(v) for v in value) + ')'
+    if isinstance(value, bytes):
+        value = _decode(value)
+    if value.isdigit():
+        return value
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+@dataclass
+class BodyPart:
+    """🧩 Листовая часть письма из BODYSTRUCTURE"""
+    section: str
+    mime_type: str
+    params: Dict[str, str] = field(default_factory=dict)
+    encoding: str = '7bit'
+    size: int = 0
+    disposition: Optional[str] = None
+    disposition_params: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def filename(self) -> Optional[str]:
+        """📎 Имя файла из Content-Disposition или параметра name"""
+        for params, key in ((self.disposition_params, 'filename'), (self.params, 'name')):
+            if params.get(key):
+                return params[key]
+            if params.get(key + '*'):
+                # RFC 2231: charset'язык'%XX...
+                charset, _language, text = email.utils.decode_rfc2231(params[key + '*'])
+                return unquote(text, encoding=charset or 'utf-8', errors='replace')
+        return None
+
+    @property
+    def is_text(self) -> bool:
+        return self.mime_type in ('text/plain', 'text/html')
+
+
+def _param_dict(value: Any) -> Dict[str, str]:
+    """🔧 Список (ключ значение ...) → словарь с ключами в нижнем регистре"""
+    params: Dict[str, str] = {}
+    if isinstance(value, list):
+        for i in range(0, len(value) - 1, 2):
+            key, val = value[i], value[i + 1]
+            if isinstance(key, str) and val is not None:
+                params[key.lower()] = _decode(val) if isinstance(val, bytes) else str(val)
+    return params
+
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _parse_leaf(body: List[Any], section: str) -> BodyPart:
+    """🧩 Разбор листовой части: type subtype params id description encoding size ..."""
+    mime_type = f"{str(body[0] or 'application').lower()}/{str(body[1] or 'octet-stream').lower()}"
+
+    # Положение Content-Disposition зависит от типа части (RFC 3501, body-ext-1part)
+    if mime_type.startswith('text/'):
+        disposition_index = 9
+    elif mime_type == 'message/rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+
+    disposition, disposition_params = None, {}
+    raw_disposition = body[disposition_index] if len(body) > disposition_index else None
+    if isinstance(raw_disposition, list) and raw_disposition and isinstance(raw_disposition[0], str):
+        disposition = raw_disposition[0].lower()
+        disposition_params = _param_dict(raw_disposition[1] if len(raw_disposition) > 1 else None)
+
+    return BodyPart(
+        section=section,
+        mime_type=mime_type,
+        params=_param_dict(body[2] if len(body) > 2 else None),
+        encoding=str(body[5] or '7bit').lower() if len(body) > 5 else '7bit',
+        size=_as_int(body[6] if len(body) > 6 else 0),
+        disposition=disposition,
+        disposition_params=disposition_params,
+    )
+
+
+def parse_bodystructure(body: Any, section: str = '') -> List[BodyPart]:
+    """🌳 Разбор BODYSTRUCTURE в плоский список листовых частей в порядке обхода письма
+
+    Номера секций соответствуют BODY[<section>]: у одночастного письма тело — секция '1',
+    у multipart дочерние части нумеруются 1, 2, ... с вложенностью через точку.
+    """
+    if not isinstance(body, list) or not body:
+        raise ImapParseError("BODYSTRUCTURE должен быть непустым списком")
+
+    if isinstance(body[0], list):
+        parts: List[BodyPart] = []
+        index = 1
+        for child in body:
+            if not isinstance(child, list):
+                break  # дальше идут подтип и расширения multipart
+            child_section = f"{section}.{index}" if section else str(index)
+            parts.extend(parse_bodystructure(child, child_section))
+            index += 1
+        return parts
+
+    return [_parse_leaf(body, section or '1')]
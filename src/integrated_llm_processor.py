@@ -14,6 +14,7 @@ from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 from email_loader import ProcessedEmailLoader
+from conversation_index import ConversationIndex
 # from attachment_processor import AttachmentProcessor  # АРХИВИРОВАН
 from ocr_processor_adapter import OCRProcessorAdapter
 from llm_extractor import ContactExtractor
@@ -43,6 +44,9 @@ class IntegratedLLMProcessor:
         self.data_dir = project_root / "data"
         self.results_dir = self.data_dir / "llm_results"
         self.results_dir.mkdir(parents=True, exist_ok=True)
+
+        # Индекс переписок (заполняет парсер писем): цепочки без чтения всех JSON
+        self.conversation_index = ConversationIndex(self.data_dir / "conversation_index.db", self.logger)
         
         # Папка с промптами
         self.prompts_dir = project_root / "prompts"
@@ -139,13 +143,26 @@ class IntegratedLLMProcessor:
             self.logger.error(f"   ❌ Ошибка анализа КП: {e}")
             return {"commercial_offer_found": False, "error": str(e)}
 
-    def process_emails_by_date(self, target_date: str, max_emails: int = None) -> Dict:
+    def get_conversation(self, email: Dict) -> List[Dict]:
+        """🧵 Письма переписки, к которой относится письмо, в хронологическом порядке
+
+        Записи берутся из индекса: message_id, parent_id, sender, sent_at, email_path
+        и analyzed_at (письмо уже разобрано LLM - его цитаты можно не анализировать).
+        """
+        root_id = email.get('conversation_id')
+        if not root_id:
+            entry = self.conversation_index.get((email.get('message_id') or '').strip())
+            root_id = entry['root_id'] if entry else None
+        return self.conversation_index.conversation(root_id) if root_id else []
+
+    def process_emails_by_date(self, target_date: str, max_emails: int = None, only_unprocessed: bool = False) -> Dict:
         """📅 Обработка писем за конкретную дату
         
         Args:
             target_date (str): Дата в формате YYYY-MM-DD
             max_emails (int, optional): Максимальное количество писем для обработки. 
                                        Если None, обрабатываются все письма.
+            only_unprocessed (bool): Пропускать письма, уже разобранные LLM (по манифесту).
         """
         
         self.logger.info(f"🎯 ОБРАБОТКА ПИСЕМ ЗА {target_date}")
@@ -153,17 +170,17 @@ class IntegratedLLMProcessor:
         
         self.stats['start_time'] = datetime.now()
         
-        # Загружаем письма
-        emails = self.email_loader.load_emails_by_date(target_date)
-        if not emails:
+        # Записи манифеста дня: письма читаются по одному в цикле
+        entries = list(self.email_loader.iter_manifest(target_date, unprocessed=only_unprocessed))
+        if not entries:
             self.logger.warning(f"❌ Нет писем для обработки за {target_date}")
             return self._create_empty_result(target_date)
         
         # Определяем количество писем для обработки
-        max_emails_to_process = len(emails) if max_emails is None else min(max_emails, len(emails))
+        max_emails_to_process = len(entries) if max_emails is None else min(max_emails, len(entries))
         
         # Выводим информацию о количестве писем
-        self.logger.info(f"📊 Загружено писем: {len(emails)}")
+        self.logger.info(f"📊 Загружено писем: {len(entries)}")
         if max_emails is not None:
             self.logger.info(f"🎯 К обработке: {max_emails_to_process} писем (лимит: {max_emails})")
         else:
@@ -172,13 +189,16 @@ class IntegratedLLMProcessor:
         # Обрабатываем каждое письмо
         processed_results = []
         
-        for email_idx, email in enumerate(emails, 1):
+        for email_idx, entry in enumerate(entries, 1):
             # Проверяем лимит писем для обработки
             if email_idx > max_emails_to_process:
                 self.logger.info(f"🛑 Достигнут лимит обработки: {max_emails_to_process} писем")
                 break
                 
             try:
+                email = self.email_loader.load_email(entry)
+                if email is None:
+                    raise ValueError(f"письмо {entry['name']} не прочитано")
                 self.logger.info(f"{'─'*40}")
                 self.logger.info(f"📧 Обработка письма {email_idx}/{max_emails_to_process}")
                 self.logger.info(f"   От: {email.get('from', 'N/A')[:50]}...")
@@ -252,6 +272,8 @@ class IntegratedLLMProcessor:
                 'subject': email.get('subject', ''),
                 'date': email.get('date', ''),
                 'thread_id': email.get('thread_id', ''),
+                'conversation_id': email.get('conversation_id', ''),
+                'parent_id': email.get('parent_id', ''),
                 'has_attachments': len(email.get('attachments', [])) > 0,
                 'attachments_count': len(email.get('attachments', []))
             }
@@ -314,6 +336,9 @@ class IntegratedLLMProcessor:
             result = {
                 'original_email': {
                     'thread_id': email.get('thread_id'),
+                    'message_id': email.get('message_id'),
+                    'conversation_id': email.get('conversation_id'),
+                    'parent_id': email.get('parent_id'),
                     'from': email.get('from'),
                     'subject': email.get('subject'),
                     'date': email.get('date'),
@@ -347,6 +372,10 @@ class IntegratedLLMProcessor:
                 total_cost = commercial_analysis.get('total_cost', 'N/A')
                 supplier = commercial_analysis.get('supplier_info', {}).get('company', 'N/A')
                 self.logger.info(f"   💼 КП найдено: {total_cost} от {supplier}")
+
+            if not self.test_mode and email.get('message_id'):
+                self.conversation_index.mark_analyzed(email['message_id'].strip())
+                self.email_loader.mark_processed(email)
             
             return result
             
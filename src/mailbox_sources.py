@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📬 Источники писем: учетные записи IMAP и их папки (config/mailboxes.json)
+Каждая пара учетная запись + папка получает свой чекпоинт синхронизации,
+свои элементы очереди повторов и метку источника в сохраненных письмах.
+Пароли в файл не пишутся - указывается имя переменной окружения. Без файла
+работает один источник из IMAP_SERVER / IMAP_USER / IMAP_PASSWORD и INBOX.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_FOLDER = 'INBOX'
+DEFAULT_CONFIG_PATH = Path('config') / 'mailboxes.json'
+
+
+@dataclass(frozen=True)
+class MailboxSource:
+    """📁 Папка учетной записи: параметры подключения и доля общего пула сессий"""
+    account: str
+    server: Optional[str]
+    port: int
+    user: Optional[str]
+    password: Optional[str]
+    folder: str = DEFAULT_FOLDER
+    starttls: bool = True
+    max_connections: int = 3
+
+    @property
+    def key(self) -> str:
+        """🔑 Ключ источника (совпадает с ключом чекпоинта синхронизации)"""
+        return f"{self.user}@{self.server}/{self.folder}"
+
+    @property
+    def label(self) -> str:
+        """🏷️ Короткая метка для логов: имя учетной записи и папка"""
+        return f"{self.account}/{self.folder}"
+
+
+def env_source(max_connections: int = 3) -> MailboxSource:
+    """🔧 Единственный источник из переменных окружения (поведение до появления конфигурации)"""
+    user = os.getenv('IMAP_USER')
+    return MailboxSource(
+        account=user or 'default',
+        server=os.getenv('IMAP_SERVER'),
+        port=int(os.getenv('IMAP_PORT', 143)),
+        user=user,
+        password=os.getenv('IMAP_PASSWORD'),
+        starttls=os.getenv('IMAP_STARTTLS', '1') != '0',
+        max_connections=max_connections,
+    )
+
+
+def parse_mailbox_sources(config: Dict, max_connections: int = 3) -> List[MailboxSource]:
+    """📋 Источники из разобранного JSON
+
+    Поля учетной записи, которых нет в файле, берутся из окружения
+    (IMAP_SERVER, IMAP_PORT, IMAP_USER, IMAP_STARTTLS); пароль - из
+    переменной password_env (по умолчанию IMAP_PASSWORD).
+    """
+    defaults = env_source(max_connections)
+    sources: List[MailboxSource] = []
+    for index, account in enumerate(config.get('accounts', [])):
+        if not account.get('enabled', True):
+            continue
+        user = account.get('user', defaults.user)
+        folders = account.get('folders') or [DEFAULT_FOLDER]
+        for folder in folders:
+            sources.append(MailboxSource(
+                account=account.get('name') or user or f"account{index + 1}",
+                server=account.get('server', defaults.server),
+                port=int(account.get('port', defaults.port)),
+                user=user,
+                password=os.getenv(account.get('password_env', 'IMAP_PASSWORD')),
+                folder=folder,
+                starttls=bool(account.get('starttls', defaults.starttls)),
+                max_connections=max(1, int(account.get('max_connections', max_connections))),
+            ))
+
+    keys = [source.key for source in sources]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        raise ValueError(f"Папка указана несколько раз: {', '.join(duplicates)}")
+    return sources
+
+
+def load_mailbox_sources(path: Path = DEFAULT_CONFIG_PATH, max_connections: int = 3) -> List[MailboxSource]:
+    """📂 Источники из файла конфигурации; без файла - один источник из окружения"""
+    path = Path(path)
+    if not path.exists():
+        return [env_source(max_connections)]
+    with open(path, 'r', encoding='utf-8') as f:
+        sources = parse_mailbox_sources(json.load(f), max_connections)
+    return sources or [env_source(max_connections)]
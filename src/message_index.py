@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗂️ Постоянный индекс Message-ID → сохраненное письмо (SQLite)
+Заменяет перебор всех email_*.json при проверке дубликатов; может быть
+пересобран из существующего дерева data/emails/.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class MessageIndex:
+    """🗂️ Индекс сохраненных писем по Message-ID"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id TEXT PRIMARY KEY,
+            date_folder TEXT,
+            email_path TEXT NOT NULL,
+            has_body INTEGER NOT NULL DEFAULT 0,
+            attachment_paths TEXT NOT NULL DEFAULT '[]',
+            uid INTEGER,
+            updated_at TEXT,
+            removed_at TEXT,
+            mailbox TEXT,
+            uidvalidity INTEGER
+        )
+    """
+
+    # Колонки, добавленные после первой версии схемы (старые индексы дополняются при открытии)
+    MIGRATIONS = (
+        ('removed_at', 'TEXT'),      # отслеживание удалений на сервере
+        ('mailbox', 'TEXT'),         # UID имеет смысл только в своей папке
+        ('uidvalidity', 'INTEGER'),  # и в своей эпохе UIDVALIDITY
+    )
+
+    def __init__(self, db_path: Path, logger=None):
+        self.db_path = Path(db_path)
+        self.logger = logger
+        self.is_new = not self.db_path.exists()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Одно соединение на все потоки пула, доступ через блокировку
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(messages)")}
+            for column, column_type in self.MIGRATIONS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+            self._conn.commit()
+
+    def get(self, message_id: str) -> Optional[Dict]:
+        """🔍 Запись индекса по Message-ID (None, если письмо не сохранялось)"""
+        if not message_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM messages WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry['has_body'] = bool(entry['has_body'])
+        entry['attachment_paths'] = json.loads(entry['attachment_paths'] or '[]')
+        return entry
+
+    def upsert(self, message_id: str, email_path: str, date_folder: str, has_body: bool,
+               attachment_paths: List[str], uid: Optional[int] = None,
+               mailbox: Optional[str] = None, uidvalidity: Optional[int] = None):
+        """💾 Добавление или обновление записи после сохранения письма
+
+        mailbox и uidvalidity - папка и эпоха, в которых действует uid.
+        """
+        if not message_id:
+            return
+        with self._lock:
+            self._upsert(message_id, email_path, date_folder, has_body, attachment_paths, uid, mailbox, uidvalidity)
+            self._conn.commit()
+
+    def _upsert(self, message_id, email_path, date_folder, has_body, attachment_paths, uid,
+                mailbox=None, uidvalidity=None):
+        # UID, папка и UIDVALIDITY обновляются вместе: UID без своей папки ничего не значит
+        self._conn.execute(
+            """
+            INSERT INTO messages (message_id, date_folder, email_path, has_body, attachment_paths, uid,
+                                  mailbox, uidvalidity, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(message_id) DO UPDATE SET
+                date_folder = excluded.date_folder,
+                email_path = excluded.email_path,
+                has_body = excluded.has_body,
+                attachment_paths = excluded.attachment_paths,
+                uid = COALESCE(excluded.uid, messages.uid),
+                mailbox = CASE WHEN excluded.uid IS NULL THEN messages.mailbox ELSE excluded.mailbox END,
+                uidvalidity = CASE WHEN excluded.uid IS NULL THEN messages.uidvalidity ELSE excluded.uidvalidity END,
+                updated_at = excluded.updated_at,
+                removed_at = NULL
+            """,
+            (message_id, date_folder, str(email_path), int(bool(has_body)),
+             json.dumps(list(attachment_paths), ensure_ascii=False), uid, mailbox, uidvalidity,
+             datetime.now().isoformat())
+        )
+
+    def mark_removed(self, mailbox: str, uidvalidity: int, uids: Iterable[int]) -> List[str]:
+        """🗑️ Отметка писем, удаленных или перенесенных из папки на сервере (по UID)
+
+        UID сравниваются только внутри папки mailbox с тем же UIDVALIDITY: тот же
+        номер в другой папке или эпохе - другое письмо. Записи без папки (сохраненные
+        до ее учета) не отмечаются. Локальная копия письма остается.
+        Returns: Message-ID впервые отмеченных писем.
+        """
+        uids = [int(uid) for uid in uids]
+        removed: List[str] = []
+        if not uids:
+            return removed
+        now = datetime.now().isoformat()
+        with self._lock:
+            for i in range(0, len(uids), 500):
+                batch = uids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                scope = f"removed_at IS NULL AND mailbox = ? AND uidvalidity = ? AND uid IN ({placeholders})"
+                rows = self._conn.execute(
+                    f"SELECT message_id FROM messages WHERE {scope}", [mailbox, uidvalidity] + batch
+                ).fetchall()
+                removed += [row['message_id'] for row in rows]
+                self._conn.execute(
+                    f"UPDATE messages SET removed_at = ? WHERE {scope}", [now, mailbox, uidvalidity] + batch
+                )
+            self._conn.commit()
+        return removed
+
+    def count(self) -> int:
+        """🔢 Число писем в индексе"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def rebuild(self, emails_dir: Path, stored: Optional[Iterable[Tuple[str, Dict]]] = None) -> int:
+        """🔄 Пересборка индекса из data/emails/<дата>/email_*.json
+
+        stored - готовые пары (путь письма, письмо), например EmailStore.iter_all()
+        для писем в сжатых сегментах; по умолчанию читаются JSON-файлы.
+        """
+        emails_dir = Path(emails_dir)
+        indexed = 0
+        if stored is None:
+            stored = self._read_json_files(emails_dir)
+
+        with self._lock:
+            self._conn.execute("DELETE FROM messages")
+
+            for json_file, email_data in stored:
+                json_file = Path(json_file)
+
+                message_id = (email_data.get('message_id') or '').strip()
+                if not message_id:
+                    continue
+
+                body = email_data.get('body') or email_data.get('body_text') or ''
+                attachment_paths = [
+                    att['file_path'] for att in email_data.get('attachments', [])
+                    if isinstance(att, dict) and att.get('file_path')
+                ]
+                self._upsert(message_id, str(json_file), email_data.get('date_folder') or json_file.parent.name,
+                             bool(body.strip()), attachment_paths, email_data.get('uid'),
+                             email_data.get('mailbox_key'), email_data.get('uidvalidity'))
+                indexed += 1
+
+            self._conn.commit()
+
+        if self.logger:
+            self.logger.info(f"🗂️ Индекс Message-ID пересобран: {indexed} писем")
+        return indexed
+
+    def _read_json_files(self, emails_dir: Path) -> Iterable[Tuple[str, Dict]]:
+        for json_file in sorted(emails_dir.glob("*/email_*.json")):
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    yield str(json_file), json.load(f)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"⚠️ Индекс: пропущен поврежденный файл {json_file.name}: {e}")
+
+    def close(self):
+        """🔐 Закрытие соединения с базой"""
+        with self._lock:
+            self._conn.close()
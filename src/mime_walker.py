@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🌳 Однопроходный обход MIME-дерева письма
+Каждая часть классифицируется один раз (текст тела, встроенное изображение,
+настоящее вложение), полезная нагрузка текстовых частей декодируется не
+больше одного раза. Результат обхода питает и извлечение тела письма, и
+сохранение вложений в process_single_email - дерево больше не обходится
+заново для каждой из этих задач.
+"""
+
+import email.message
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+MAX_BODY_CHARS = 500_000     # Потолок длины тела письма в JSON
+MIN_TEXT_CHARS = 10          # Текст короче считается пустым (пустой HTML, подпись из пробелов)
+TEXT_TYPES = ('text/plain', 'text/html')
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_HTML_ENTITY = re.compile(r'&[a-z]+;')
+
+
+def html_to_text(chunk: str) -> str:
+    """🧹 Грубое снятие разметки HTML: теги удаляются, сущности заменяются пробелом"""
+    return _HTML_ENTITY.sub(' ', _HTML_TAG.sub('', chunk))
+
+
+@dataclass
+class MimeWalk:
+    """🌳 Результат обхода: куски тела, запасной текст и части-вложения в порядке письма"""
+    body_chunks: List[str] = field(default_factory=list)
+    fallback_text: Optional[str] = None
+    attachments: List[email.message.Message] = field(default_factory=list)
+    inline_images: List[email.message.Message] = field(default_factory=list)
+
+    @property
+    def body_text(self) -> str:
+        """📄 Тело письма: все текстовые части через перевод строки"""
+        return '\n'.join(self.body_chunks).strip()[:MAX_BODY_CHARS]
+
+
+def classify_attachment(part: email.message.Message) -> Optional[str]:
+    """📎 'attachment', 'inline_image' или None (часть не является файлом письма)
+
+    attachment - явный Content-Disposition: attachment или картинка с именем без
+    disposition; inline_image - встроенная картинка с именем (во вложения не идет).
+    """
+    disposition = part.get_content_disposition()
+    if disposition == 'attachment':
+        return 'attachment'
+    if not part.get_content_type().startswith('image/') or not part.get_filename():
+        return None
+    return 'inline_image' if disposition == 'inline' else ('attachment' if not disposition else None)
+
+
+def decode_text(part: email.message.Message, raw: bytes) -> str:
+    """🔤 Текст части в ее кодировке; HTML очищается от разметки"""
+    chunk = raw.decode(part.get_content_charset() or 'utf-8', errors='ignore')
+    if part.get_content_type() == 'text/html':
+        chunk = html_to_text(chunk)
+    return chunk
+
+
+def walk_message(msg: email.message.Message, logger=None) -> MimeWalk:
+    """🌳 Один проход по дереву письма
+
+    Телом считаются text/plain и text/html, кроме частей с 'attachment' в
+    Content-Disposition (у письма из одной части - всегда). Запасной текст -
+    сырая полезная нагрузка первой текстовой части без disposition: ею
+    заменяется пустое тело, если разметка съела весь текст. Вложения
+    ищутся только в составных письмах.
+    """
+    result = MimeWalk()
+    multipart = msg.is_multipart()
+
+    for part_num, part in enumerate(msg.walk()):
+        try:
+            ctype = part.get_content_type()
+            if ctype in TEXT_TYPES:
+                disposition = part.get('Content-Disposition', '')
+                in_body = not multipart or not (disposition and 'attachment' in disposition.lower())
+                no_disposition = part.get_content_disposition() not in ('attachment', 'inline')
+                if in_body or (no_disposition and result.fallback_text is None):
+                    raw = part.get_payload(decode=True)
+                    if raw and len(raw.strip()) > 0:
+                        if in_body:
+                            chunk = decode_text(part, raw).strip()
+                            if len(chunk) > MIN_TEXT_CHARS:
+                                result.body_chunks.append(chunk)
+                        if no_disposition and result.fallback_text is None and len(raw.strip()) > MIN_TEXT_CHARS:
+                            result.fallback_text = raw.decode('utf-8', errors='ignore')
+
+            if multipart:
+                kind = classify_attachment(part)
+                if kind == 'attachment':
+                    result.attachments.append(part)
+                elif kind == 'inline_image':
+                    result.inline_images.append(part)
+        except Exception as e:
+            if logger:
+                logger.warning(f"⚠️ Ошибка обработки части {part_num}: {e}")
+
+    return result
@@ -89,9 +89,13 @@ class OCRProcessorAdapter:
                 
                 print(f"      ✅ {i}/{len(attachments)}: {attachment_path.name}")
                 
+                # 🆕 Вложение из хранилища по SHA-256 кэшируется по дате первого сохранения,
+                # чтобы одинаковый файл из разных писем распознавался один раз
+                attachment_cache_date = attachment.get('blob_date_folder') or date_for_cache
+                
                 # Проверяем существующие результаты перед обработкой
-                if date_for_cache and self.ocr_processor._check_existing_results(attachment_path, date_for_cache):
-                    existing_result = self.ocr_processor._get_existing_result(attachment_path, date_for_cache)
+                if attachment_cache_date and self.ocr_processor._check_existing_results(attachment_path, attachment_cache_date):
+                    existing_result = self.ocr_processor._get_existing_result(attachment_path, attachment_cache_date)
                     method = existing_result.get('method', 'cached')
                     text_length = len(existing_result.get('text', ''))
                     print(f"         📋 Файл уже обработан ранее ({method}), используем кэш...")
@@ -125,7 +129,7 @@ class OCRProcessorAdapter:
                         })
                 else:
                     # Обрабатываем файл через OCRProcessor
-                    ocr_result = self.ocr_processor.extract_text_from_file(attachment_path, date=date_for_cache)
+                    ocr_result = self.ocr_processor.extract_text_from_file(attachment_path, date=attachment_cache_date)
                     
                     if ocr_result.get('success'):
                         text = ocr_result.get('text', '')
@@ -270,7 +274,7 @@ class OCRProcessorAdapter:
 
         # OCR обработка
         try:
-            ocr_result = self.ocr_processor.extract_text_from_file(path, date=date_for_cache)
+            ocr_result = self.ocr_processor.extract_text_from_file(path, date=attachment.get('blob_date_folder') or date_for_cache)
             if ocr_result.get('success'):
                 return {
                     'extracted_text': ocr_result.get('text', ''),
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📼 Офлайн-загрузка писем из архивов: mbox, Maildir или папка с .eml
+Письма проходят тот же путь, что и при загрузке по IMAP (process_single_email:
+фильтры, текст, вложения, индексы) - вместо сервера сессию заменяет
+LocalMailSession, которая отдает сырые байты из файлов. Письма раскладываются
+по дням и нумеруются заранее, в родительском процессе, поэтому имена файлов
+не зависят от порядка работы воркеров. Обработка идет в пуле процессов.
+"""
+
+import email.message
+import email.parser
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from retry_queue import RetryQueue
+
+OFFLINE_MAILBOX = 'offline'     # Папка в ключах очереди повторов для писем из архивов
+OFFLINE_CHUNK_SIZE = 50         # Писем в одной задаче процесса
+HEADER_READ_SIZE = 64 * 1024    # Сколько байт читать для разбора заголовков
+
+# Ссылка на письмо в архиве: (файл, смещение, длина; -1 - до конца файла)
+MessageRef = Tuple[str, int, int]
+
+_MBOX_FROM_LINE = re.compile(rb'^From ', re.MULTILINE)
+_HEADER_END = re.compile(rb'\r?\n\r?\n')
+
+
+def detect_source_format(path: Path) -> str:
+    """🔍 Формат архива: 'mbox', 'maildir' или 'eml'"""
+    path = Path(path)
+    if path.is_file():
+        return 'eml' if path.suffix.lower() == '.eml' else 'mbox'
+    if (path / 'cur').is_dir() or (path / 'new').is_dir():
+        return 'maildir'
+    return 'eml'
+
+
+def scan_mbox(path: Path) -> List[MessageRef]:
+    """📼 Границы писем в mbox: строки 'From ' после пустой строки (поиск по mmap, без чтения в память)"""
+    refs: List[MessageRef] = []
+    if os.path.getsize(path) == 0:
+        return refs
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        starts = [m.start() for m in _MBOX_FROM_LINE.finditer(mm)
+                  if m.start() == 0 or mm[max(0, m.start() - 3):m.start()].endswith((b'\n\n', b'\n\r\n'))]
+        starts.append(len(mm))
+        for start, end in zip(starts, starts[1:]):
+            body_start = mm.find(b'\n', start, end) + 1
+            if body_start <= 0:
+                continue
+            # Пустая строка в конце (перед следующим 'From ') - разделитель, а не часть письма
+            if mm[max(body_start, end - 4):end] == b'\r\n\r\n':
+                end -= 2
+            elif mm[max(body_start, end - 2):end] == b'\n\n':
+                end -= 1
+            refs.append((str(path), body_start, end - body_start))
+    return refs
+
+
+def scan_source(path: Path) -> List[MessageRef]:
+    """📋 Все письма архива в исходном порядке (Maildir и .eml - по имени файла)"""
+    path = Path(path)
+    source_format = detect_source_format(path)
+    if source_format == 'mbox':
+        return scan_mbox(path)
+    if source_format == 'maildir':
+        files = sorted(p for sub in ('cur', 'new') if (path / sub).is_dir()
+                       for p in (path / sub).iterdir() if p.is_file() and not p.name.startswith('.'))
+    elif path.is_file():
+        files = [path]
+    else:
+        files = sorted(path.rglob('*.eml'))
+    return [(str(p), 0, -1) for p in files]
+
+
+def read_message(ref: MessageRef) -> bytes:
+    """📖 Сырые байты письма с концами строк CRLF, как их отдает IMAP-сервер"""
+    file_path, offset, length = ref
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        raw = f.read(length)
+    return raw.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+
+def read_headers(ref: MessageRef) -> email.message.Message:
+    """📋 Только заголовки письма (читается начало до пустой строки)"""
+    file_path, offset, length = ref
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        head = f.read(HEADER_READ_SIZE if length < 0 else min(length, HEADER_READ_SIZE))
+        while not _HEADER_END.search(head) and (length < 0 or len(head) < length):
+            more = f.read(HEADER_READ_SIZE if length < 0 else min(length - len(head), HEADER_READ_SIZE))
+            if not more:
+                break
+            head += more
+    match = _HEADER_END.search(head)
+    return email.parser.BytesHeaderParser().parsebytes(head[:match.end()] if match else head)
+
+
+class LocalMailSession:
+    """📡 Сессия в стиле imaplib поверх писем из архива (FETCH RFC822/BODY[], NOOP)"""
+
+    def __init__(self, messages: Dict[bytes, MessageRef]):
+        self.messages = messages
+
+    def noop(self):
+        return 'OK', [b'']
+
+    def fetch(self, msg_set, items: str):
+        data = []
+        for msg_id in str(msg_set.decode() if isinstance(msg_set, bytes) else msg_set).split(','):
+            ref = self.messages.get(msg_id.encode())
+            if ref is None:
+                continue
+            raw = read_message(ref)
+            name = 'RFC822' if 'RFC822' in items.upper() else 'BODY[]'
+            data.append((f'{msg_id} ({name} {{{len(raw)}}}'.encode(), raw))
+            data.append(b')')
+        return ('OK', data) if data else ('NO', [b'message not found'])
+
+    def uid(self, command: str, *args):
+        if command.upper() == 'FETCH':
+            return self.fetch(*args)
+        return 'NO', [b'not supported offline']
+
+    def logout(self):
+        return 'BYE', [b'offline session closed']
+
+
+def configure_offline_worker(worker) -> None:
+    """⚙️ Парсер для архивов: без пауз между запросами и со своей очередью повторов"""
+    worker.request_delay = 0
+    worker.use_uid = False
+    worker.mailbox = OFFLINE_MAILBOX
+    # Неудачи офлайн-загрузки не должны уходить в очередь, которую повторяет IMAP
+    worker.retry_queue = RetryQueue(worker.data_dir / 'offline_retry_queue.db', worker.logger)
+
+
+def plan_offline_buckets(fetcher, refs: List[MessageRef]) -> Tuple[List[tuple], int]:
+    """🗂️ Раскладка писем архива по дням с номерами, как у build_range_buckets
+
+    Повторы Message-ID внутри архива отбрасываются заранее, но номер в дне
+    занимают - нумерация совпадает с последовательной обработкой.
+    Returns: ([(дата, [(номер, msg_id, ref)], всего_в_дне)], число повторов)
+    """
+    by_folder: Dict[str, List[Tuple[bytes, MessageRef, str]]] = {}
+    for position, ref in enumerate(refs, 1):
+        try:
+            headers = read_headers(ref)
+        except OSError as e:
+            fetcher.logger.warning(f"⚠️ Не удалось прочитать письмо {ref[0]}@{ref[1]}: {e}")
+            continue
+        date_folder = fetcher.metadata_date({'headers': headers, 'internaldate': None}).strftime('%Y-%m-%d')
+        message_id = headers.get('Message-ID', '').strip()
+        by_folder.setdefault(date_folder, []).append((str(position).encode(), ref, message_id))
+
+    buckets = []
+    duplicates = 0
+    seen_ids = set()
+    for date_folder in sorted(by_folder):
+        day = by_folder[date_folder]
+        first_num = fetcher.next_email_number(date_folder)
+        numbered = []
+        for num, (msg_id, ref, message_id) in enumerate(day, first_num):
+            if message_id and message_id in seen_ids:
+                duplicates += 1
+                continue
+            seen_ids.add(message_id)
+            numbered.append((num, msg_id, ref))
+        buckets.append((date_folder, numbered, first_num + len(day) - 1))
+    return buckets, duplicates
+
+
+def process_offline_chunk(worker, date_folder: str, chunk: List[tuple], total_in_day: int) -> Tuple[int, Dict[str, int]]:
+    """📨 Порция писем одного дня через process_single_email. Returns: (сохранено, счетчики)"""
+    worker.stats = dict.fromkeys(worker.stats, 0)
+    session = LocalMailSession({msg_id: ref for _num, msg_id, ref in chunk})
+    worker.session_factory = lambda: session
+    worker.connect()
+
+    saved = 0
+    for num, msg_id, ref in chunk:
+        try:
+            raw_size = ref[2] if ref[2] >= 0 else os.path.getsize(ref[0])
+            metadata = {'msg_id': msg_id, 'uid': None, 'size': raw_size, 'internaldate': None,
+                        'bodystructure': None, 'structure': '', 'headers': read_headers(ref)}
+            if worker.process_single_email(msg_id, date_folder, num, total_in_day,
+                                           include_attachment_data=False, metadata=metadata):
+                saved += 1
+        except Exception as e:
+            worker.logger.error(f"❌ Ошибка обработки письма {num} за {date_folder} ({ref[0]}): {e}")
+    return saved, worker.stats
+
+
+_process_worker = None
+
+
+def _init_process_worker(fetcher_class, logger_name: str):
+    """👷 Свой парсер в каждом процессе пула: соединения SQLite не переживают fork"""
+    import logging
+    global _process_worker
+    _process_worker = fetcher_class(logging.getLogger(logger_name))
+    configure_offline_worker(_process_worker)
+
+
+def _run_process_chunk(task: tuple) -> Tuple[int, Dict[str, int]]:
+    return process_offline_chunk(_process_worker, *task)
+
+
+def ingest_offline(fetcher, source: Path, processes: Optional[int] = None) -> int:
+    """📼 Загрузка архива писем в data/emails/ так же, как при загрузке по IMAP
+
+    processes - размер пула процессов (по умолчанию число ядер, 1 - в текущем процессе).
+    Счетчики воркеров складываются в fetcher.stats. Returns: число сохраненных писем.
+    """
+    source = Path(source)
+    processes = processes or os.cpu_count() or 1
+    refs = scan_source(source)
+    fetcher.logger.info(f"📼 ОФЛАЙН-ЗАГРУЗКА: {source} ({detect_source_format(source)}), писем: {len(refs)}, процессов: {processes}")
+
+    buckets, duplicates = plan_offline_buckets(fetcher, refs)
+    fetcher.stats['processed'] += duplicates
+    fetcher.stats['already_exists'] += duplicates
+
+    tasks = []
+    for date_folder, numbered, total_in_day in buckets:
+        for i in range(0, len(numbered), OFFLINE_CHUNK_SIZE):
+            tasks.append((date_folder, numbered[i:i + OFFLINE_CHUNK_SIZE], total_in_day))
+
+    if processes <= 1:
+        worker = fetcher.spawn_worker()
+        configure_offline_worker(worker)
+        results = [process_offline_chunk(worker, *task) for task in tasks]
+        worker.retry_queue.close()
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_process_worker,
+                                 initargs=(type(fetcher), fetcher.logger.name)) as executor:
+            results = list(executor.map(_run_process_chunk, tasks))
+
+    total_saved = 0
+    for saved, stats in results:
+        total_saved += saved
+        fetcher.merge_stats(stats)
+
+    fetcher.logger.info(f"🎯 ОФЛАЙН-ЗАГРУЗКА ЗАВЕРШЕНА: сохранено {total_saved} писем из {len(refs)}")
+    return total_saved
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔁 Очередь повторной обработки писем (SQLite, WAL)
+Заменяет skipped_emails.json и dead_letter_emails.json: каждое изменение -
+одна транзакция, а не перезапись файла. Письма адресуются парой
+UIDVALIDITY + UID (номер в папке меняется после expunge). Воркеры берут
+элементы в аренду, поэтому несколько процессов и потоков не обрабатывают
+одно письмо дважды.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MAX_ATTEMPTS = 3                 # После стольких неудач письмо уходит в мертвую очередь
+RETRY_BACKOFF_BASE = 300         # Пауза перед второй повторной попыткой, секунд (далее x2)
+RETRY_BACKOFF_MAX = 6 * 3600     # Потолок паузы
+LEASE_SECONDS = 600              # Срок аренды: после него элемент снова доступен другим воркерам
+
+
+def retry_delay(attempts: int) -> float:
+    """⏳ Пауза до следующей попытки: первая повторная - сразу, дальше экспоненциально"""
+    if attempts <= 1:
+        return 0
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempts - 2))
+
+
+class RetryQueue:
+    """🔁 Транзакционная очередь пропущенных писем с мертвой очередью"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS retry_items (
+            item_key TEXT PRIMARY KEY,
+            mailbox TEXT NOT NULL,
+            uidvalidity INTEGER,
+            uid INTEGER,
+            msg_id TEXT NOT NULL,
+            uid_mode INTEGER NOT NULL DEFAULT 0,
+            date TEXT,
+            reason TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_eligible REAL NOT NULL DEFAULT 0,
+            state TEXT NOT NULL DEFAULT 'pending',
+            lease_owner TEXT,
+            lease_until REAL,
+            last_attempt TEXT,
+            moved_at TEXT
+        )
+    """
+
+    def __init__(self, db_path: Path, logger=None):
+        self.db_path = Path(db_path)
+        self.logger = logger
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self.SCHEMA)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS retry_eligible ON retry_items (state, next_eligible)")
+
+    @staticmethod
+    def make_key(mailbox: str, uidvalidity: Optional[int], uid: Optional[int], msg_id: str) -> str:
+        """🔑 Ключ письма: папка/UIDVALIDITY/UID, без UID - временный ключ по номеру"""
+        if uid is not None:
+            return f"{mailbox}/{uidvalidity or 0}/{uid}"
+        return f"{mailbox}/seq/{msg_id}"
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE сразу берет блокировку записи: аренда не достанется двум процессам
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, mailbox: str, uidvalidity: Optional[int], uid: Optional[int], msg_id: str,
+                date: str, reason: str, uid_mode: bool) -> Dict:
+        """💾 Добавление неудачи: новая запись или +1 попытка с экспоненциальной паузой
+
+        Для письма в аренде попытку засчитает сам арендатор (fail), здесь
+        обновляется только причина. Returns: {'key', 'attempts', 'state'}.
+        """
+        key = self.make_key(mailbox, uidvalidity, uid, msg_id)
+        now = time.time()
+        with self._lock:
+            self._transaction()
+            try:
+                row = self._conn.execute("SELECT attempts, state FROM retry_items WHERE item_key = ?", (key,)).fetchone()
+                if row is None:
+                    attempts, state = 1, 'pending'
+                    self._conn.execute(
+                        """
+                        INSERT INTO retry_items (item_key, mailbox, uidvalidity, uid, msg_id, uid_mode, date, reason,
+                                                 attempts, next_eligible, state, last_attempt)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+                        """,
+                        (key, mailbox, uidvalidity, uid, str(msg_id), int(bool(uid_mode)), date, reason,
+                         attempts, now + retry_delay(attempts), datetime.now().isoformat())
+                    )
+                elif row['state'] in ('leased', 'dead'):
+                    attempts, state = row['attempts'], row['state']
+                    self._conn.execute("UPDATE retry_items SET reason = ? WHERE item_key = ?", (reason, key))
+                else:
+                    attempts = row['attempts'] + 1
+                    state = 'dead' if attempts >= MAX_ATTEMPTS else 'pending'
+                    self._update_attempt(key, attempts, state, reason, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {'key': key, 'attempts': attempts, 'state': state}
+
+    def _update_attempt(self, key: str, attempts: int, state: str, reason: Optional[str], now: float):
+        self._conn.execute(
+            """
+            UPDATE retry_items SET attempts = ?, state = ?, reason = COALESCE(?, reason), next_eligible = ?,
+                   lease_owner = NULL, lease_until = NULL, last_attempt = ?,
+                   moved_at = CASE WHEN ? = 'dead' THEN ? ELSE moved_at END
+            WHERE item_key = ?
+            """,
+            (attempts, state, reason, now + retry_delay(attempts), datetime.now().isoformat(),
+             state, datetime.now().isoformat(), key)
+        )
+
+    def lease(self, owner: str, limit: Optional[int] = None, lease_seconds: float = LEASE_SECONDS,
+              mailbox: Optional[str] = None) -> List[Dict]:
+        """🔒 Аренда готовых к повтору элементов (в том числе с истекшей чужой арендой)
+
+        mailbox - только элементы этой папки: письма другой папки или учетной
+        записи по UID текущей сессии не найти.
+        """
+        now = time.time()
+        with self._lock:
+            self._transaction()
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT * FROM retry_items
+                    WHERE ((state = 'pending' AND next_eligible <= ?) OR (state = 'leased' AND lease_until < ?))
+                      AND (? IS NULL OR mailbox = ?)
+                    ORDER BY next_eligible, item_key
+                    LIMIT ?
+                    """,
+                    (now, now, mailbox, mailbox, -1 if limit is None else limit)
+                ).fetchall()
+                for row in rows:
+                    self._conn.execute(
+                        "UPDATE retry_items SET state = 'leased', lease_owner = ?, lease_until = ? WHERE item_key = ?",
+                        (owner, now + lease_seconds, row['item_key'])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._row(row) for row in rows]
+
+    def complete(self, key: str):
+        """✅ Письмо обработано - удаляем из очереди"""
+        with self._lock:
+            self._conn.execute("DELETE FROM retry_items WHERE item_key = ?", (key,))
+
+    def fail(self, key: str, reason: Optional[str] = None) -> str:
+        """❌ Неудачная повторная попытка: +1 попытка, пауза или мертвая очередь. Returns: новое состояние"""
+        with self._lock:
+            self._transaction()
+            try:
+                row = self._conn.execute("SELECT attempts FROM retry_items WHERE item_key = ?", (key,)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return 'missing'
+                attempts = row['attempts'] + 1
+                state = 'dead' if attempts >= MAX_ATTEMPTS else 'pending'
+                self._update_attempt(key, attempts, state, reason, time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def bury(self, key: str, reason: str):
+        """📁 Перенос в мертвую очередь без новых попыток"""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE retry_items SET state = 'dead', reason = ?, lease_owner = NULL, lease_until = NULL, moved_at = ?
+                WHERE item_key = ?
+                """,
+                (reason, datetime.now().isoformat(), key)
+            )
+
+    def count(self, state: str = 'pending') -> int:
+        """🔢 Число элементов в состоянии (pending включает арендованные)"""
+        states = ('pending', 'leased') if state == 'pending' else (state,)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM retry_items WHERE state IN ({','.join('?' * len(states))})", states
+            ).fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict]:
+        """🔍 Элемент очереди по ключу"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM retry_items WHERE item_key = ?", (key,)).fetchone()
+        return self._row(row) if row else None
+
+    def dead_letters(self) -> List[Dict]:
+        """📋 Содержимое мертвой очереди"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM retry_items WHERE state = 'dead' ORDER BY moved_at").fetchall()
+        return [self._row(row) for row in rows]
+
+    def clear_dead(self) -> int:
+        """🗑️ Очистка мертвой очереди"""
+        with self._lock:
+            return self._conn.execute("DELETE FROM retry_items WHERE state = 'dead'").rowcount
+
+    def import_legacy(self, skipped_path: Path, dead_letter_path: Path, mailbox: str) -> int:
+        """📥 Перенос старых skipped_emails.json / dead_letter_emails.json (файлы переименовываются в *.migrated)"""
+        imported = 0
+        for path, state in ((Path(skipped_path), 'pending'), (Path(dead_letter_path), 'dead')):
+            if not path.exists():
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"⚠️ Очередь: не удалось прочитать {path.name}: {e}")
+                continue
+
+            with self._lock:
+                for msg_id, info in entries.items():
+                    uid_mode = bool(info.get('uid_mode', False))
+                    uid = int(msg_id) if uid_mode and str(msg_id).isdigit() else None
+                    key = self.make_key(mailbox, None, uid, msg_id)
+                    self._conn.execute(
+                        """
+                        INSERT OR IGNORE INTO retry_items (item_key, mailbox, uid, msg_id, uid_mode, date, reason,
+                                                           attempts, next_eligible, state, last_attempt, moved_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+                        """,
+                        (key, mailbox, uid, str(msg_id), int(uid_mode), info.get('date', ''), info.get('reason', 'unknown'),
+                         MAX_ATTEMPTS if state == 'dead' else info.get('attempts', 0), state,
+                         info.get('last_attempt'), info.get('moved_at'))
+                    )
+                    imported += 1
+            path.rename(path.with_name(path.name + '.migrated'))
+
+        if imported and self.logger:
+            self.logger.info(f"📥 Очередь повторов: перенесено {imported} записей из JSON")
+        return imported
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        entry = dict(row)
+        entry['uid_mode'] = bool(entry['uid_mode'])
+        return entry
+
+    def close(self):
+        """🔐 Закрытие соединения с базой"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📈 Бенчмарк пропускной способности парсера на локальном IMAP-сервере
+fetch_emails_by_date_range работает целиком по TCP с FakeImapServer (без
+STARTTLS) на синтетическом корпусе или на записанном архиве (mbox, Maildir,
+.eml). Отчет: письма в секунду, сетевые круги и байты на письмо, пик RSS.
+Результаты сравниваются с benchmark_baseline.json: рост кругов или байт на
+письмо и заметное падение скорости считаются регрессией.
+
+Запуск:
+    python tests/benchmark_fetcher.py                      # все сценарии, сравнение с базой
+    python tests/benchmark_fetcher.py --scenario failures  # один сценарий
+    python tests/benchmark_fetcher.py --corpus archive.mbox --latency 0.005
+    python tests/benchmark_fetcher.py --update-baseline    # записать новую базу
+"""
+
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import email.utils
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2, AsyncImapPool
+from src.offline_ingest import scan_source, read_message, read_headers
+from tests.imap_fakes import FakeIMAP, message_date
+from tests.imap_server import FakeImapServer
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+THROUGHPUT_TOLERANCE = 0.5   # Допустимое падение писем/с относительно базы (метрика шумная)
+COST_TOLERANCE = 0.10        # Допустимый рост кругов и байт на письмо (детерминированы)
+RSS_TOLERANCE = 0.5          # Допустимый рост пика RSS
+
+# Сценарии: размер корпуса, задержка сети, сбои и параллелизм
+SCENARIOS = {
+    'baseline_sync': {'messages': 120, 'latency': 0.0, 'workers': 1},
+    'latency_pool': {'messages': 120, 'latency': 0.002, 'workers': 3},
+    'failures': {'messages': 60, 'latency': 0.0, 'workers': 1, 'fail_every': 25},
+    'async_pipeline': {'messages': 120, 'latency': 0.002, 'workers': 2, 'engine': 'async'},
+}
+
+LOCAL_TIMEZONE = timezone(timedelta(hours=7))
+
+
+def synthetic_corpus(count: int, days: int = 5, seed: int = 7) -> Dict[int, tuple]:
+    """🧪 Корпус {uid: (день сентября 2025, байты)}: текст, PDF-вложения, логотипы в подписи"""
+    rng = random.Random(seed)
+    logo = b'\x89PNG\r\n\x1a\n' + bytes(rng.getrandbits(8) for _ in range(3000))
+    corpus = {}
+    for uid in range(1, count + 1):
+        day = 1 + (uid - 1) * days // count
+        msg = MIMEMultipart()
+        msg['From'] = f"Client {uid % 17} <client{uid % 17}@partner{uid % 5}.ru>"
+        msg['To'] = 'me@dna-technology.ru'
+        msg['Subject'] = f"Request {uid}: order details"
+        msg['Date'] = f"Mon, {day:02d} Sep 2025 {8 + uid % 10:02d}:{uid % 60:02d}:00 +0700"
+        msg['Message-ID'] = f"<bench{uid}@partner.ru>"
+        msg.attach(MIMEText("Order line with quantity and price.\n" * rng.randint(5, 200), 'plain', 'utf-8'))
+        if uid % 4 == 0:
+            pdf = MIMEApplication(b'%PDF-1.4 ' + bytes(rng.getrandbits(8) for _ in range(rng.randint(20_000, 200_000))),
+                                  _subtype='pdf')
+            pdf.add_header('Content-Disposition', 'attachment', filename=f'order_{uid}.pdf')
+            msg.attach(pdf)
+        if uid % 3 == 0:
+            image = MIMEImage(logo, _subtype='png')
+            image.add_header('Content-Disposition', 'inline', filename='image001.png')
+            msg.attach(image)
+        corpus[uid] = (day, msg.as_bytes().replace(b'\n', b'\r\n'))
+    return corpus
+
+
+def recorded_corpus(path: Path) -> Dict[int, tuple]:
+    """📼 Корпус из архива (mbox, Maildir, .eml): день берется из заголовка Date (UTC+7)"""
+    corpus = {}
+    for uid, ref in enumerate(scan_source(path), 1):
+        try:
+            day = email.utils.parsedate_to_datetime(read_headers(ref).get('Date', '')).astimezone(LOCAL_TIMEZONE).date()
+        except (TypeError, ValueError):
+            continue
+        corpus[uid] = (day, read_message(ref))
+    return corpus
+
+
+@contextmanager
+def local_server_settings(port: int, workdir: Path):
+    """🔧 Парсер смотрит на локальный сервер без STARTTLS и пауз; рабочая папка - временная"""
+    overrides = {'IMAP_SERVER': '127.0.0.1', 'IMAP_PORT': port, 'IMAP_STARTTLS': False,
+                 'IMAP_USER': 'bench', 'IMAP_PASSWORD': 'bench',
+                 'ASYNC_STARTTLS': False, 'RETRY_DELAY': 0}
+    saved = {name: getattr(fetcher_module, name) for name in overrides}
+    cwd = os.getcwd()
+    for name, value in overrides.items():
+        setattr(fetcher_module, name, value)
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        for name, value in saved.items():
+            setattr(fetcher_module, name, value)
+
+
+def run_benchmark(corpus: Dict[int, tuple], latency: float = 0.0, workers: int = 1, engine: str = 'sync',
+                  fail_every: int = 0, failure_mode: str = 'drop', **_ignored) -> Dict:
+    """🏁 Один прогон fetch_emails_by_date_range по всему корпусу. Returns: метрики"""
+    FakeIMAP.reset(corpus)
+    days = [message_date(day) for day, _raw in corpus.values()]
+    start, end = min(days), max(days)
+
+    logger = logging.getLogger('benchmark')
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeImapServer(latency=latency, fail_every=fail_every, failure_mode=failure_mode) as server, \
+            local_server_settings(server.port, Path(workdir)):
+        fetcher = AdvancedEmailFetcherV2(logger)
+        fetcher.pool_size = workers
+        fetcher.request_delay = 0
+        if engine == 'async':
+            fetcher.pool_factory = AsyncImapPool
+
+        started = perf_counter()
+        emails = fetcher.fetch_emails_by_date_range(datetime.combine(start, datetime.min.time()),
+                                                    datetime.combine(end, datetime.min.time()))
+        elapsed = perf_counter() - started
+        fetcher.close()
+
+    saved = len(emails)
+    per_message = max(saved, 1)
+    return {
+        'messages': len(corpus),
+        'saved': saved,
+        'errors': fetcher.stats['errors'],
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(saved / elapsed, 1) if elapsed else 0.0,
+        'round_trips': server.round_trips,
+        'round_trips_per_message': round(server.round_trips / per_message, 3),
+        'bytes_in': server.bytes_in,
+        'bytes_out': server.bytes_out,
+        'bytes_per_message': round((server.bytes_in + server.bytes_out) / per_message),
+        'connections': server.connections,
+        'failures_injected': server.failures,
+        'commands': dict(sorted(server.commands.items())),
+        # Пик RSS всего процесса (вместе с сервером в соседнем потоке), МБ
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_scenario(name: str, corpus: Optional[Dict[int, tuple]] = None, **overrides) -> Dict:
+    """🎬 Сценарий из SCENARIOS (на синтетическом корпусе, если свой не передан)"""
+    config = {**SCENARIOS[name], **overrides}
+    if corpus is None:
+        corpus = synthetic_corpus(config['messages'])
+    return run_benchmark(corpus, **config)
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, Dict]:
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_baseline(results: Dict[str, Dict], path: Path = BASELINE_PATH):
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_with_baseline(metrics: Dict, baseline: Dict, check_timing: bool = True) -> List[str]:
+    """⚖️ Регрессии относительно базы: список описаний (пустой - все в порядке)
+
+    Круги и байты на письмо детерминированы и проверяются всегда; скорость
+    и память зависят от машины - их можно отключить (check_timing=False).
+    """
+    regressions = []
+    if metrics['saved'] < baseline['saved']:
+        regressions.append(f"сохранено {metrics['saved']} писем, в базе {baseline['saved']}")
+    for key in ('round_trips_per_message', 'bytes_per_message'):
+        if metrics[key] > baseline[key] * (1 + COST_TOLERANCE):
+            regressions.append(f"{key}: {metrics[key]} > {baseline[key]} (+{COST_TOLERANCE:.0%})")
+    if check_timing:
+        if metrics['messages_per_s'] < baseline['messages_per_s'] * (1 - THROUGHPUT_TOLERANCE):
+            regressions.append(f"messages_per_s: {metrics['messages_per_s']} < {baseline['messages_per_s']} (-{THROUGHPUT_TOLERANCE:.0%})")
+        if metrics['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + RSS_TOLERANCE):
+            regressions.append(f"peak_rss_mb: {metrics['peak_rss_mb']} > {baseline['peak_rss_mb']} (+{RSS_TOLERANCE:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк загрузки писем на локальном IMAP-сервере')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append', help='Сценарий (по умолчанию - все)')
+    parser.add_argument('--corpus', type=str, help='Записанный корпус: mbox, Maildir или папка с .eml')
+    parser.add_argument('--messages', type=int, help='Размер синтетического корпуса')
+    parser.add_argument('--latency', type=float, help='Задержка сервера на команду, секунд')
+    parser.add_argument('--workers', type=int, help='Число сессий пула')
+    parser.add_argument('--fail-every', type=int, help='Сбой на каждом N-м FETCH')
+    parser.add_argument('--failure-mode', choices=['drop', 'no'], help='Вид сбоя: обрыв соединения или ответ NO')
+    parser.add_argument('--update-baseline', action='store_true', help='Записать результаты в benchmark_baseline.json')
+    args = parser.parse_args()
+
+    overrides = {key: value for key, value in (('messages', args.messages), ('latency', args.latency),
+                                               ('workers', args.workers), ('fail_every', args.fail_every),
+                                               ('failure_mode', args.failure_mode)) if value is not None}
+    corpus = recorded_corpus(Path(args.corpus)) if args.corpus else None
+    baseline = load_baseline()
+
+    results = {}
+    failed = False
+    for name in args.scenario or sorted(SCENARIOS):
+        metrics = run_scenario(name, corpus, **overrides)
+        results[name] = metrics
+        print(f"📈 {name}: {metrics['saved']}/{metrics['messages']} писем за {metrics['elapsed_s']} с, "
+              f"{metrics['messages_per_s']} писем/с, {metrics['round_trips_per_message']} кругов/письмо, "
+              f"{metrics['bytes_per_message']} байт/письмо, пик RSS {metrics['peak_rss_mb']} МБ")
+        # Своя конфигурация или корпус несравнимы с базой
+        if name in baseline and not overrides and corpus is None and not args.update_baseline:
+            for regression in compare_with_baseline(metrics, baseline[name]):
+                print(f"   ❌ РЕГРЕССИЯ: {regression}")
+                failed = True
+
+    if args.update_baseline:
+        save_baseline(results)
+        print(f"💾 База обновлена: {BASELINE_PATH}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📬 Поддельный IMAP-клиент для тестов парсера (подменяет imaplib.IMAP4)
+"""
+
+import re
+import email
+import imaplib
+import threading
+from datetime import date, datetime
+
+
+def make_message(num: int, day: int, sender: str = None, subject: str = None) -> bytes:
+    """✉️ Простое текстовое письмо за указанный день сентября 2025"""
+    sender = sender or f"Client {num} <client{num}@partner.ru>"
+    subject = subject or f"Request {num}"
+    return (f"From: {sender}\r\n"
+            f"To: me@dna-technology.ru\r\n"
+            f"Subject: {subject}\r\n"
+            f"Date: Mon, {day:02d} Sep 2025 10:00:00 +0700\r\n"
+            f"Message-ID: <msg{num}@partner.ru>\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n\r\n"
+            f"Hello, this is request number {num} with enough text.\r\n"
+            + "Details of the request follow.\r\n" * 20).encode()
+
+
+def _quote(value) -> str:
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _param_list(pairs) -> str:
+    return '(' + ' '.join(f'{_quote(k.upper())} {_quote(v)}' for k, v in pairs) + ')' if pairs else 'NIL'
+
+
+def _structure(part) -> str:
+    """🌳 BODYSTRUCTURE части письма в синтаксисе RFC 3501"""
+    if part.is_multipart():
+        children = ''.join(_structure(child) for child in part.get_payload())
+        return f'({children} {_quote(part.get_content_subtype().upper())} {_param_list([("boundary", part.get_boundary())])} NIL NIL NIL)'
+
+    params = [(k, v) for k, v in (part.get_params() or [])[1:]]
+    payload = part.get_payload()
+    encoding = part.get('Content-Transfer-Encoding', '7bit')
+    fields = [_quote(part.get_content_maintype().upper()), _quote(part.get_content_subtype().upper()),
+              _param_list(params), 'NIL', 'NIL', _quote(encoding.upper()), str(len(payload.encode()))]
+    if part.get_content_maintype() == 'text':
+        fields.append(str(payload.count('\n') + 1))
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_param('filename', header='content-disposition')
+        fields += ['NIL', f'({_quote(disposition.upper())} {_param_list([("filename", filename)] if filename else [])})']
+    else:
+        fields += ['NIL', 'NIL']
+    return '(' + ' '.join(fields + ['NIL', 'NIL']) + ')'
+
+
+def bodystructure(raw: bytes) -> str:
+    return _structure(email.message_from_bytes(raw))
+
+
+def section_payload(raw: bytes, section: str) -> bytes:
+    """📄 Содержимое BODY[<section>] (закодированное, как отдает сервер)"""
+    part = email.message_from_bytes(raw)
+    for index in section.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(index) - 1]
+    return part.get_payload().encode()
+
+
+def message_date(day) -> date:
+    """📅 День письма: число - день сентября 2025, либо готовая дата (записанный корпус)"""
+    return date(2025, 9, day) if isinstance(day, int) else day
+
+
+def _imap_date(value: str) -> date:
+    return datetime.strptime(value, '%d-%b-%Y').date()
+
+
+class FakeIMAP:
+    """📬 Минимальный IMAP: письма хранятся как {uid: (день, байты)}, номер = позиция в папке"""
+    error = imaplib.IMAP4.error
+    abort = imaplib.IMAP4.abort
+    messages = {}
+    uidvalidity = 1
+    sessions = []
+    commands = []
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls, messages=None, uidvalidity=1):
+        cls.messages = dict(messages or {})
+        cls.uidvalidity = uidvalidity
+        cls.sessions = []
+        cls.commands = []
+
+    def __init__(self, *_args, **_kwargs):
+        self._seen_exists = None
+        with FakeIMAP.lock:
+            FakeIMAP.sessions.append(self)
+
+    def _log(self, *command):
+        with FakeIMAP.lock:
+            FakeIMAP.commands.append(command)
+
+    def _uids(self):
+        return sorted(self.messages)
+
+    def starttls(self, *_args, **_kwargs):
+        return 'OK', []
+
+    def login(self, *_args, **_kwargs):
+        return 'OK', []
+
+    def select(self, *_args, **_kwargs):
+        self._seen_exists = len(self.messages)
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        # EXISTS сообщается, если число писем изменилось с прошлой проверки
+        if code == 'EXISTS' and len(self.messages) != self._seen_exists:
+            self._seen_exists = len(self.messages)
+            return code, [str(self._seen_exists).encode()]
+        return code, [None]
+
+    def status(self, mailbox, _items):
+        self._log('STATUS', mailbox)
+        uidnext = (max(self.messages) + 1) if self.messages else 1
+        return 'OK', [f'{mailbox} (UIDVALIDITY {self.uidvalidity} UIDNEXT {uidnext})'.encode()]
+
+    def noop(self):
+        return 'OK', []
+
+    def logout(self):
+        return 'BYE', []
+
+    def _search(self, criteria, by_uid):
+        uids = self._uids()
+        if criteria.startswith('UID '):
+            first = int(criteria.split()[1].split(':')[0])
+            found = [u for u in uids if u >= first] or uids[-1:]
+        elif criteria.startswith('(ON'):
+            day = _imap_date(criteria.split('"')[1])
+            found = [u for u in uids if message_date(self.messages[u][0]) == day]
+        elif criteria.startswith('(SINCE'):
+            since, before = (_imap_date(d) for d in re.findall(r'"(\d+-\w{3}-\d{4})"', criteria)[:2])
+            found = [u for u in uids if since <= message_date(self.messages[u][0]) < before]
+        else:
+            found = uids
+        # NOT FROM "..." / NOT SUBJECT "..." - подстрока заголовка без учета регистра
+        for field, needle in re.findall(r'NOT (FROM|SUBJECT) "([^"]*)"', criteria):
+            found = [u for u in found if needle.lower() not in self._header(u, field).lower()]
+        ids = found if by_uid else [uids.index(u) + 1 for u in found]
+        return 'OK', [b' '.join(str(i).encode() for i in ids)]
+
+    def _header(self, uid, field):
+        return email.message_from_bytes(self.messages[uid][1]).get(field, '')
+
+    def _fetch(self, msg_set, items, by_uid):
+        if isinstance(msg_set, bytes):
+            msg_set = msg_set.decode()
+        uids = self._uids()
+        data = []
+        for token in msg_set.split(','):
+            uid = int(token) if by_uid else uids[int(token) - 1]
+            seq = uids.index(uid) + 1
+            day, raw = self.messages[uid]
+            sections = re.findall(r'BODY\.PEEK\[([\d.]+)\]', items)
+            if 'HEADER.FIELDS' in items:
+                headers = raw.split(b'\r\n\r\n')[0] + b'\r\n\r\n'
+                data.append((f'{seq} (UID {uid} INTERNALDATE "{message_date(day):%d-%b-%Y} 10:00:00 +0700" '
+                             f'RFC822.SIZE {len(raw)} BODYSTRUCTURE {bodystructure(raw)} '
+                             f'BODY[HEADER.FIELDS (FROM)] {{{len(headers)}}}'.encode(), headers))
+            elif sections:
+                for i, section in enumerate(sections):
+                    content = section_payload(raw, section)
+                    prefix = f'{seq} (UID {uid} ' if i == 0 else ' '
+                    data.append((f'{prefix}BODY[{section}] {{{len(content)}}}'.encode(), content))
+            else:
+                data.append((f'{seq} (UID {uid} RFC822 {{{len(raw)}}}'.encode(), raw))
+            data.append(b')')
+        return 'OK', data
+
+    def search(self, _charset, criteria):
+        self._log('SEARCH', criteria)
+        return self._search(criteria, by_uid=False)
+
+    def fetch(self, msg_set, items):
+        self._log('FETCH', items)
+        return self._fetch(msg_set, items, by_uid=False)
+
+    def uid(self, command, *args):
+        self._log('UID ' + command, args[-1])
+        if command == 'SEARCH':
+            return self._search(args[-1], by_uid=True)
+        return self._fetch(args[0], args[1], by_uid=True)
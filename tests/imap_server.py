@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🖥️ Локальный IMAP-сервер для тестов: протокол по TCP поверх FakeIMAP
+Команды обрабатываются по очереди на каждом соединении (конвейер клиента
+копится в буфере сокета), ответы FETCH пишутся с литералами {N}, как у
+настоящего сервера. Задержка latency имитирует сетевой круг, deliver()
+кладет новое письмо и оповещает сессии, ожидающие в IDLE. fail_every
+внедряет сбои: каждый N-й FETCH получает NO или обрыв соединения.
+Сервер считает команды и байты в обе стороны (для бенчмарков).
+"""
+
+import asyncio
+import threading
+
+from tests.imap_fakes import FakeIMAP
+
+
+def _fetch_lines(data):
+    """📦 Данные FETCH в форме imaplib обратно в строки протокола"""
+    out = []
+    in_message = False
+    for item in data:
+        if item is None:
+            continue
+        head = item[0] if isinstance(item, tuple) else item
+        if not in_message and head[:1].isdigit():
+            seq, rest = head.split(b' ', 1)
+            head = b'* ' + seq + b' FETCH ' + rest
+        if isinstance(item, tuple):
+            out.append(head + b'\r\n' + item[1])
+            in_message = True
+        else:
+            out.append(head + b'\r\n')
+            in_message = False
+    return b''.join(out)
+
+
+class FakeImapServer:
+    """🖥️ IMAP-сервер на 127.0.0.1 с отдельным циклом событий в потоке"""
+
+    def __init__(self, latency: float = 0.0, fail_every: int = 0, failure_mode: str = 'drop'):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.failure_mode = failure_mode  # 'drop' - обрыв соединения, 'no' - ответ NO
+        self.port = None
+        self.connections = 0
+        self.commands = {}
+        self.fetches = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server = None
+        self._idlers = set()
+
+    def __enter__(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, '127.0.0.1', 0), self._loop).result(5)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *_exc):
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def deliver(self, uid: int, day: int, raw: bytes):
+        """📨 Новое письмо в папке и * N EXISTS всем сессиям в IDLE"""
+        FakeIMAP.messages[uid] = (day, raw)
+
+        def notify():
+            for writer in list(self._idlers):
+                writer.write(f'* {len(FakeIMAP.messages)} EXISTS\r\n'.encode())
+        self._loop.call_soon_threadsafe(notify)
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        imap = FakeIMAP()
+        greeting = b'* OK fake IMAP ready\r\n'
+        self.bytes_out += len(greeting)
+        writer.write(greeting)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes_in += len(line)
+                tag, _, rest = line.rstrip(b'\r\n').decode('utf-8').partition(' ')
+                name = self._command_name(rest)
+                self.commands[name] = self.commands.get(name, 0) + 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if rest.upper() == 'IDLE':
+                    await self._idle(tag, reader, writer)
+                    continue
+                if name.endswith('FETCH') and self._inject_failure():
+                    if self.failure_mode == 'drop':
+                        break
+                    untagged, status = b'', 'NO [UNAVAILABLE] injected failure'
+                else:
+                    untagged, status = self._execute(imap, rest)
+                response = untagged + f'{tag} {status}\r\n'.encode()
+                self.bytes_out += len(response)
+                writer.write(response)
+                await writer.drain()
+                if rest.upper() == 'LOGOUT':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _command_name(command: str) -> str:
+        words = command.split(' ', 2)
+        if words[0].upper() == 'UID' and len(words) > 1:
+            return f'UID {words[1].upper()}'
+        return words[0].upper()
+
+    def _inject_failure(self) -> bool:
+        self.fetches += 1
+        if self.fail_every and self.fetches % self.fail_every == 0:
+            self.failures += 1
+            return True
+        return False
+
+    @property
+    def round_trips(self) -> int:
+        """🔁 Всего команд клиента (каждая - один сетевой круг у синхронного движка)"""
+        return sum(self.commands.values())
+
+    async def _idle(self, tag, reader, writer):
+        writer.write(b'+ idling\r\n')
+        self._idlers.add(writer)
+        try:
+            await reader.readline()  # DONE
+        finally:
+            self._idlers.discard(writer)
+        writer.write(f'{tag} OK IDLE terminated\r\n'.encode())
+        await writer.drain()
+
+    def _execute(self, imap: FakeIMAP, command: str):
+        name, _, args = command.partition(' ')
+        name = name.upper()
+        by_uid = name == 'UID'
+        if by_uid:
+            name, _, args = args.partition(' ')
+            name = name.upper()
+
+        if name == 'CAPABILITY':
+            return b'* CAPABILITY IMAP4rev1 IDLE\r\n', 'OK completed'
+        if name in ('LOGIN', 'NOOP'):
+            return b'', 'OK completed'
+        if name == 'LOGOUT':
+            return b'* BYE logging out\r\n', 'OK completed'
+        if name == 'SELECT':
+            return f'* {len(FakeIMAP.messages)} EXISTS\r\n'.encode(), 'OK [READ-WRITE] completed'
+        if name == 'STATUS':
+            mailbox, _, items = args.partition(' ')
+            _status, data = imap.status(mailbox, items)
+            return b'* STATUS ' + data[0] + b'\r\n', 'OK completed'
+        if name == 'SEARCH':
+            _status, data = imap.uid('SEARCH', None, args) if by_uid else imap.search(None, args)
+            return b'* SEARCH ' + data[0] + b'\r\n', 'OK completed'
+        if name == 'FETCH':
+            msg_set, _, items = args.partition(' ')
+            _status, data = imap.uid('FETCH', msg_set, items) if by_uid else imap.fetch(msg_set, items)
+            return _fetch_lines(data), 'OK completed'
+        return b'', 'BAD unknown command'
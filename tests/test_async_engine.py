@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты асинхронного движка загрузки (--engine async) на локальном IMAP-сервере
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import imaplib
+import logging
+import threading
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2, AsyncImapPool, AsyncImapSession, SessionBridge
+from tests.imap_fakes import FakeIMAP, make_message
+from tests.imap_server import FakeImapServer
+
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    messages = {}
+    num = 1
+    for day in (1, 2, 3):
+        for _ in range(5):
+            messages[num] = (day, make_message(num, day))
+            num += 1
+    FakeIMAP.reset(messages)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    monkeypatch.setattr(fetcher_module, "ASYNC_STARTTLS", False)
+    return messages
+
+
+def saved_tree(root):
+    files = {}
+    for path in sorted((root / 'data' / 'emails').glob('*/email_*.json')):
+        data = json.loads(path.read_text(encoding='utf-8'))
+        files[f"{path.parent.name}/{path.name}"] = (data['message_id'], data['subject'], data['body'])
+    return files
+
+
+def run_engine(monkeypatch, workdir, engine):
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 2
+    if engine == 'async':
+        fetcher.pool_factory = AsyncImapPool
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+    return fetcher, emails
+
+
+def test_async_engine_matches_sync_output(mailbox, monkeypatch, tmp_path):
+    """⚡ Асинхронный движок сохраняет те же письма и считает ту же статистику, что синхронный"""
+    sync_fetcher, sync_emails = run_engine(monkeypatch, tmp_path / 'sync', 'sync')
+
+    with FakeImapServer() as server:
+        monkeypatch.setattr(fetcher_module, "IMAP_SERVER", '127.0.0.1')
+        monkeypatch.setattr(fetcher_module, "IMAP_PORT", server.port)
+        async_fetcher, async_emails = run_engine(monkeypatch, tmp_path / 'async', 'async')
+
+    assert server.connections == 2
+    assert len(async_emails) == len(sync_emails) == 15
+    assert saved_tree(tmp_path / 'async') == saved_tree(tmp_path / 'sync')
+    assert async_fetcher.stats.keys() == sync_fetcher.stats.keys()
+    for key in ('processed', 'saved', 'errors', 'selective_fetches'):
+        assert async_fetcher.stats[key] == sync_fetcher.stats[key], key
+
+
+def test_pipelined_fetches_are_routed_to_their_commands(mailbox):
+    """📡 Десятки FETCH в полете по одному соединению получают свои ответы"""
+    async def scenario(port):
+        session = AsyncImapSession('test', pipeline_depth=16)
+        await session.open('127.0.0.1', port, 'user', 'password', 'INBOX', starttls=False)
+        results = await asyncio.gather(*(session.command('UID FETCH', str(uid), '(RFC822)')
+                                         for uid in sorted(mailbox) * 3))
+        _status, search = await session.command('SEARCH', '(ON "02-Sep-2025")')
+        await session.close()
+        return results, search
+
+    with FakeImapServer(latency=0.001) as server:
+        results, search = asyncio.run(scenario(server.port))
+
+    for uid, (status, data) in zip(sorted(mailbox) * 3, results):
+        assert status == 'OK'
+        assert data[0][0].startswith(f'{uid} (UID {uid} RFC822'.encode())
+        assert data[0][1] == mailbox[uid][1]
+        assert data[1] == b')'
+    assert search == [b'6 7 8 9 10']
+
+
+@pytest.fixture
+def bridge_session(mailbox):
+    """🌉 Асинхронная сессия на локальном сервере и цикл событий в отдельном потоке"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    with FakeImapServer() as server:
+        session = AsyncImapSession('test')
+        asyncio.run_coroutine_threadsafe(
+            session.open('127.0.0.1', server.port, 'user', 'password', 'INBOX', starttls=False), loop).result(5)
+        yield server, session, loop
+        asyncio.run_coroutine_threadsafe(session.close(), loop).result(5)
+        threading.Event().wait(server.latency)  # Сервер дописывает ответ, задержанный до разрыва (time.sleep заглушен)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def test_operation_deadline_reaches_bridge_and_aborts_session(bridge_session, monkeypatch, tmp_path):
+    """⏱️ Дедлайн operation_deadline действует на команды моста; по истечении общая сессия разрывается"""
+    server, session, loop = bridge_session
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.mail = SessionBridge(session, loop, timeout=5)
+    server.latency = 0.5
+
+    started = time.time()
+    with pytest.raises(TimeoutError, match='Fetch'):
+        with fetcher.operation_deadline(0.1, 'Fetch'):
+            fetcher.mail.uid('FETCH', '1', '(RFC822)')
+    assert time.time() - started < 0.4
+
+    # Ответ на отмененную команду сбил бы конвейер - соединение закрыто, а не оставлено
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(5)  # разрыв уже выполнен циклом
+    assert not session.alive
+    with pytest.raises(imaplib.IMAP4.abort):
+        fetcher.mail.uid('FETCH', '2', '(RFC822)')
+
+
+def test_large_lane_timeout_reaches_bridge(bridge_session, monkeypatch, tmp_path):
+    """🐘 Большая полоса на асинхронном движке получает LARGE_FETCH_TIMEOUT, а не обычный таймаут моста"""
+    server, session, loop = bridge_session
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fetcher_module, 'SOCKET_TIMEOUT', 0.15)
+    monkeypatch.setattr(fetcher_module, 'FETCH_TIMEOUT', 0.15)
+    monkeypatch.setattr(fetcher_module, 'LARGE_FETCH_TIMEOUT', 3)
+    monkeypatch.setattr(fetcher_module, 'MAX_RETRIES', 1)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.session_factory = lambda: SessionBridge(session, loop, fetcher_module.SOCKET_TIMEOUT)
+    fetcher.large_lane = True
+    assert fetcher.connect()
+    server.latency = 0.3
+
+    # Дедлайн safe_fetch и команды без дедлайна (выборочная загрузка частей) переживают медленный ответ
+    data = fetcher.safe_fetch(b'1')
+    assert data[0][1] == FakeIMAP.messages[1][1]
+    status, _data = fetcher.imap_fetch(b'2', '(BODYSTRUCTURE)')
+    assert status == 'OK'
+
+    fetcher.large_lane = False
+    fetcher.apply_lane_timeout()
+    with pytest.raises(TimeoutError):
+        fetcher.imap_fetch(b'3', '(BODYSTRUCTURE)')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты контентно-адресуемого хранилища вложений
+"""
+
+import os
+import sys
+import logging
+from email.mime.application import MIMEApplication
+from email.mime.base import MIMEBase
+from email import encoders
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.attachment_store import AttachmentStore, iter_decoded_payload
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.email_loader import ProcessedEmailLoader
+
+
+PRICE_LIST = b'%PDF-1.4 price list ' * 100
+
+
+def make_part(filename, payload=PRICE_LIST):
+    part = MIMEApplication(payload, _subtype='pdf')
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part
+
+
+def test_same_content_stored_once(tmp_path):
+    """♻️ Одинаковое содержимое под разными именами и датами хранится одним файлом"""
+    store = AttachmentStore(tmp_path / 'attachments')
+
+    first = store.put(PRICE_LIST, 'price.pdf', '<a@x.ru>', '2025-09-01')
+    second = store.put(PRICE_LIST, 'Прайс_сентябрь.PDF', '<b@x.ru>', '2025-09-05')
+    again = store.put(PRICE_LIST, 'price.pdf', '<a@x.ru>', '2025-09-01')
+
+    assert not first['duplicate'] and second['duplicate'] and again['duplicate']
+    assert first['blob_path'] == second['blob_path']
+    assert second['first_date_folder'] == '2025-09-01'
+    assert again['refcount'] == 2
+    assert len([p for p in store.blobs_dir.rglob('*') if p.is_file()]) == 1
+
+
+def test_fetcher_manifest_points_at_blob(monkeypatch, tmp_path):
+    """📎 Манифест письма ссылается на blob, путь разрешается через ProcessedEmailLoader"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+
+    first = fetcher.save_attachment_or_inline(make_part('price.pdf'), 'thread1', '2025-09-01', message_id='<a@x.ru>')
+    second = fetcher.save_attachment_or_inline(make_part('copy.pdf'), 'thread2', '2025-09-02', message_id='<b@x.ru>')
+
+    assert first['status'] == 'saved' and not first['deduplicated']
+    assert second['status'] == 'saved' and second['deduplicated']
+    assert first['sha256'] == second['sha256']
+    assert second['file_path'] == first['file_path']
+    assert second['relative_path'].startswith('attachments/blobs/')
+    assert fetcher.stats['deduplicated_attachments'] == 1
+
+    loader = ProcessedEmailLoader()
+    loader.data_dir = tmp_path / 'data'
+    loader.attachments_dir = loader.data_dir / 'attachments'
+    moved = dict(second, file_path=None)
+    assert loader.get_attachment_file_path({'date_folder': '2025-09-02'}, moved) == tmp_path / 'data' / second['relative_path']
+
+    # Письмо, чье единственное вложение уже было в хранилище, остается письмом с вложением
+    emails = [{'message_id': '<a@x.ru>', 'attachments': [first]}, {'message_id': '<b@x.ru>', 'attachments': [second]}]
+    assert [email['message_id'] for email in loader.get_emails_with_attachments(emails)] == ['<a@x.ru>', '<b@x.ru>']
+
+
+def test_streaming_decode_matches_get_payload(tmp_path):
+    """🔓 Порционное декодирование base64/QP совпадает с get_payload(decode=True) на любых границах"""
+    binary = bytes(range(256)) * 300
+    base64_part = make_part('data.pdf', binary)
+    qp_part = MIMEBase('application', 'pdf')
+    qp_part.set_payload(('Строка с переносами и = знаками ' * 200).encode('utf-8'))
+    encoders.encode_quopri(qp_part)
+
+    for part in (base64_part, qp_part):
+        for chunk_size in (7, 1000, 1 << 20):
+            assert b''.join(iter_decoded_payload(part, chunk_size)) == part.get_payload(decode=True)
+
+    store = AttachmentStore(tmp_path / 'attachments')
+    staged = store.stage(base64_part)
+    assert staged['file_size'] == len(binary)
+    store.discard(staged)
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_excluded_image_leaves_no_temp_files(monkeypatch, tmp_path):
+    """🧹 Отклоненное по размеру изображение не оставляет временных файлов"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    logo = MIMEBase('image', 'png')
+    logo.set_payload(b'\x89PNG' + b'0' * 100)
+    encoders.encode_base64(logo)
+    logo.add_header('Content-Disposition', 'attachment', filename='logo_small.png')
+
+    result = fetcher.save_attachment_or_inline(logo, 'thread1', '2025-09-01')
+
+    assert result['status'] == 'excluded_by_size' and result['file_size'] == 104
+    assert list(fetcher.attachment_store.tmp_dir.iterdir()) == []
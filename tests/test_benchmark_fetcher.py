@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Бенчмарк загрузки на локальном IMAP-сервере: стоимость fetch-пути не хуже базы
+"""
+
+import os
+import sys
+import imaplib
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tests.benchmark_fetcher import (run_scenario, run_benchmark, synthetic_corpus, recorded_corpus,
+                                     load_baseline, compare_with_baseline)
+
+REAL_IMAP4 = imaplib.IMAP4
+
+
+@pytest.fixture(autouse=True)
+def real_imaplib(monkeypatch):
+    # Бенчмарк ходит к серверу по TCP настоящим imaplib, а не через заглушку conftest
+    monkeypatch.setattr(imaplib, "IMAP4", REAL_IMAP4)
+
+
+def test_round_trips_and_bytes_within_baseline():
+    """📈 Круги и байты на письмо не выросли относительно benchmark_baseline.json"""
+    baseline = load_baseline()
+    for name in ('baseline_sync', 'failures'):
+        metrics = run_scenario(name)
+        assert metrics['saved'] == metrics['messages'], name
+        assert compare_with_baseline(metrics, baseline[name], check_timing=False) == [], name
+        assert metrics['messages_per_s'] > 0 and metrics['peak_rss_mb'] > 0
+
+
+def test_injected_failures_and_recorded_corpus(tmp_path):
+    """💥 Обрывы и ответы NO на FETCH переживаются; записанный mbox служит корпусом"""
+    corpus = synthetic_corpus(20)
+    with open(tmp_path / 'recorded.mbox', 'wb') as f:
+        for _day, raw in corpus.values():
+            f.write(b'From bench@example.com Mon Sep  1 10:00:00 2025\n' + raw.replace(b'\r\n', b'\n') + b'\n')
+
+    recorded = recorded_corpus(tmp_path / 'recorded.mbox')
+    assert [raw for _day, raw in recorded.values()] == [raw for _day, raw in corpus.values()]
+
+    for mode in ('drop', 'no'):
+        metrics = run_benchmark(recorded, fail_every=7, failure_mode=mode)
+        assert metrics['failures_injected'] >= 3, mode
+        assert metrics['saved'] == 20 and metrics['errors'] == 0, mode
+    assert metrics['connections'] == 1
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты CONDSTORE/QRESYNC: повторный прогон периода спрашивает только изменения
+"""
+
+import os
+import sys
+import re
+import imaplib
+import logging
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.imap_protocol import parse_vanished
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+class CondstoreIMAP(FakeIMAP):
+    """📬 Поддельный сервер с CONDSTORE/QRESYNC: MODSEQ на письмо и журнал удалений"""
+    modseqs = {}
+    expunged = {}
+    highest = 0
+
+    @classmethod
+    def reset(cls, messages=None, uidvalidity=1):
+        super().reset(messages, uidvalidity)
+        cls.highest = 0
+        cls.modseqs = {}
+        cls.expunged = {}
+        for uid in sorted(cls.messages):
+            cls.touch(uid)
+
+    @classmethod
+    def touch(cls, uid):
+        cls.highest += 1
+        cls.modseqs[uid] = cls.highest
+
+    @classmethod
+    def expunge(cls, uid):
+        cls.highest += 1
+        del cls.messages[uid]
+        cls.expunged[uid] = cls.highest
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.capabilities = ('IMAP4REV1', 'STARTTLS')   # До входа сервер расширения не называет
+        self._vanished = []
+
+    def capability(self):
+        return 'OK', [b'IMAP4rev1 ENABLE IDLE CONDSTORE QRESYNC']
+
+    def enable(self, capability):
+        self._log('ENABLE', capability)
+        return 'OK', [capability.encode()]
+
+    def status(self, mailbox, items):
+        status, data = super().status(mailbox, items)
+        if 'HIGHESTMODSEQ' in items:
+            data = [data[0][:-1] + f' HIGHESTMODSEQ {self.highest})'.encode()]
+        return status, data
+
+    def response(self, code):
+        if code == 'VANISHED':
+            vanished, self._vanished = self._vanished, []
+            return code, vanished or [None]
+        return super().response(code)
+
+    def _search(self, criteria, by_uid):
+        match = re.search(r' MODSEQ (\d+)', criteria)
+        status, data = super()._search(criteria.replace(match.group(0), '') if match else criteria, by_uid)
+        if not match:
+            return status, data
+        uids = self._uids()
+        ids = [int(i) for i in data[0].split()]
+        changed = [i for i in ids if self.modseqs[i if by_uid else uids[i - 1]] >= int(match.group(1))]
+        return status, [b' '.join(str(i).encode() for i in changed)]
+
+    def uid(self, command, *args):
+        if command == 'FETCH' and len(args) > 2 and 'CHANGEDSINCE' in args[2]:
+            self._log('UID FETCH', args[2])
+            since = int(re.search(r'CHANGEDSINCE (\d+)', args[2]).group(1))
+            gone = sorted(uid for uid, modseq in self.expunged.items() if modseq > since)
+            if gone:
+                self._vanished.append(('(EARLIER) ' + ','.join(map(str, gone))).encode())
+            changed = [uid for uid in self._uids() if self.modseqs[uid] > since]
+            return 'OK', [f'{self._uids().index(uid) + 1} (UID {uid} MODSEQ ({self.modseqs[uid]}))'.encode()
+                          for uid in changed]
+        return super().uid(command, *args)
+
+
+def run_range(fetcher):
+    FakeIMAP.commands.clear()
+    fetcher.stats = dict.fromkeys(fetcher.stats, 0)
+    return fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 2))
+
+
+def test_rerun_fetches_only_changes_and_marks_vanished(monkeypatch, tmp_path):
+    """🔁 Второй прогон: SEARCH с MODSEQ, метаданные только измененных, VANISHED отмечается в индексе"""
+    monkeypatch.chdir(tmp_path)
+    CondstoreIMAP.reset({1: (1, make_message(1, 1)), 2: (1, make_message(2, 1)), 3: (2, make_message(3, 2))})
+    monkeypatch.setattr(imaplib, "IMAP4", CondstoreIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+
+    assert len(run_range(fetcher)) == 3
+    assert ('ENABLE', 'QRESYNC') in FakeIMAP.commands
+    assert not any('MODSEQ' in str(command[-1]) for command in FakeIMAP.commands if command[0] == 'UID SEARCH')
+    state = fetcher.load_sync_state()[fetcher.get_mailbox_key()]['modseq_days']
+    assert state == {'uidvalidity': 1, 'days': {'2025-09-01': 3, '2025-09-02': 3}}
+
+    # Между прогонами: новое письмо, смена флагов у письма 1, удаление письма 2
+    CondstoreIMAP.messages[4] = (1, make_message(4, 1))
+    CondstoreIMAP.touch(4)
+    CondstoreIMAP.touch(1)
+    CondstoreIMAP.expunge(2)
+
+    emails = run_range(fetcher)
+    searches = [command[-1] for command in FakeIMAP.commands if command[0] == 'UID SEARCH']
+    assert searches and all(criteria.endswith('MODSEQ 4)') for criteria in searches)
+    metadata_fetches = [command for command in FakeIMAP.commands if command[0] == 'UID FETCH' and 'HEADER.FIELDS' in command[-1]]
+    assert len(metadata_fetches) == 1  # один пакет на два измененных письма вместо всего периода
+    # Письмо 1 попадает в выборку из-за смены флагов, неизмененное письмо 3 - нет
+    assert {email['message_id'] for email in emails} <= {'<msg1@partner.ru>', '<msg4@partner.ru>'}
+    new_file = next(path for path in (fetcher.emails_dir / '2025-09-01').glob('email_*.json') if 'msg4' in path.read_text())
+    assert int(new_file.name.split('_')[1]) > 2  # нумерация продолжает уже сохраненные письма дня
+    assert fetcher.stats['vanished'] == 1
+    assert fetcher.message_index.get('<msg2@partner.ru>')['removed_at'] is not None
+    assert fetcher.message_index.get('<msg1@partner.ru>')['removed_at'] is None
+    assert fetcher.load_sync_state()[fetcher.get_mailbox_key()]['modseq_days']['days']['2025-09-01'] == 6
+
+
+def test_servers_without_condstore_fall_back(monkeypatch, tmp_path):
+    """📭 Без CONDSTORE период сканируется целиком, MODSEQ не запоминается; UID-синхронизация как раньше"""
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({1: (1, make_message(1, 1)), 2: (2, make_message(2, 2))})
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+
+    run_range(fetcher)
+    run_range(fetcher)
+    assert not any('MODSEQ' in str(command[-1]) for command in FakeIMAP.commands)
+    assert 'modseq_days' not in fetcher.load_sync_state().get(fetcher.get_mailbox_key(), {})
+
+    fetcher.sync_new_emails()
+    checkpoint = fetcher.load_sync_state()[fetcher.get_mailbox_key()]
+    assert checkpoint['last_uid'] == 2 and checkpoint['highestmodseq'] == 0
+
+    assert parse_vanished([b'(EARLIER) 3:5,9', b'12']) == [3, 4, 5, 9, 12]
+
+
+def test_failed_scan_or_chunk_keeps_previous_modseq(monkeypatch, tmp_path):
+    """🛑 Сбой поиска или обработки порции не продвигает MODSEQ дней: следующий прогон сканирует период целиком"""
+    monkeypatch.chdir(tmp_path)
+    CondstoreIMAP.reset({1: (1, make_message(1, 1)), 2: (2, make_message(2, 2))})
+    monkeypatch.setattr(imaplib, "IMAP4", CondstoreIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+
+    original_search = CondstoreIMAP._search
+    monkeypatch.setattr(CondstoreIMAP, "_search", lambda self, criteria, by_uid: ('NO', [b'busy']))
+    assert run_range(fetcher) == []
+    assert 'modseq_days' not in fetcher.load_sync_state().get(fetcher.get_mailbox_key(), {})
+    monkeypatch.setattr(CondstoreIMAP, "_search", original_search)
+
+    original_process = AdvancedEmailFetcherV2.process_single_email
+
+    def crash_on_second(worker, msg_id, *args, **kwargs):
+        if msg_id == b'2':
+            raise RuntimeError("parser crashed")
+        return original_process(worker, msg_id, *args, **kwargs)
+
+    monkeypatch.setattr(AdvancedEmailFetcherV2, "process_single_email", crash_on_second)
+    assert len(run_range(fetcher)) == 1
+    assert 'modseq_days' not in fetcher.load_sync_state().get(fetcher.get_mailbox_key(), {})
+    key = fetcher.retry_queue.make_key(fetcher.queue_mailbox(), 1, 2, '2')
+    assert fetcher.retry_queue.get(key)['reason'].startswith('chunk_error_RuntimeError')
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты индекса переписок по Message-ID / In-Reply-To / References
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.conversation_index import ConversationIndex
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def make_reply(num: int, day: int, subject: str, references: list) -> bytes:
+    """↪️ Ответ с In-Reply-To на последнее письмо цепочки и полным References"""
+    raw = make_message(num, day, subject=subject)
+    extra = (f"In-Reply-To: {references[-1]}\r\n"
+             f"References: {' '.join(references)}\r\n").encode()
+    marker = f"Message-ID: <msg{num}@partner.ru>\r\n".encode()
+    return raw.replace(marker, marker + extra)
+
+
+def test_out_of_order_replies_join_one_conversation(tmp_path):
+    """🔀 Ответ, сохраненный раньше исходного письма, переносится в общий корень"""
+    index = ConversationIndex(tmp_path / 'conversation_index.db')
+
+    # Ответ только с In-Reply-To пришел первым: корнем временно считается родитель
+    assert index.add('<c@x>', in_reply_to='<b@x>', sent_at='2025-09-03') == {'conversation_id': '<b@x>', 'parent_id': '<b@x>'}
+    # Письмо B ссылается на A - цепочка C → B → A сливается в корень A
+    assert index.add('<b@x>', in_reply_to='<a@x>', references='<a@x>', sent_at='2025-09-02')['conversation_id'] == '<a@x>'
+    assert index.add('<a@x>', sent_at='2025-09-01') == {'conversation_id': '<a@x>', 'parent_id': None}
+    # Ответ с другой темой через неделю
+    assert index.add('<d@x>', references='<a@x> <b@x> <c@x>', subject='Другая тема',
+                     sent_at='2025-09-10')['conversation_id'] == '<a@x>'
+    index.add('<other@x>', sent_at='2025-09-05')
+
+    assert [entry['message_id'] for entry in index.thread_of('<c@x>')] == ['<a@x>', '<b@x>', '<c@x>', '<d@x>']
+    assert [entry['message_id'] for entry in index.children('<c@x>')] == ['<d@x>']
+    assert index.get('<d@x>')['parent_id'] == '<c@x>'
+    assert index.thread_of('<other@x>')[0]['root_id'] == '<other@x>'
+
+    index.mark_analyzed('<b@x>')
+    assert [entry['message_id'] for entry in index.conversation('<a@x>') if entry['analyzed_at']] == ['<b@x>']
+
+
+def test_fetcher_stores_conversation_and_rebuilds_index(monkeypatch, tmp_path):
+    """🧵 Ответы в другие дни и с новой темой получают корень исходного письма; индекс пересобирается из JSON"""
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({
+        1: (1, make_message(1, 1, subject='Запрос цены')),
+        2: (2, make_reply(2, 2, 'Re: Запрос цены', ['<msg1@partner.ru>'])),
+        3: (3, make_reply(3, 3, 'Счет на оплату', ['<msg1@partner.ru>', '<msg2@partner.ru>'])),
+        4: (3, make_message(4, 3)),
+    })
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    by_id = {email['message_id']: email for email in emails}
+    assert by_id['<msg3@partner.ru>']['conversation_id'] == '<msg1@partner.ru>'
+    assert by_id['<msg3@partner.ru>']['parent_id'] == '<msg2@partner.ru>'
+    assert by_id['<msg3@partner.ru>']['references'] == ['<msg1@partner.ru>', '<msg2@partner.ru>']
+    assert by_id['<msg2@partner.ru>']['thread_id'] != by_id['<msg1@partner.ru>']['thread_id']
+    assert by_id['<msg4@partner.ru>']['conversation_id'] == '<msg4@partner.ru>'
+
+    saved = json.loads(next((fetcher.emails_dir / '2025-09-02').glob('email_*.json')).read_text(encoding='utf-8'))
+    assert saved['conversation_id'] == '<msg1@partner.ru>' and saved['in_reply_to'] == '<msg1@partner.ru>'
+
+    before = {entry['message_id']: entry['root_id'] for entry in fetcher.conversation_index.thread_of('<msg2@partner.ru>')}
+    fetcher.conversation_index.mark_analyzed('<msg1@partner.ru>')
+    assert fetcher.conversation_index.rebuild(fetcher.emails_dir) == 4
+    thread = fetcher.conversation_index.thread_of('<msg2@partner.ru>')
+    assert {entry['message_id']: entry['root_id'] for entry in thread} == before
+    assert [entry['message_id'] for entry in thread if entry['analyzed_at']] == ['<msg1@partner.ru>']
+    assert all(entry['email_path'].endswith('.json') for entry in thread)
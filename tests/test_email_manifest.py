@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты манифеста писем и ленивого ProcessedEmailLoader
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+from datetime import datetime
+from email.mime.application import MIMEApplication
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.email_loader import ProcessedEmailLoader
+from src.email_manifest import EmailManifest
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def make_pdf(filename: str) -> MIMEApplication:
+    part = MIMEApplication(b'%PDF-1.4 price list ' * 100, _subtype='pdf')
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part
+
+
+def make_loader(data_dir) -> ProcessedEmailLoader:
+    loader = ProcessedEmailLoader()
+    loader.data_dir = data_dir
+    loader.emails_dir = data_dir / 'emails'
+    loader.attachments_dir = data_dir / 'attachments'
+    return loader
+
+
+def test_loader_filters_by_manifest_without_opening_emails(monkeypatch, tmp_path):
+    """📋 Парсер ведет манифест; старые письма дописываются при первом чтении; фильтры не открывают письма"""
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({num: (1, make_message(num, 1)) for num in range(1, 4)})
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+    fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 1))
+
+    entries = list(fetcher.email_manifest.entries('2025-09-01'))
+    assert [entry['message_id'] for entry in entries] == [f'<msg{num}@partner.ru>' for num in range(1, 4)]
+    assert entries[0]['sender'] == 'client1@partner.ru' and entries[0]['char_count'] > 0
+    assert entries[0]['state'] == 'saved' and len(entries[0]['content_hash']) == 64
+
+    # Письмо, сохраненное до появления манифеста, со скачанным вложением
+    legacy = tmp_path / 'data' / 'emails' / '2025-09-01' / 'email_900_20250901_legacy.json'
+    legacy.write_text(json.dumps({
+        "message_id": "<legacy@x.ru>", "subject": "Счет", "from": "a@x.ru", "body": "Счет во вложении",
+        "attachments": [{"status": "saved", "file_path": "price.pdf"}, {"status": "filtered"}],
+        "date_folder": "2025-09-01",
+    }, ensure_ascii=False), encoding='utf-8')
+
+    loader = make_loader(tmp_path / 'data')
+    reads = []
+    store_read = loader.get_email_store().read
+    monkeypatch.setattr(loader.get_email_store(), 'read', lambda *args: reads.append(args[1]) or store_read(*args))
+
+    with_attachments = list(loader.iter_manifest('2025-09-01', with_attachments=True))
+    assert [entry['message_id'] for entry in with_attachments] == ['<legacy@x.ru>']
+    assert with_attachments[0]['attachment_count'] == 2 and with_attachments[0]['saved_attachments'] == 1
+    assert reads == [legacy.name]  # открыто только письмо без записи в манифесте
+
+    emails = loader.iter_emails('2025-09-01', unprocessed=True)
+    first = next(emails)
+    assert first['message_id'] == '<msg1@partner.ru>' and len(reads) == 2
+    loader.mark_processed(first)
+    assert [email['message_id'] for email in loader.iter_emails('2025-09-01', unprocessed=True)] == \
+        ['<msg2@partner.ru>', '<msg3@partner.ru>', '<legacy@x.ru>']
+    assert len(list(loader.iter_all_emails())) == 4
+
+
+def test_changed_content_resets_processing_state(tmp_path):
+    """🔑 Пересохранение без изменений сохраняет состояние, новое содержимое снова ждет обработки"""
+    manifest = EmailManifest(tmp_path / 'email_manifest.db')
+    email_data = {"message_id": "<a@x>", "body": "Текст", "attachments": []}
+    manifest.record('2025-09-01', 'email_001.json', email_data)
+    manifest.mark('<a@x>')
+
+    manifest.record('2025-09-01', 'email_001.json', email_data)
+    assert list(manifest.entries('2025-09-01', unprocessed=True)) == []
+
+    manifest.record('2025-09-01', 'email_001.json', dict(email_data, body="Новый текст"))
+    assert [entry['state'] for entry in manifest.entries('2025-09-01', unprocessed=True)] == ['saved']
+
+
+def test_deduplicated_attachment_counts_as_saved(monkeypatch, tmp_path):
+    """♻️ Второе письмо с тем же PDF попадает в выборку with_attachments, хотя файл уже был в хранилище"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    for num in (1, 2):
+        attachment = fetcher.save_attachment_or_inline(make_pdf('price.pdf'), f't{num}', '2025-09-01',
+                                                       message_id=f'<{num}@x.ru>')
+        fetcher.email_manifest.record('2025-09-01', f'email_00{num}.json', {
+            "message_id": f"<{num}@x.ru>", "body": "Прайс во вложении", "attachments": [attachment]})
+
+    entries = list(fetcher.email_manifest.entries('2025-09-01', with_attachments=True))
+    assert [entry['message_id'] for entry in entries] == ['<1@x.ru>', '<2@x.ru>']
+    assert [entry['saved_attachments'] for entry in entries] == [1, 1]
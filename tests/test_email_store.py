@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты сжатого хранилища писем: сегменты по дням, индекс смещений, перенос старых папок
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.email_store import EmailStore
+from src.email_loader import ProcessedEmailLoader
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def sample_email(num: int, date_folder: str = '2025-09-01') -> dict:
+    return {
+        "message_id": f"<msg{num}@partner.ru>",
+        "subject": f"Запрос цены №{num}",
+        "body": "Добрый день! Прошу выставить счет на реагенты и расходные материалы. " * 20,
+        "attachments": [],
+        "date_folder": date_folder,
+    }
+
+
+def test_segments_random_access_and_mixed_days(tmp_path):
+    """🎯 Письмо читается по Message-ID без распаковки дня; день со старыми JSON-файлами читается вместе с сегментом"""
+    store = EmailStore(tmp_path / 'emails', backend='segments')
+    locators = [store.save('2025-09-01', f'email_{num:03d}_20250901_t.json', sample_email(num)) for num in (1, 2, 3)]
+    legacy = tmp_path / 'emails' / '2025-09-01' / 'email_004_20250901_t.json'
+    legacy.write_text(json.dumps(sample_email(4), ensure_ascii=False), encoding='utf-8')
+
+    assert all('#' in locator and store.exists(locator) for locator in locators)
+    assert store.load(locators[1])['message_id'] == '<msg2@partner.ru>'
+    assert store.get_by_message_id('<msg3@partner.ru>')['subject'] == 'Запрос цены №3'
+    assert store.get_by_message_id('<missing@x>') is None
+    assert not store.exists(locators[0].replace('email_001', 'email_009'))
+
+    day = list(store.iter_day('2025-09-01'))
+    assert [email['message_id'] for _, email in day] == [f'<msg{num}@partner.ru>' for num in (1, 2, 3, 4)]
+    assert day[3][0] == str(legacy)
+    assert store.names('2025-09-01')[-1] == legacy.name
+
+    # Перезапись письма: в индексе остается последний кадр
+    store.save('2025-09-01', 'email_002_20250901_t.json', dict(sample_email(2), subject='Исправлено'))
+    assert store.get_by_message_id('<msg2@partner.ru>')['subject'] == 'Исправлено'
+    assert len(list(store.iter_day('2025-09-01'))) == 4
+
+
+def test_convert_day_shrinks_folder_and_loader_reads_it(tmp_path):
+    """🔄 Перенос удаляет отдельные файлы, сегмент меньше суммы JSON; загрузчик читает день как раньше"""
+    emails_dir = tmp_path / 'data' / 'emails'
+    json_store = EmailStore(emails_dir)
+    for num in range(1, 21):
+        json_store.save('2025-09-02', f'email_{num:03d}_20250902_t.json', sample_email(num, '2025-09-02'))
+    json_size = sum(path.stat().st_size for path in (emails_dir / '2025-09-02').glob('email_*.json'))
+
+    store = EmailStore(emails_dir, backend='segments')
+    assert store.convert_all() == 20
+    day_files = [path for path in (emails_dir / '2025-09-02').iterdir()]
+    assert [path.name for path in day_files] == [store.segment_path('2025-09-02').name]
+    assert day_files[0].stat().st_size < json_size / 5
+
+    loader = ProcessedEmailLoader()
+    loader.emails_dir = emails_dir
+    emails = loader.load_emails_by_date('2025-09-02')
+    assert [email['message_id'] for email in emails] == [f'<msg{num}@partner.ru>' for num in range(1, 21)]
+
+
+def test_fetcher_writes_segments_and_skips_duplicates(monkeypatch, tmp_path):
+    """📼 Режим segments: письма в сегменте, индексы указывают на локаторы, повторный прогон не дублирует"""
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({num: (1, make_message(num, 1)) for num in range(1, 4)})
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.email_store = EmailStore(fetcher.emails_dir, backend='segments', logger=fetcher.logger)
+    fetcher.pool_size = 1
+
+    assert len(fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 1))) == 3
+    day_dir = fetcher.emails_dir / '2025-09-01'
+    assert not list(day_dir.glob('email_*.json'))
+    entry = fetcher.message_index.get('<msg2@partner.ru>')
+    assert '#' in entry['email_path']
+    assert fetcher.email_store.load(entry['email_path'])['message_id'] == '<msg2@partner.ru>'
+
+    assert fetcher.check_email_already_saved('<msg2@partner.ru>', '2025-09-01')['email_exists'] is True
+    fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 1))
+    assert len(fetcher.email_store.names('2025-09-01')) == 3
+    assert fetcher.message_index.rebuild(fetcher.emails_dir, fetcher.email_store.iter_all()) == 3
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты дедлайнов загрузки без SIGALRM (работают в потоках пула)
+"""
+
+import os
+import sys
+import socket
+import imaplib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+
+
+FALLBACK_RESPONSE = [(b'1 (BODY[HEADER] {17}', b'Subject: test\r\n\r\n'), b')']
+
+
+class HangingIMAP:
+    """🐌 Сессия, у которой FETCH письма зависает на чтении сокета"""
+
+    def __init__(self):
+        self.sock, self._peer = socket.socketpair()
+        self.commands = []
+
+    def noop(self):
+        return 'OK', []
+
+    def fetch(self, msg_set, items):
+        self.commands.append(items)
+        if items == '(RFC822)':
+            if not self.sock.recv(1):
+                raise imaplib.IMAP4.abort('socket error: EOF')
+        return 'OK', FALLBACK_RESPONSE
+
+
+def test_hanging_fetch_aborts_into_fallback_on_worker_thread(monkeypatch, tmp_path):
+    """⏱️ Зависший FETCH в потоке воркера прерывается и уходит в try_fallback_fetch"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fetcher_module, 'MAX_RETRIES', 1)
+    monkeypatch.setattr(fetcher_module, 'REQUEST_DELAY', 0)
+    monkeypatch.setattr(fetcher_module, 'FETCH_TIMEOUT', 0.3)
+
+    fetchers = [AdvancedEmailFetcherV2(logging.getLogger("TestLogger")) for _ in range(3)]
+    sessions = []
+    for fetcher in fetchers:
+        fetcher.mail = HangingIMAP()
+        sessions.append(fetcher.mail)
+
+        def reconnect(fetcher=fetcher):
+            fetcher.mail = HangingIMAP()
+            sessions.append(fetcher.mail)
+            return True
+
+        fetcher.connect = reconnect
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda f: f.safe_fetch(b'1'), fetchers))
+
+    assert results == [FALLBACK_RESPONSE] * 3
+    # Старая сессия закрыта дедлайном, fallback шел по новой
+    assert all(s.commands == ['(RFC822)'] for s in sessions[:3])
+    assert all(s.commands == ['(BODY.PEEK[HEADER] BODY.PEEK[TEXT])'] for s in sessions[3:])
+
+
+def test_deadline_restores_socket_timeout(tmp_path, monkeypatch):
+    """🔧 После успешной операции сокет возвращается к обычному таймауту"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.mail = HangingIMAP()
+
+    with fetcher.operation_deadline(5):
+        assert fetcher.mail.sock.gettimeout() == 5
+
+    assert fetcher.mail.sock.gettimeout() == fetcher_module.SOCKET_TIMEOUT
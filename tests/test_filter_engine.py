@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты скомпилированных фильтров и их горячей перезагрузки
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import EmailFilters
+from src.filter_engine import AhoCorasick
+
+
+def write_config(config_dir, subjects, blacklist, filenames):
+    config_dir.mkdir(exist_ok=True)
+    (config_dir / 'filters.txt').write_text('\n'.join(['# темы'] + subjects), encoding='utf-8')
+    (config_dir / 'blacklist.txt').write_text('\n'.join(blacklist), encoding='utf-8')
+    (config_dir / 'attachment_filename_excludes.txt').write_text('\n'.join(filenames), encoding='utf-8')
+
+
+def test_aho_corasick_finds_overlapping_words():
+    """🔤 Автомат находит слова, в том числе вложенные в другие"""
+    matcher = AhoCorasick(['акция', 'he', 'she', 'hers', 'распродажа'])
+    assert matcher.search('ushers') in ('she', 'he')
+    assert matcher.search('большая распродажа!') == 'распродажа'
+    assert matcher.search('счет на оплату') is None
+
+
+def test_compiled_rules_match_previous_semantics(tmp_path):
+    """🚫 Темы, адреса (точные, *@домен, префикс*) и имена файлов (маски и точные)"""
+    write_config(tmp_path, ['Вебинар', 'unsubscribe'],
+                 ['info@*', '*@spam.ru', 'boss@partner.ru'],
+                 ['Презентация*', '*.tmp', 'logo.png'])
+    filters = EmailFilters(tmp_path, logging.getLogger("TestLogger"))
+
+    assert filters.is_subject_filtered('Приглашение на ВЕБИНАР') == "тема содержит 'вебинар'"
+    assert filters.is_subject_filtered('Заявка на реагенты') is None
+
+    assert filters.is_sender_blacklisted('Info@shop.ru') == "адрес начинается с 'info@' (в черном списке)"
+    assert filters.is_sender_blacklisted('a@spam.ru') == "домен в черном списке (spam.ru)"
+    assert filters.is_sender_blacklisted('a@notspam.ru') is None
+    assert filters.is_sender_blacklisted(' boss@partner.ru ') == "адрес в черном списке"
+
+    assert filters.is_filename_excluded('презентация компании.pdf') == "имя файла соответствует паттерну 'Презентация*'"
+    assert filters.is_filename_excluded('~report.tmp')
+    assert filters.is_filename_excluded('LOGO.png') == "имя файла точно соответствует 'logo.png'"
+    assert filters.is_filename_excluded('~logo.png') is None
+    assert filters.is_filename_excluded('price.pdf') is None
+
+
+def test_rules_hot_reload_when_config_changes(monkeypatch, tmp_path):
+    """🔄 Изменение файла в config/ применяется без перезапуска"""
+    monkeypatch.setattr(fetcher_module, 'FILTER_RELOAD_INTERVAL', 0)
+    write_config(tmp_path, ['вебинар'], [], [])
+    filters = EmailFilters(tmp_path, logging.getLogger("TestLogger"))
+    assert filters.is_subject_filtered('Скидки недели') is None
+
+    filters_file = tmp_path / 'filters.txt'
+    filters_file.write_text('вебинар\nскидки', encoding='utf-8')
+    later = time.time() + 10
+    os.utime(filters_file, (later, later))
+
+    assert filters.is_subject_filtered('Скидки недели') == "тема содержит 'скидки'"
+    assert 'скидки' in filters.subject_filters
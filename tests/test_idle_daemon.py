@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты режима демона: IDLE и запасной опрос NOOP
+"""
+
+import os
+import sys
+import time
+import imaplib
+import logging
+import threading
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from tests.imap_fakes import FakeIMAP, make_message
+from tests.imap_server import FakeImapServer
+
+REAL_IMAP4 = imaplib.IMAP4
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        threading.Event().wait(0.02)
+    return False
+
+
+@pytest.fixture
+def mailbox(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({num: (1, make_message(num, 1)) for num in range(1, 5)})
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    return FakeIMAP
+
+
+def test_idle_returns_when_server_reports_new_message(mailbox):
+    """💤 IDLE завершается по * N EXISTS, сессия остается рабочей"""
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+
+    with FakeImapServer() as server:
+        fetcher.mail = REAL_IMAP4('127.0.0.1', server.port)
+        fetcher.mail.login('user', 'password')
+        fetcher.mail.select('INBOX')
+
+        threading.Timer(0.2, server.deliver, (5, 1, make_message(5, 1))).start()
+        started = time.monotonic()
+        assert fetcher.wait_for_new_mail(threading.Event()) is True
+        assert time.monotonic() - started < 5
+        assert fetcher.mail.noop()[0] == 'OK'
+        fetcher.mail.logout()
+
+
+def test_daemon_ingests_new_mail_by_noop_polling(mailbox, monkeypatch):
+    """📡 Без IDLE демон опрашивает сервер и синхронизирует новые письма по мере прихода"""
+    monkeypatch.setattr(fetcher_module, "DAEMON_POLL_INTERVAL", 0.05)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+    stop = threading.Event()
+    daemon = threading.Thread(target=fetcher.run_daemon, args=(stop,))
+    daemon.start()
+    try:
+        assert wait_until(lambda: fetcher.stats['saved'] == 4)
+        with FakeIMAP.lock:
+            mailbox.messages[5] = (1, make_message(5, 1))
+            mailbox.messages[6] = (1, make_message(6, 1))
+        assert wait_until(lambda: fetcher.stats['saved'] == 6)
+    finally:
+        stop.set()
+        daemon.join(10)
+
+    assert not daemon.is_alive()
+    assert len(mailbox.sessions) == 1
+    assert fetcher.load_sync_state()[fetcher.get_mailbox_key()]['last_uid'] == 6
+
+
+def test_daemon_wakes_reuse_its_session_and_report_on_timer(mailbox, monkeypatch):
+    """🔁 Пул - только для догоняющей синхронизации; повтор очереди и статистика - по таймеру, итоги - при остановке"""
+    monkeypatch.setattr(fetcher_module, "DAEMON_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(fetcher_module, "DAEMON_MAINTENANCE_INTERVAL", 0.3)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 3
+    reports = []
+    monkeypatch.setattr(fetcher, "print_final_stats", lambda: reports.append(dict(fetcher.stats)))
+
+    stop = threading.Event()
+    daemon = threading.Thread(target=fetcher.run_daemon, args=(stop,))
+    daemon.start()
+    try:
+        assert wait_until(lambda: fetcher.stats['saved'] == 4)
+        assert len(mailbox.sessions) == 3
+        with FakeIMAP.lock:
+            mailbox.messages[5] = (1, make_message(5, 1))
+        # Письмо, пропущенное раньше, догружается повтором очереди без нового оповещения
+        fetcher.retry_queue.enqueue(fetcher.queue_mailbox(), 1, 2, '2', '2025-09-01', 'timeout', uid_mode=True)
+        assert wait_until(lambda: fetcher.stats['saved'] == 5)
+        assert wait_until(lambda: fetcher.retry_queue.count('pending') == 0)
+        assert wait_until(lambda: any(fetcher.logs_dir.glob('processing_stats_*.json')))
+        assert reports == []
+    finally:
+        stop.set()
+        daemon.join(10)
+
+    assert not daemon.is_alive()
+    assert len(mailbox.sessions) == 3  # оповещения не открывали новых сессий
+    assert len(reports) == 1
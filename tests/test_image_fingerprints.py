@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты индекса отпечатков мусорных изображений
+"""
+
+import io
+import os
+import sys
+import json
+import logging
+from email.mime.image import MIMEImage
+
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.image_fingerprints import sniff_image
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+
+
+def make_image(width, height, image_format='PNG', quality=90):
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    for x in range(0, width, 12):
+        draw.line([(x, 0), (width - x, height)], fill=(x % 255, 40, 200), width=3)
+    draw.rectangle([width // 4, height // 4, width // 2, height // 2], fill='black')
+    buffer = io.BytesIO()
+    img.save(buffer, image_format, **({'quality': quality} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def make_part(data, filename):
+    part = MIMEImage(data)
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part
+
+
+def test_header_sniff_matches_full_decode():
+    """👃 Формат, размеры и длина файла берутся из заголовка и длины base64"""
+    for image_format, expected in (('PNG', 'png'), ('JPEG', 'jpeg'), ('GIF', 'gif'), ('BMP', 'bmp'), ('WEBP', 'webp')):
+        data = make_image(321, 123, image_format)
+        sniff = sniff_image(make_part(data, f'x.{expected}'))
+        assert sniff == {'format': expected, 'width': 321, 'height': 123, 'size': len(data)}, image_format
+
+
+def test_rejected_image_is_learned_and_caught_under_another_name(monkeypatch, tmp_path):
+    """📚 Картинка, отклоненная правилом, запоминается и ловится по отпечатку под любым именем"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    banner = make_image(416, 250)
+
+    first = fetcher.save_attachment_or_inline(make_part(banner, 'banner.png'), 't1', '2025-09-01', message_id='<a@x.ru>')
+    assert first['status'] == 'excluded_by_size'
+    assert first['image_dimensions'] == '416×250'
+    assert fetcher.stats['excluded_by_image_dimensions'] == 1
+
+    # Своего файла не было: правила и имена взяты из поставляемого config/junk_images.json и записаны вместе с отпечатком
+    learned = json.loads((tmp_path / 'config' / 'junk_images.json').read_text(encoding='utf-8'))
+    fingerprints = learned['fingerprints']
+    assert list(fingerprints) == [f'png:416x250:{len(banner)}']
+    assert 'image001.png' in learned['filenames'] and 'image001.png' in fetcher.specific_excluded_files
+
+    # Правило размеров убрали из файла - отпечаток остается
+    config_path = tmp_path / 'config' / 'junk_images.json'
+    config_path.write_text(json.dumps({'rules': [], 'fingerprints': fingerprints}), encoding='utf-8')
+    fetcher.junk_images.load()
+    second = fetcher.save_attachment_or_inline(make_part(banner, 'scan.png'), 't2', '2025-09-02', message_id='<b@x.ru>')
+    assert second['status'] == 'excluded_by_fingerprint'
+    assert fetcher.stats['excluded_by_fingerprint'] == 1
+    assert not list(fetcher.attachment_store.tmp_dir.iterdir())
+
+
+def test_image_from_many_senders_becomes_fingerprint(monkeypatch, tmp_path):
+    """👀 Картинка от N разных отправителей становится отпечатком, пересжатая копия ловится по dHash"""
+    monkeypatch.chdir(tmp_path)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    logo = make_image(300, 120, 'JPEG', quality=90)
+
+    for num in range(3):
+        saved = fetcher.save_attachment_or_inline(make_part(logo, 'company.jpg'), f't{num}', '2025-09-01',
+                                                  message_id=f'<{num}@x.ru>', sender=f'user{num}@partner{num}.ru')
+        assert saved['status'] == 'saved'
+    assert len(fetcher.junk_images.fingerprints) == 1
+    entry = next(iter(fetcher.junk_images.fingerprints.values()))
+    assert entry['source'] == 'sightings' and entry['dhash']
+
+    again = fetcher.save_attachment_or_inline(make_part(logo, 'company.jpg'), 't4', '2025-09-02',
+                                              message_id='<4@x.ru>', sender='new@other.ru')
+    assert again['status'] == 'excluded_by_fingerprint'
+
+    recompressed = make_image(300, 120, 'JPEG', quality=60)
+    assert recompressed != logo
+    similar = fetcher.save_attachment_or_inline(make_part(recompressed, 'brand.jpg'), 't5', '2025-09-02',
+                                                message_id='<5@x.ru>', sender='other@else.ru')
+    assert similar['status'] == 'excluded_by_fingerprint'
+    assert fetcher.stats['excluded_by_fingerprint'] == 2
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты метрик IMAP-уровня: гистограммы команд, байты, повторы, textfile для Prometheus
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.imap_metrics import ImapMetrics, fetch_label
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def test_fetch_labels_histogram_and_prometheus_text(tmp_path):
+    """🏷️ FETCH делится по типу данных, задержки ложатся в корзины, textfile в формате Prometheus"""
+    assert fetch_label('(RFC822)') == 'FETCH RFC822'
+    assert fetch_label('(UID INTERNALDATE RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM)])') == 'FETCH METADATA'
+    assert fetch_label('(BODY.PEEK[1] BODY.PEEK[2.MIME])') == 'FETCH PARTS'
+    assert fetch_label('(BODY.PEEK[HEADER])') == 'FETCH HEADER'
+    assert fetch_label('(BODYSTRUCTURE)') == 'FETCH BODYSTRUCTURE'
+    assert fetch_label('(RFC822.SIZE)') == 'FETCH SIZE'
+
+    metrics = ImapMetrics()
+    for seconds in (0.003, 0.04, 0.04, 7.0):
+        metrics.observe('NOOP', seconds, bytes_in=10, bytes_out=6)
+    metrics.call('SEARCH', lambda criteria: ('NO', [b'bad criteria']), 'ALL')
+    metrics.count('retries', 2)
+
+    snapshot = metrics.to_dict()
+    noop = snapshot['commands']['NOOP']
+    assert noop['count'] == 4 and noop['bytes_in'] == 40
+    assert noop['buckets']['0.005'] == 1 and noop['buckets']['0.05'] == 2 and noop['buckets']['10.0'] == 1
+    assert noop['p50_ms'] == 50.0 and noop['max_ms'] == 7000.0
+    assert snapshot['commands']['SEARCH']['errors'] == 1
+    assert snapshot['events']['retries'] == 2 and snapshot['round_trips'] == 5
+
+    path = metrics.write_prometheus(tmp_path / 'textfile' / 'imap.prom')
+    text = path.read_text(encoding='utf-8')
+    assert 'imap_command_duration_seconds_bucket{command="NOOP",le="0.05"} 3' in text
+    assert 'imap_command_duration_seconds_bucket{command="NOOP",le="+Inf"} 4' in text
+    assert 'imap_command_duration_seconds_count{command="NOOP"} 4' in text
+    assert 'imap_events_total{event="retries"} 2' in text
+    assert [p.name for p in path.parent.iterdir()] == ['imap.prom']
+
+
+def test_range_fetch_writes_metrics_into_processing_stats(monkeypatch, tmp_path):
+    """📊 Загрузка за период кладет метрики всех команд пула в processing_stats_*.json"""
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({num: (1 + num % 2, make_message(num, 1 + num % 2)) for num in range(1, 7)})
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    monkeypatch.setattr(fetcher_module, "METRICS_TEXTFILE", str(tmp_path / 'imap.prom'))
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 2
+
+    fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 2))
+
+    stats = json.loads((fetcher.logs_dir / 'processing_stats_20250901_20250902.json').read_text(encoding='utf-8'))
+    metrics = stats['imap_metrics']
+    commands = metrics['commands']
+    assert commands['LOGIN']['count'] == len(FakeIMAP.sessions)
+    assert commands['SEARCH']['count'] >= 1
+    assert commands['FETCH METADATA']['count'] == 1
+    assert commands['FETCH RFC822']['count'] == 6 and commands['FETCH RFC822']['bytes_in'] > 6 * 500
+    assert commands['NOOP']['count'] == 6
+    assert metrics['stages']['process_message']['count'] == 6
+    assert metrics['events']['timeouts'] == 0
+    assert 'imap_command_duration_seconds_count{command="FETCH RFC822"} 6' in (tmp_path / 'imap.prom').read_text(encoding='utf-8')
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты пула IMAP-сессий и параллельной загрузки по дням
+"""
+
+import os
+import sys
+import imaplib
+import logging
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.advanced_email_fetcher as fetcher_module
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2, ImapConnectionPool
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+@pytest.fixture
+def fake_mailbox(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    messages = {}
+    num = 1
+    for day in (1, 2, 3):
+        for _ in range(4):
+            messages[num] = (day, make_message(num, day))
+            num += 1
+    FakeIMAP.reset(messages)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    monkeypatch.setattr(fetcher_module, "WORKER_CHUNK_SIZE", 2)
+    return FakeIMAP
+
+
+def test_pool_spreads_work_and_merges_stats(fake_mailbox):
+    """🏊 Письма трех дней обработаны на трех сессиях, статистика сведена в основной парсер"""
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 3
+
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    assert len(fake_mailbox.sessions) == 3
+    assert len(emails) == 12
+    assert fetcher.stats['processed'] == 12
+    assert fetcher.stats['saved'] == 12
+
+    saved_files = sorted(p.name for p in (fetcher.emails_dir / '2025-09-02').glob('email_*.json'))
+    assert [name[:9] for name in saved_files] == ['email_001', 'email_002', 'email_003', 'email_004']
+
+
+def test_single_session_pool_uses_fetcher_itself(fake_mailbox):
+    """1️⃣ Пул из одной сессии работает на самом парсере без копий"""
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    pool = ImapConnectionPool(fetcher, 1)
+
+    assert pool.open()
+    assert pool.workers == [fetcher]
+    pool.close()
+
+
+def test_date_range_uses_single_search_and_buckets_by_local_date(fake_mailbox):
+    """📅 Один UID SEARCH SINCE/BEFORE на период, письма разложены по дням UTC+7 из заголовка Date"""
+    late = make_message(13, 3).replace(b'Mon, 03 Sep 2025 10:00:00 +0700', b'Wed, 03 Sep 2025 19:30:00 +0000')
+    fake_mailbox.messages[13] = (3, late)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 2
+
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    searches = [c for c in fake_mailbox.commands if c[0].endswith('SEARCH')]
+    assert searches == [('UID SEARCH', '(SINCE "01-Sep-2025" BEFORE "04-Sep-2025")')]
+    assert len(emails) == 13
+    for day in ('2025-09-01', '2025-09-02', '2025-09-03'):
+        saved = sorted(p.name[:9] for p in (fetcher.emails_dir / day).glob('email_*.json'))
+        assert saved == ['email_001', 'email_002', 'email_003', 'email_004']
+    assert [p.name[:9] for p in (fetcher.emails_dir / '2025-09-04').glob('email_*.json')] == ['email_001']
+
+
+def test_expunge_between_search_and_fetch_keeps_bodies_matched(fake_mailbox, monkeypatch):
+    """🆔 EXPUNGE после поиска не сдвигает письма: заголовки и тела загружаются по одним UID"""
+    original = AdvancedEmailFetcherV2.scan_range
+
+    def scan_then_expunge(fetcher, *args, **kwargs):
+        result = original(fetcher, *args, **kwargs)
+        del fake_mailbox.messages[1]  # другой клиент удалил первое письмо папки
+        return result
+
+    monkeypatch.setattr(AdvancedEmailFetcherV2, "scan_range", scan_then_expunge)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 2
+
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    assert sorted(email['uid'] for email in emails) == list(range(2, 13))
+    for email in emails:
+        assert email['message_id'] == f"<msg{email['uid']}@partner.ru>"
+        assert f"request number {email['uid']} " in email['body']
+    assert fetcher.use_uid is False
+
+
+def test_large_emails_go_to_bounded_lane(fake_mailbox, monkeypatch):
+    """🐘 Большие письма идут отдельной полосой с длинным дедлайном, нумерация дня не меняется"""
+    fake_mailbox.messages[2] = (1, make_message(2, 1) + b"Attached scan data.\r\n" * 500)
+    fake_mailbox.messages[7] = (2, make_message(7, 2) + b"Attached scan data.\r\n" * 500)
+    monkeypatch.setattr(fetcher_module, "LARGE_EMAIL_SIZE", 5000)
+
+    lanes = {}
+    original = AdvancedEmailFetcherV2.process_single_email
+
+    def spy(worker, msg_id, *args, **kwargs):
+        lanes[msg_id] = worker.large_lane
+        return original(worker, msg_id, *args, **kwargs)
+
+    monkeypatch.setattr(AdvancedEmailFetcherV2, "process_single_email", spy)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 3
+
+    emails = fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    assert len(emails) == 12
+    assert sorted(msg_id for msg_id, large in lanes.items() if large) == [b'2', b'7']
+    assert fetcher.lane_stats['large']['messages'] == 2 and fetcher.lane_stats['large']['saved'] == 2
+    assert fetcher.lane_stats['fast']['messages'] == 10
+    assert fetcher.lane_stats['large']['bytes'] > 2 * 5000
+    assert fetcher.large_lane is False
+
+    day_one = sorted((fetcher.emails_dir / '2025-09-01').glob('email_*.json'))
+    assert [p.name[:9] for p in day_one] == ['email_001', 'email_002', 'email_003', 'email_004']
+    assert '<msg2@partner.ru>' in day_one[1].read_text(encoding='utf-8')
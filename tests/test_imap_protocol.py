@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты разбора ответов IMAP и пакетной загрузки метаданных
+"""
+
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.imap_protocol import parse_fetch_response, parse_list, parse_bodystructure, find_item, format_imap_value
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+
+
+HEADERS_1 = b"From: Ivan <ivan@example.com>\r\nSubject: Test 1\r\nMessage-ID: <1@example.com>\r\n\r\n"
+HEADERS_2 = b"From: news@shop.ru\r\nSubject: Sale\r\nMessage-ID: <2@shop.ru>\r\n\r\n"
+
+# Так imaplib возвращает ответ на FETCH нескольких писем с литералами
+BATCH_RESPONSE = [
+    (b'1 (UID 101 RFC822.SIZE 2048 BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL) '
+     b'BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}' % len(HEADERS_1), HEADERS_1),
+    b')',
+    (b'2 (UID 102 BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}' % len(HEADERS_2), HEADERS_2),
+    b' RFC822.SIZE 30000000 BODYSTRUCTURE ("APPLICATION" "ZIP" NIL NIL NIL "BASE64" 29000000 NIL NIL NIL NIL))',
+]
+
+
+def test_parse_fetch_response_with_literals():
+    """📨 Литералы и элементы после них попадают в запись своего письма"""
+    records = parse_fetch_response(BATCH_RESPONSE)
+
+    assert [r['SEQ'] for r in records] == ['1', '2']
+    assert records[0]['UID'] == '101'
+    assert find_item(records[0], 'BODY[HEADER') == HEADERS_1
+    assert records[1]['RFC822.SIZE'] == '30000000'
+    assert records[1]['BODYSTRUCTURE'][0] == 'APPLICATION'
+
+
+def test_parse_list_nil_and_quotes():
+    """📋 NIL превращается в None, экранирование в кавычках сохраняется"""
+    values = parse_list([b'("a \\"b\\"" NIL (1 2))'])
+    assert values == [['a "b"', None, ['1', '2']]]
+    assert format_imap_value(values[0]) == '("a \\"b\\"" NIL (1 2))'
+
+
+def test_fetch_metadata_batch_single_round_trip(monkeypatch, tmp_path):
+    """📦 Метаданные двух писем получены одним FETCH"""
+    monkeypatch.chdir(tmp_path)
+
+    class FakeMail:
+        def __init__(self):
+            self.calls = []
+
+        def fetch(self, msg_set, items):
+            self.calls.append((msg_set, items))
+            return 'OK', BATCH_RESPONSE
+
+    logger = logging.getLogger("TestLogger")
+    fetcher = AdvancedEmailFetcherV2(logger)
+    fetcher.mail = FakeMail()
+
+    metadata = fetcher.fetch_metadata_batch([b'1', b'2'])
+
+    assert len(fetcher.mail.calls) == 1
+    assert fetcher.mail.calls[0][0] == '1,2'
+    assert metadata[b'1']['uid'] == 101
+    assert metadata[b'1']['size'] == 2048
+    assert metadata[b'1']['headers']['Subject'] == 'Test 1'
+    assert metadata[b'2']['headers']['From'] == 'news@shop.ru'
+    assert fetcher.detect_large_attachments_from_structure(metadata[b'2']['structure'])
+
+
+def test_parse_bodystructure_sections_and_filenames():
+    """🌳 Вложенные multipart нумеруются через точку, имя файла берется из disposition (RFC 2231)"""
+    structure = parse_list([
+        b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 120 3 NIL NIL NIL NIL)'
+        b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 400 8 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "a") NIL NIL NIL)'
+        b'("APPLICATION" "PDF" ("NAME" "price.pdf") NIL NIL "BASE64" 2048 NIL ("ATTACHMENT" ("FILENAME*" "utf-8\'\'%D0%9F%D1%80%D0%B0%D0%B9%D1%81.pdf")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "b") NIL NIL NIL)'
+    ])[0]
+
+    parts = parse_bodystructure(structure)
+
+    assert [p.section for p in parts] == ['1.1', '1.2', '2']
+    assert [p.mime_type for p in parts] == ['text/plain', 'text/html', 'application/pdf']
+    assert parts[1].encoding == 'quoted-printable'
+    assert parts[2].disposition == 'attachment'
+    assert parts[2].size == 2048
+    assert parts[2].filename == 'Прайс.pdf'
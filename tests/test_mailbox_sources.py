@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты нескольких учетных записей и папок: конфигурация, чекпоинты и метки источника
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.imap_protocol import encode_mailbox_name
+from src.mailbox_sources import MailboxSource, load_mailbox_sources, parse_mailbox_sources
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+class FolderIMAP(FakeIMAP):
+    """📬 Поддельный сервер с несколькими папками: SELECT выбирает набор писем и UIDVALIDITY"""
+    folders = {}
+    logins = []
+
+    @classmethod
+    def reset_folders(cls, folders):
+        cls.reset()
+        cls.folders = folders
+        cls.logins = []
+
+    def login(self, user, _password):
+        with FakeIMAP.lock:
+            FolderIMAP.logins.append(user)
+        return 'OK', []
+
+    def select(self, mailbox, *_args, **_kwargs):
+        self._log('SELECT', mailbox)
+        self.uidvalidity, self.messages = self.folders[mailbox]
+        return super().select()
+
+
+def test_config_expands_folders_with_env_fallback(monkeypatch, tmp_path):
+    """📋 Папки учетной записи - отдельные источники; пропущенные поля и пароль берутся из окружения"""
+    monkeypatch.setenv('IMAP_SERVER', 'imap.test')
+    monkeypatch.setenv('IMAP_USER', 'me@test')
+    monkeypatch.setenv('SUPPORT_PASSWORD', 'secret')
+    config = {"accounts": [
+        {"name": "main", "folders": ["INBOX", "INBOX/Заявки"], "max_connections": 4},
+        {"name": "support", "user": "support@test", "password_env": "SUPPORT_PASSWORD", "starttls": False},
+        {"name": "old", "user": "old@test", "enabled": False},
+    ]}
+    sources = parse_mailbox_sources(config, max_connections=2)
+    assert [source.key for source in sources] == [
+        'me@test@imap.test/INBOX', 'me@test@imap.test/INBOX/Заявки', 'support@test@imap.test/INBOX']
+    assert sources[0].max_connections == 4 and sources[2].max_connections == 2
+    assert sources[2].password == 'secret' and sources[2].starttls is False
+
+    with pytest.raises(ValueError):
+        parse_mailbox_sources({"accounts": [{"folders": ["INBOX", "INBOX"]}]})
+
+    default, = load_mailbox_sources(tmp_path / 'missing.json')
+    assert default.key == 'me@test@imap.test/INBOX'
+
+    assert encode_mailbox_name('INBOX/Заявки') == 'INBOX/&BBcEMARPBDIEOgQ4-'
+    assert encode_mailbox_name('Sent Items') == '"Sent Items"'
+    assert encode_mailbox_name('R&D') == 'R&-D'
+
+
+def test_folders_sync_with_own_checkpoints_and_tags(monkeypatch, tmp_path):
+    """🔄 Каждая папка синхронизируется со своим чекпоинтом, письма помечены источником, итог общий"""
+    monkeypatch.chdir(tmp_path)
+    requests_folder = encode_mailbox_name('INBOX/Заявки')
+    FolderIMAP.reset_folders({
+        'INBOX': (10, {1: (1, make_message(1, 1)), 2: (2, make_message(2, 2))}),
+        requests_folder: (20, {5: (1, make_message(5, 1))}),
+    })
+    monkeypatch.setattr(imaplib, "IMAP4", FolderIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    sources = [MailboxSource('main', 'imap.test', 143, 'me@test', 'pw', folder, max_connections=2)
+               for folder in ('INBOX', 'INBOX/Заявки')]
+
+    emails = fetcher.fetch_from_sources(sources, lambda worker: worker.sync_new_emails())
+    assert sorted((email['folder'], email['message_id']) for email in emails) == [
+        ('INBOX', '<msg1@partner.ru>'), ('INBOX', '<msg2@partner.ru>'), ('INBOX/Заявки', '<msg5@partner.ru>')]
+    assert {email['account'] for email in emails} == {'main'}
+    assert fetcher.stats['saved'] == 3
+    assert ('SELECT', requests_folder) in FakeIMAP.commands
+    assert set(FolderIMAP.logins) == {'me@test'}
+
+    state = fetcher.load_sync_state()
+    inbox_state, requests_state = state['me@test@imap.test/INBOX'], state['me@test@imap.test/INBOX/Заявки']
+    assert (inbox_state['uidvalidity'], inbox_state['last_uid']) == (10, 2)
+    assert (requests_state['uidvalidity'], requests_state['last_uid']) == (20, 5)
+    # Полосы и метрики IMAP у каждой папки свои, общие - их сумма
+    per_source = [json.loads(path.read_text(encoding='utf-8'))
+                  for path in fetcher.logs_dir.glob('processing_stats_*_main_*.json')]
+    assert sorted(report['lanes']['fast']['messages'] for report in per_source) == [1, 2]
+    assert fetcher.lane_stats['fast']['messages'] == 3
+    assert sum(report['imap_metrics']['commands']['SELECT']['count'] for report in per_source) == \
+        fetcher.imap_metrics.to_dict()['commands']['SELECT']['count']
+
+    saved = json.loads(next((fetcher.emails_dir / '2025-09-01').glob('email_*.json')).read_text(encoding='utf-8'))
+    assert saved['account'] == 'main' and saved['folder'] in ('INBOX', 'INBOX/Заявки')
+
+    # Повтор берет из очереди только письма своей папки: чужой UID указывал бы на другое письмо
+    inbox, requests = (fetcher.for_source(source) for source in sources)
+    inbox.retry_queue.enqueue(inbox.queue_mailbox(), 10, 7, '7', '2025-09-01', 'timeout', uid_mode=True)
+    requests.retry_queue.enqueue(requests.queue_mailbox(), 20, 7, '7', '2025-09-01', 'timeout', uid_mode=True)
+    leased = requests.retry_queue.lease('test', mailbox=requests.queue_mailbox())
+    assert [item['uidvalidity'] for item in leased] == [20]
+
+
+def test_vanished_uid_marks_only_its_own_folder(monkeypatch, tmp_path):
+    """🗑️ Папки делят индекс писем: удаление UID 1 в INBOX не задевает UID 1 другой папки"""
+    monkeypatch.chdir(tmp_path)
+    archive_folder = encode_mailbox_name('Archive')
+    FolderIMAP.reset_folders({
+        'INBOX': (10, {1: (1, make_message(1, 1))}),
+        archive_folder: (10, {1: (1, make_message(5, 1))}),
+    })
+    monkeypatch.setattr(imaplib, "IMAP4", FolderIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    sources = [MailboxSource('main', 'imap.test', 143, 'me@test', 'pw', folder) for folder in ('INBOX', 'Archive')]
+
+    assert len(fetcher.fetch_from_sources(sources, lambda worker: worker.sync_new_emails())) == 2
+    inbox_entry = fetcher.message_index.get('<msg1@partner.ru>')
+    assert (inbox_entry['uid'], inbox_entry['mailbox'], inbox_entry['uidvalidity']) == (1, sources[0].key, 10)
+
+    inbox = fetcher.for_source(sources[0])
+    inbox.mark_vanished([1], 10)
+    assert inbox.stats['vanished'] == 1
+    assert fetcher.message_index.get('<msg1@partner.ru>')['removed_at'] is not None
+    assert fetcher.message_index.get('<msg5@partner.ru>')['removed_at'] is None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты индекса Message-ID и проверки дубликатов без перебора файлов
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.message_index import MessageIndex
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+
+
+def write_email(emails_dir, date_folder, num, message_id, body, attachments):
+    folder = emails_dir / date_folder
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"email_{num:03d}_{date_folder.replace('-', '')}_thread.json"
+    path.write_text(json.dumps({
+        "message_id": message_id,
+        "body": body,
+        "attachments": attachments,
+        "date_folder": date_folder,
+    }, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def test_rebuild_from_existing_tree(tmp_path):
+    """🔄 Индекс пересобирается из data/emails/ и отвечает по Message-ID"""
+    emails_dir = tmp_path / 'emails'
+    attachment = tmp_path / 'price.pdf'
+    attachment.write_bytes(b'%PDF')
+    path = write_email(emails_dir, '2025-09-01', 1, '<a@x.ru>', 'Текст письма', [{"file_path": str(attachment)}])
+    write_email(emails_dir, '2025-09-02', 1, '<b@x.ru>', '', [])
+
+    index = MessageIndex(tmp_path / 'index.db')
+    assert index.is_new
+    assert index.rebuild(emails_dir) == 2
+
+    entry = index.get('<a@x.ru>')
+    assert entry['email_path'] == str(path)
+    assert entry['has_body'] is True
+    assert entry['attachment_paths'] == [str(attachment)]
+    assert index.get('<b@x.ru>')['has_body'] is False
+    assert index.get('<missing@x.ru>') is None
+
+
+def test_fetcher_duplicate_check_uses_index(monkeypatch, tmp_path):
+    """📁 Проверка дубликата берет данные из индекса, который собран при запуске"""
+    monkeypatch.chdir(tmp_path)
+    attachment = tmp_path / 'data' / 'attachments' / '2025-09-01' / 'x_attach_price.pdf'
+    attachment.parent.mkdir(parents=True)
+    attachment.write_bytes(b'%PDF')
+    write_email(tmp_path / 'data' / 'emails', '2025-09-01', 1, '<a@x.ru>', 'Текст',
+                [{"file_path": str(attachment)}])
+
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+
+    assert fetcher.message_index.count() == 1
+    assert fetcher.check_email_already_saved('<a@x.ru>', '2025-09-01')['all_exist'] is True
+
+    attachment.unlink()
+    check = fetcher.check_email_already_saved('<a@x.ru>', '2025-09-01')
+    assert check['email_exists'] and not check['attachments_exist']
+    assert fetcher.check_email_already_saved('<new@x.ru>', '2025-09-01')['email_exists'] is False
+
+
+def test_mark_removed_is_scoped_to_mailbox_and_uidvalidity(tmp_path):
+    """🗑️ UID отмечается удаленным только в своей папке и эпохе; старый индекс дополняется колонками"""
+    db_path = tmp_path / 'index.db'
+    legacy = sqlite3.connect(str(db_path))
+    legacy.execute("CREATE TABLE messages (message_id TEXT PRIMARY KEY, date_folder TEXT, email_path TEXT NOT NULL, "
+                   "has_body INTEGER NOT NULL DEFAULT 0, attachment_paths TEXT NOT NULL DEFAULT '[]', "
+                   "uid INTEGER, updated_at TEXT)")
+    legacy.execute("INSERT INTO messages (message_id, email_path, uid) VALUES ('<old@x.ru>', 'old.json', 7)")
+    legacy.commit()
+    legacy.close()
+
+    index = MessageIndex(db_path)
+    index.upsert('<inbox@x.ru>', 'a.json', '2025-09-01', True, [], uid=7, mailbox='me@imap/INBOX', uidvalidity=10)
+    index.upsert('<sent@x.ru>', 'b.json', '2025-09-01', True, [], uid=7, mailbox='me@imap/Sent', uidvalidity=10)
+
+    assert index.mark_removed('me@imap/INBOX', 11, [7]) == []
+    assert index.mark_removed('me@imap/INBOX', 10, [7]) == ['<inbox@x.ru>']
+    assert index.get('<sent@x.ru>')['removed_at'] is None
+    assert index.get('<old@x.ru>')['removed_at'] is None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты однопроходного обхода MIME-дерева
+"""
+
+import os
+import sys
+import email
+import email.message
+from collections import Counter
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.mime_walker import walk_message, html_to_text
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def build_message() -> email.message.Message:
+    msg = MIMEMultipart('mixed')
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText('Добрый день! Прошу выставить счет на реагенты.', 'plain', 'utf-8'))
+    alternative.attach(MIMEText('<html><body><p>Добрый&nbsp;день!</p><b>Прошу выставить счет</b></body></html>', 'html', 'utf-8'))
+    msg.attach(alternative)
+
+    logo = MIMEImage(PNG, 'png')
+    logo.add_header('Content-Disposition', 'inline', filename='logo.png')
+    msg.attach(logo)
+    photo = MIMEImage(PNG, 'png')
+    photo.set_param('name', 'photo.png')
+    photo.replace_header('Content-Type', 'image/png; name="photo.png"')
+    msg.attach(photo)
+    pdf = MIMEApplication(b'%PDF-1.4 price list', _subtype='pdf')
+    pdf.add_header('Content-Disposition', 'attachment', filename='price.pdf')
+    msg.attach(pdf)
+    notes = MIMEText('Текст во вложении не должен попасть в тело письма', 'plain', 'utf-8')
+    notes.add_header('Content-Disposition', 'attachment', filename='notes.txt')
+    msg.attach(notes)
+    return email.message_from_bytes(msg.as_bytes())
+
+
+def test_single_pass_classifies_parts_and_decodes_once(monkeypatch):
+    """🌳 Тело, встроенные картинки и вложения за один проход; каждая часть декодируется не больше раза"""
+    msg = build_message()
+    decoded = Counter()
+    original = email.message.Message.get_payload
+
+    def counting_get_payload(part, *args, **kwargs):
+        if kwargs.get('decode') or (len(args) > 1 and args[1]):
+            decoded[id(part)] += 1
+        return original(part, *args, **kwargs)
+
+    monkeypatch.setattr(email.message.Message, 'get_payload', counting_get_payload)
+    walk = walk_message(msg)
+
+    assert walk.body_text == ('Добрый день! Прошу выставить счет на реагенты.\n'
+                              'Добрый день!Прошу выставить счет')
+    assert [part.get_filename() for part in walk.attachments] == ['photo.png', 'price.pdf', 'notes.txt']
+    assert [part.get_filename() for part in walk.inline_images] == ['logo.png']
+    assert decoded and max(decoded.values()) == 1
+    assert len(decoded) == 2  # только текстовые части тела; вложения декодирует AttachmentStore
+
+
+def test_markup_only_html_falls_back_to_raw_text():
+    """🧹 HTML без текста дает пустое тело и запасной сырой текст; письмо из одной части - всегда тело"""
+    msg = MIMEMultipart('alternative')
+    msg.attach(MIMEText('<html><body><img src="cid:banner"><br/><br/></body></html>', 'html', 'utf-8'))
+    walk = walk_message(email.message_from_bytes(msg.as_bytes()))
+    assert walk.body_text == ''
+    assert walk.fallback_text.startswith('<html><body><img')
+    assert walk.attachments == [] and walk.inline_images == []
+
+    single = MIMEText('Однострочное письмо без вложений, но с текстом', 'plain', 'utf-8')
+    single.add_header('Content-Disposition', 'attachment', filename='body.txt')
+    walk = walk_message(email.message_from_bytes(single.as_bytes()))
+    assert walk.body_text == 'Однострочное письмо без вложений, но с текстом'
+    assert walk.attachments == []
+
+    assert html_to_text('<p>A&amp;B</p>') == 'A B'
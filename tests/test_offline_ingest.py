@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты офлайн-загрузки из mbox / Maildir / .eml
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+from datetime import datetime
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.offline_ingest import ingest_offline, scan_source, read_message, detect_source_format
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def make_attachment_message(num: int, day: int) -> bytes:
+    msg = MIMEMultipart()
+    msg['From'] = f"Supplier {num} <sales{num}@supplier.ru>"
+    msg['To'] = 'me@dna-technology.ru'
+    msg['Subject'] = f"Price list {num}"
+    msg['Date'] = f"Mon, {day:02d} Sep 2025 12:00:00 +0700"
+    msg['Message-ID'] = f"<msg{num}@supplier.ru>"
+    msg.attach(MIMEText("Please find the price list attached.\n" * 20, 'plain', 'utf-8'))
+    pdf = MIMEApplication(b'%PDF-1.4 price list ' * 200 + str(num).encode(), _subtype='pdf')
+    pdf.add_header('Content-Disposition', 'attachment', filename=f'price_{num}.pdf')
+    msg.attach(pdf)
+    return msg.as_bytes().replace(b'\n', b'\r\n')
+
+
+@pytest.fixture
+def corpus():
+    messages = {}
+    num = 1
+    for day in (1, 2, 3):
+        for _ in range(3):
+            messages[num] = (day, make_message(num, day))
+            num += 1
+        messages[num] = (day, make_attachment_message(num, day))
+        num += 1
+    return messages
+
+
+def write_mbox(path, raws):
+    with open(path, 'wb') as f:
+        for raw in raws:
+            f.write(b'From sender@example.com Mon Sep  1 10:00:00 2025\n')
+            f.write(raw.replace(b'\r\n', b'\n') + b'\n')
+
+
+def saved_tree(root):
+    files = {}
+    for path in sorted((root / 'data' / 'emails').glob('*/email_*.json')):
+        data = json.loads(path.read_text(encoding='utf-8'))
+        files[f"{path.parent.name}/{path.name}"] = (
+            data['message_id'], data['subject'], data['body'], data['raw_size'],
+            [(att['original_filename'], att.get('sha256'), att['status']) for att in data['attachments']]
+        )
+    return files
+
+
+def test_mbox_ingest_matches_imap_output(corpus, monkeypatch, tmp_path):
+    """📼 Архив mbox в пуле процессов дает те же файлы писем и вложения, что загрузка по IMAP"""
+    FakeIMAP.reset(corpus)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    (tmp_path / 'imap').mkdir()
+    monkeypatch.chdir(tmp_path / 'imap')
+    imap_fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    imap_fetcher.pool_size = 1
+    imap_fetcher.fetch_emails_by_date_range(datetime(2025, 9, 1), datetime(2025, 9, 3))
+
+    write_mbox(tmp_path / 'archive.mbox', [raw for _day, raw in corpus.values()])
+    (tmp_path / 'offline').mkdir()
+    monkeypatch.chdir(tmp_path / 'offline')
+    offline_fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    saved = ingest_offline(offline_fetcher, tmp_path / 'archive.mbox', processes=2)
+
+    assert saved == len(corpus) == offline_fetcher.stats['saved']
+    assert saved_tree(tmp_path / 'offline') == saved_tree(tmp_path / 'imap')
+    assert offline_fetcher.stats['saved_attachments'] == imap_fetcher.stats['saved_attachments'] == 3
+    blobs = sorted(p.name for p in (tmp_path / 'offline' / 'data' / 'attachments' / 'blobs').rglob('*.pdf'))
+    assert blobs == sorted(p.name for p in (tmp_path / 'imap' / 'data' / 'attachments' / 'blobs').rglob('*.pdf'))
+
+
+def test_maildir_and_eml_sources_and_duplicates(corpus, monkeypatch, tmp_path):
+    """📂 Maildir и папка .eml читаются так же, как mbox; повтор Message-ID сохраняется один раз"""
+    raws = [raw for _day, raw in corpus.values()]
+    write_mbox(tmp_path / 'archive.mbox', raws)
+    for sub in ('cur', 'new', 'tmp'):
+        (tmp_path / 'Maildir' / sub).mkdir(parents=True)
+    (tmp_path / 'eml' / 'nested').mkdir(parents=True)
+    for i, raw in enumerate(raws):
+        (tmp_path / 'Maildir' / 'cur' / f'{1700000000 + i}.M{i}.host:2,S').write_bytes(raw)
+        (tmp_path / 'eml' / ('nested' if i % 2 else '') / f'{i:03d}.eml').write_bytes(raw.replace(b'\r\n', b'\n'))
+
+    assert [detect_source_format(tmp_path / name) for name in ('archive.mbox', 'Maildir', 'eml')] == ['mbox', 'maildir', 'eml']
+    mbox_raws = [read_message(ref) for ref in scan_source(tmp_path / 'archive.mbox')]
+    assert mbox_raws == raws
+    assert [read_message(ref) for ref in scan_source(tmp_path / 'Maildir')] == raws
+    assert sorted(read_message(ref) for ref in scan_source(tmp_path / 'eml')) == sorted(raws)
+
+    (tmp_path / 'eml' / 'copy.eml').write_bytes(raws[0])
+    (tmp_path / 'work').mkdir()
+    monkeypatch.chdir(tmp_path / 'work')
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    assert ingest_offline(fetcher, tmp_path / 'eml', processes=1) == len(raws)
+    assert fetcher.stats['already_exists'] == 1
+    assert len(list((tmp_path / 'work' / 'data' / 'emails').glob('*/email_*.json'))) == len(raws)
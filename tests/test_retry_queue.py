@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты очереди повторной обработки (SQLite) и ее использования парсером
+"""
+
+import os
+import sys
+import json
+import time
+import imaplib
+import logging
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.retry_queue import RetryQueue, RETRY_BACKOFF_BASE
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def test_backoff_dead_letter_and_concurrent_leases(tmp_path):
+    """🔒 Аренда не выдает элемент дважды, неудачи дают паузу и в итоге мертвую очередь"""
+    queue = RetryQueue(tmp_path / 'retry.db')
+    for uid in range(1, 21):
+        queue.enqueue('INBOX', 7, uid, str(uid), '2025-09-01', 'failed_to_fetch', uid_mode=True)
+
+    leased = []
+    def worker(name):
+        leased.extend(item['item_key'] for item in queue.lease(name, limit=4))
+    threads = [threading.Thread(target=worker, args=(f'w{i}',)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(leased) == sorted(f'INBOX/7/{uid}' for uid in range(1, 21))
+    assert queue.lease('late') == []
+
+    key = 'INBOX/7/1'
+    assert queue.fail(key) == 'pending'
+    item = queue.get(key)
+    assert item['attempts'] == 2 and item['next_eligible'] >= time.time() + RETRY_BACKOFF_BASE - 5
+    assert key not in [i['item_key'] for i in queue.lease('again')]
+    assert queue.enqueue('INBOX', 7, 1, '1', '2025-09-01', 'parsing_error_ValueError', uid_mode=True)['state'] == 'dead'
+    assert [i['item_key'] for i in queue.dead_letters()] == [key]
+    assert queue.count() == 19
+
+
+def test_fetcher_queue_keyed_by_uid_and_legacy_import(monkeypatch, tmp_path):
+    """🔑 Парсер пишет ключ UIDVALIDITY/UID, старые JSON-очереди переносятся при запуске"""
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    (data_dir / 'skipped_emails.json').write_text(json.dumps({
+        '42': {'date': '2025-09-01', 'reason': 'failed_to_fetch', 'attempts': 1, 'uid_mode': True}
+    }), encoding='utf-8')
+    (data_dir / 'dead_letter_emails.json').write_text(json.dumps({
+        '7': {'reason': 'исчерпаны попытки', 'moved_at': '2025-09-01T10:00:00+07:00'}
+    }), encoding='utf-8')
+    FakeIMAP.reset({3: (1, make_message(3, 1)), 5: (1, make_message(5, 1))}, uidvalidity=99)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    assert not (data_dir / 'skipped_emails.json').exists()
+    assert fetcher.retry_queue.get('INBOX/0/42')['attempts'] == 1
+    assert list(fetcher.list_dead_letters()) == ['INBOX/seq/7']
+
+    fetcher.connect()
+    fetcher.save_skipped_email(b'2', '2025-09-01', 'failed_to_fetch', uid=5)
+    assert fetcher.retry_queue.get('INBOX/99/5')['msg_id'] == '2'
+
+    fetcher.retry_skipped_emails()
+    assert fetcher.retry_queue.get('INBOX/99/5') is None
+    assert list((fetcher.emails_dir / '2025-09-01').glob('email_*.json'))
+    assert fetcher.retry_queue.get('INBOX/0/42')['attempts'] == 2
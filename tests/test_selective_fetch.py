@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты выборочной загрузки частей письма по BODYSTRUCTURE
+"""
+
+import os
+import sys
+import imaplib
+import logging
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def make_multipart_message() -> bytes:
+    """✉️ Письмо с текстом, PDF и презентацией (которая исключается по расширению)"""
+    msg = MIMEMultipart()
+    msg['From'] = 'Client <client@partner.ru>'
+    msg['To'] = 'me@dna-technology.ru'
+    msg['Subject'] = 'Прайс и презентация'
+    msg['Date'] = 'Mon, 01 Sep 2025 10:00:00 +0700'
+    msg['Message-ID'] = '<multi@partner.ru>'
+    msg.attach(MIMEText('Добрый день! Высылаем прайс на реагенты.\n' * 5, 'plain', 'utf-8'))
+
+    pdf = MIMEApplication(b'%PDF-1.4 price ' * 200, _subtype='pdf')
+    pdf.add_header('Content-Disposition', 'attachment', filename='price.pdf')
+    msg.attach(pdf)
+
+    pptx = MIMEApplication(b'PK slides ' * 5000, _subtype='vnd.openxmlformats-officedocument.presentationml.presentation')
+    pptx.add_header('Content-Disposition', 'attachment', filename='company.pptx')
+    msg.attach(pptx)
+    return msg.as_bytes()
+
+
+@pytest.fixture
+def fetcher(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({
+        1: (1, make_multipart_message()),
+        2: (1, make_message(2, 1)),
+    })
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+    return fetcher
+
+
+def test_only_text_and_wanted_attachments_are_downloaded(fetcher):
+    """🎯 Скачиваются текст и PDF, презентация остается на сервере"""
+    emails = fetcher.sync_new_emails()
+
+    fetches = [c[1] for c in FakeIMAP.commands if c[0].endswith('FETCH')]
+    assert '(BODY.PEEK[1] BODY.PEEK[2])' in fetches
+    assert '(RFC822)' in fetches  # одночастное письмо грузится целиком, как раньше
+    assert fetches.count('(RFC822)') == 1
+
+    multi = next(e for e in emails if e['message_id'] == '<multi@partner.ru>')
+    assert 'Высылаем прайс' in multi['body']
+    statuses = {a['original_filename']: a['status'] for a in multi['attachments']}
+    assert statuses == {'price.pdf': 'saved', 'company.pptx': 'excluded'}
+
+    saved = next(a for a in multi['attachments'] if a['status'] == 'saved')
+    assert open(saved['file_path'], 'rb').read() == b'%PDF-1.4 price ' * 200
+    assert fetcher.stats['selective_fetches'] == 1
+    assert fetcher.stats['skipped_parts'] == 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты фильтрации черного списка и тем на стороне IMAP-сервера
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from src.filter_engine import build_search_exclusions
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+def test_search_exclusions_only_use_safe_rules():
+    """📡 На сервер уходят адреса в скобках и ASCII-темы, кириллица остается локальной"""
+    keys = build_search_exclusions(['webinar', 'вебинар', 'ab'],
+                                   ['boss@partner.ru', '*@spam.ru', 'info@*', '*'], max_length=1000)
+
+    assert keys == ['NOT FROM "@spam.ru>"', 'NOT FROM "<boss@partner.ru>"', 'NOT FROM "<info@"',
+                    'NOT SUBJECT "webinar"']
+    assert build_search_exclusions(['webinar'], ['*@spam.ru'], max_length=25) == ['NOT FROM "@spam.ru>"']
+
+
+@pytest.fixture
+def fetcher(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    config_dir = tmp_path / 'config'
+    config_dir.mkdir()
+    (config_dir / 'blacklist.txt').write_text('*@spam.ru\n', encoding='utf-8')
+    (config_dir / 'filters.txt').write_text('webinar\n', encoding='utf-8')
+
+    FakeIMAP.reset({
+        1: (1, make_message(1, 1)),
+        2: (1, make_message(2, 1, sender='Promo <promo@spam.ru>')),
+        3: (1, make_message(3, 1, subject='Free WEBINAR today')),
+        4: (2, make_message(4, 2, sender='noreply@spam.ru')),
+    }, uidvalidity=5)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+    return fetcher
+
+
+def test_blacklisted_mail_excluded_before_header_fetch(fetcher):
+    """🚫 Письма из черного списка не доходят до загрузки заголовков, чекпоинт их проходит"""
+    emails = fetcher.sync_new_emails()
+
+    assert [e['message_id'] for e in emails] == ['<msg1@partner.ru>']
+    assert fetcher.stats['filtered_server_side'] == 2
+    # Адрес без угловых скобок сервер не отсекает - его ловит локальная проверка
+    assert fetcher.stats['filtered_blacklist'] == 1
+
+    metadata_fetches = [c for c in FakeIMAP.commands if c[0] == 'UID FETCH' and 'HEADER.FIELDS' in c[1]]
+    assert len(metadata_fetches) == 1
+
+    state = json.loads(fetcher.sync_state_path.read_text(encoding='utf-8'))
+    assert state[fetcher.get_mailbox_key()]['last_uid'] == 4
+
+
+def test_rejected_criteria_fall_back_to_local_filters(fetcher, monkeypatch):
+    """⚠️ Если сервер отклонил критерии, фильтрация остается локальной"""
+    original = FakeIMAP._search
+
+    def strict_search(self, criteria, by_uid):
+        if 'NOT ' in criteria:
+            return 'BAD', [b'Unsupported search key']
+        return original(self, criteria, by_uid)
+
+    monkeypatch.setattr(FakeIMAP, '_search', strict_search)
+    emails = fetcher.sync_new_emails()
+
+    assert [e['message_id'] for e in emails] == ['<msg1@partner.ru>']
+    assert fetcher.stats['filtered_server_side'] == 0
+    assert fetcher.server_filters_enabled is False
+    assert fetcher.stats['filtered_blacklist'] + fetcher.stats['filtered_subject'] == 3
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 Тесты инкрементальной синхронизации по UID с чекпоинтами UIDVALIDITY
+"""
+
+import os
+import sys
+import json
+import imaplib
+import logging
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.advanced_email_fetcher import AdvancedEmailFetcherV2
+from tests.imap_fakes import FakeIMAP, make_message
+
+
+@pytest.fixture
+def fetcher(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    FakeIMAP.reset({
+        10: (1, make_message(10, 1)),
+        11: (1, make_message(11, 1)),
+        12: (2, make_message(12, 2)),
+    }, uidvalidity=777)
+    monkeypatch.setattr(imaplib, "IMAP4", FakeIMAP)
+    fetcher = AdvancedEmailFetcherV2(logging.getLogger("TestLogger"))
+    fetcher.pool_size = 1
+    return fetcher
+
+
+def test_first_sync_scans_all_and_saves_checkpoint(fetcher):
+    """📋 Первый запуск: полное сканирование и чекпоинт с последним UID"""
+    emails = fetcher.sync_new_emails()
+
+    assert len(emails) == 3
+    state = json.loads(fetcher.sync_state_path.read_text(encoding='utf-8'))
+    checkpoint = state[fetcher.get_mailbox_key()]
+    assert checkpoint['uidvalidity'] == 777
+    assert checkpoint['last_uid'] == 12
+    assert len(list((fetcher.emails_dir / '2025-09-01').glob('email_*.json'))) == 2
+
+
+def test_second_sync_fetches_only_new_uids(fetcher):
+    """🔄 Повторный запуск запрашивает только UID больше чекпоинта"""
+    fetcher.sync_new_emails()
+
+    FakeIMAP.messages[13] = (2, make_message(13, 2))
+    FakeIMAP.commands = []
+    emails = fetcher.sync_new_emails()
+
+    assert [e['message_id'] for e in emails] == ['<msg13@partner.ru>']
+    assert ('UID SEARCH', 'UID 13:*') in FakeIMAP.commands
+    names = sorted(p.name[:9] for p in (fetcher.emails_dir / '2025-09-02').glob('email_*.json'))
+    assert names == ['email_001', 'email_002']
+
+
+def test_no_new_mail_skips_search(fetcher):
+    """📭 Без новых писем поиск не выполняется"""
+    fetcher.sync_new_emails()
+    FakeIMAP.commands = []
+
+    assert fetcher.sync_new_emails() == []
+    assert not [c for c in FakeIMAP.commands if c[0].endswith('SEARCH')]
+
+
+def test_uidvalidity_change_triggers_rescan(fetcher):
+    """⚠️ Смена UIDVALIDITY приводит к полному пересканированию"""
+    fetcher.sync_new_emails()
+    FakeIMAP.uidvalidity = 778
+    FakeIMAP.commands = []
+
+    fetcher.sync_new_emails()
+
+    assert ('UID SEARCH', 'UID 1:*') in FakeIMAP.commands
+    state = json.loads(fetcher.sync_state_path.read_text(encoding='utf-8'))
+    assert state[fetcher.get_mailbox_key()]['uidvalidity'] == 778
+
+
+def test_failed_uid_is_retried_within_sync(fetcher, monkeypatch):
+    """🔁 Чекпоинт проходит письмо, ушедшее в очередь повторов, а сама синхронизация его догружает"""
+    outage = {'active': True}
+    original_fetch = FakeIMAP._fetch
+    original_retry = AdvancedEmailFetcherV2.retry_skipped_emails
+
+    def flaky_fetch(imap, msg_set, items, by_uid):
+        if msg_set in ('11', b'11') and 'HEADER.FIELDS' not in items and outage['active']:
+            return 'NO', [b'temporary failure']
+        return original_fetch(imap, msg_set, items, by_uid)
+
+    def retry_after_outage(worker):
+        outage['active'] = False
+        return original_retry(worker)
+
+    monkeypatch.setattr(FakeIMAP, "_fetch", flaky_fetch)
+    monkeypatch.setattr(AdvancedEmailFetcherV2, "retry_skipped_emails", retry_after_outage)
+    emails = fetcher.sync_new_emails()
+
+    assert sorted(e['message_id'] for e in emails) == ['<msg10@partner.ru>', '<msg12@partner.ru>']
+    assert fetcher.load_sync_state()[fetcher.get_mailbox_key()]['last_uid'] == 12
+    assert fetcher.retry_queue.count('pending') == 0
+    saved = [p.read_text(encoding='utf-8') for p in (fetcher.emails_dir / '2025-09-01').glob('email_*.json')]
+    assert any('<msg11@partner.ru>' in text for text in saved)